@@ -0,0 +1,289 @@
+"""Benchmarks of the PSyTricks client stack.
+
+Measures the decoding of PowerShell JSON, request round trips of the
+`ResTricksWrapper` against a local `psytricks.standin.StandInServer` (sequential
+and concurrent), the overhead of dumping responses and the memory used by the
+decoded machine records. No Citrix environment (nor network access) is needed.
+
+Run all benchmarks on the code of this working tree and compare the results
+against the stored baseline:
+
+```bash
+python benchmarks/run.py
+```
+
+The results are written to `benchmarks/results.json` (see `--output`), metrics
+being worse than the baseline by more than the threshold (default 20%) are
+reported and make the script exit with a non-zero status. After an intended
+change in performance (or on a different machine), refresh the baseline using
+`--save-baseline`. Use `--quick` for a fast (but noisy) run on smaller payloads,
+its results are only compared against a baseline saved with `--quick` as well.
+"""
+
+import argparse
+import concurrent.futures
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BASEDIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASEDIR.parent / "src"))
+
+# pylint: disable-msg=wrong-import-position
+from loguru import logger as log  # noqa: E402
+
+from psytricks import __version__  # noqa: E402
+from psytricks.decoder import decode_powershell_json, parse_powershell_json  # noqa
+from psytricks.standin import SAMPLEDATA, StandInServer, StandInState  # noqa: E402
+from psytricks.wrapper import ResTricksWrapper  # noqa: E402
+
+BASELINE = BASEDIR / "baseline.json"
+RESULTS = BASEDIR / "results.json"
+
+
+def synthetic_machines(count: int) -> list[dict]:
+    """Create raw machine records by cycling through the sample data.
+
+    Parameters
+    ----------
+    count : int
+        The number of records to create, each one with a unique `DNSName`.
+
+    Returns
+    -------
+    list(dict)
+    """
+    text = (SAMPLEDATA / "GetMachineStatus.json").read_text("cp850")
+    samples = json.loads(text)
+    machines = []
+    for i in range(count):
+        machine = dict(samples[i % len(samples)])
+        machine["DNSName"] = f"bench-vm-{i:06}.vdi.example.xy"
+        machines.append(machine)
+    return machines
+
+
+def envelope(records: list) -> str:
+    """Wrap records into a JSON document as returned by the ResTricks service."""
+    status = {"ExecutionStatus": "0", "ErrorMessage": "", "PSyTricksVersion": ""}
+    return json.dumps({"Status": status, "Data": records})
+
+
+def timed(func, repeat: int) -> list[float]:
+    """Call a function repeatedly, returning the durations in seconds."""
+    durations = []
+    for _ in range(repeat):
+        tstart = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - tstart)
+    return durations
+
+
+def metric(value: float, unit: str, lower_is_better: bool = True) -> dict:
+    """Assemble a result entry."""
+    return {"value": round(value, 4), "unit": unit, "lower_is_better": lower_is_better}
+
+
+def bench_decoding(quick: bool) -> dict:
+    """Decode small (sample data) and large (synthetic) payloads."""
+    results = {}
+    small = envelope(synthetic_machines(36))
+    large = envelope(synthetic_machines(10_000 if quick else 50_000))
+    for name, text, repeat in (("small", small, 1000), ("large", large, 5)):
+        repeat = max(3, repeat // 10) if quick else repeat
+        durations = timed(lambda t=text: decode_powershell_json(t), repeat)
+        results[f"decode_{name}"] = metric(statistics.median(durations) * 1000, "ms")
+        durations = timed(
+            lambda t=text: json.loads(t, object_hook=parse_powershell_json), repeat
+        )
+        results[f"object_hook_{name}"] = metric(
+            statistics.median(durations) * 1000, "ms"
+        )
+    return results
+
+
+def bench_memory(quick: bool) -> dict:
+    """Measure the memory held by decoded machine records."""
+    count = 10_000 if quick else 50_000
+    text = envelope(synthetic_machines(count))
+    gc.collect()
+    tracemalloc.start()
+    decoded = decode_powershell_json(text)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+    return {
+        "memory_per_1k_machines": metric(current / count * 1000 / 1024, "KiB"),
+        "peak_memory_per_1k_machines": metric(peak / count * 1000 / 1024, "KiB"),
+    }
+
+
+def bench_roundtrips(quick: bool) -> dict:
+    """Perform requests against a local stand-in server."""
+    results = {}
+    requests_count = 20 if quick else 100
+    machines = synthetic_machines(2_000)
+    state = StandInState(machines, [], [])
+
+    with StandInServer(port=0, state=state).start() as server:
+        wrapper = ResTricksWrapper(base_url=server.base_url)
+        # measure the full transfer, not the "304 Not Modified" responses:
+        wrapper.conditional_get = False
+        wrapper.get_machine_status()  # warm-up (connection, version check)
+
+        durations = timed(wrapper.get_machine_status, requests_count)
+        results["roundtrip_p50"] = metric(statistics.median(durations) * 1000, "ms")
+        results["roundtrip_p95"] = metric(
+            statistics.quantiles(durations, n=20)[-1] * 1000, "ms"
+        )
+
+        workers = 8
+        tstart = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(wrapper.get_machine_status)
+                for _ in range(requests_count * 2)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - tstart
+        results["concurrent_throughput"] = metric(
+            requests_count * 2 / elapsed, "req/s", lower_is_better=False
+        )
+
+        # time the dumping itself, the difference between two series of round
+        # trips would be dominated by their noise:
+        response = wrapper.session.get(
+            f"{server.base_url}GetMachineStatus", headers=wrapper.headers
+        )
+        dump = wrapper._write_response_dump  # pylint: disable-msg=protected-access
+        dumped = []
+        with tempfile.TemporaryDirectory() as dumpdir:
+            for i in range(requests_count):
+                # a separate directory per dump avoids name clashes (the file
+                # names only have a resolution of milliseconds):
+                target = Path(dumpdir) / str(i)
+                target.mkdir()
+                wrapper.dump_responses_to = target
+                dumped += timed(lambda: dump(response), 1)
+            wrapper.dump_responses_to = None
+        results["dump_overhead"] = metric(statistics.median(dumped) * 1000, "ms")
+
+        wrapper.close()
+
+    return results
+
+
+def git_revision() -> str:
+    """Get the (short) git revision of the working tree, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            cwd=BASEDIR,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Compare results against a baseline, returning the regressions found."""
+    regressions = []
+    print(f"\n{'metric':<30} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None or base["value"] <= 0:
+            print(f"{name:<30} {'-':>12} {current['value']:>12} {'(new)':>8}")
+            continue
+
+        change = current["value"] / base["value"] - 1
+        worse = change if current["lower_is_better"] else -change
+        flag = ""
+        if worse > threshold:
+            flag = "  <-- REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<30} {base['value']:>12} {current['value']:>12} "
+            f"{change:>+8.0%} {current['unit']}{flag}"
+        )
+    return regressions
+
+
+def main() -> int:
+    """Run the benchmarks, write the results and compare them to the baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--quick", action="store_true", help="fewer iterations")
+    parser.add_argument("--output", type=Path, default=RESULTS)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store results as baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown reported as regression (default: 0.2)",
+    )
+    args = parser.parse_args()
+
+    log.remove()
+    log.add(sys.stderr, level="ERROR")
+
+    results = {}
+    for bench in (bench_decoding, bench_memory, bench_roundtrips):
+        print(f"Running {bench.__name__}...")
+        results.update(bench(args.quick))
+
+    report = {
+        "meta": {
+            "psytricks": __version__,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "timestamp": int(time.time()),
+        },
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf8")
+    print(f"Results written to [{args.output}].")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n", encoding="utf8")
+        print(f"Baseline updated [{args.baseline}].")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline found at [{args.baseline}], use '--save-baseline'.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf8"))
+    if baseline["meta"].get("quick", False) != args.quick:
+        # the quick mode uses smaller payloads, so the numbers aren't comparable:
+        mode = "a quick" if baseline["meta"].get("quick") else "a full"
+        print(
+            f"Baseline [{args.baseline}] was recorded by {mode} run, not comparing"
+            " (use the same mode or '--save-baseline')."
+        )
+        return 0
+
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+        return 1
+
+    print("\nNo regressions found.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
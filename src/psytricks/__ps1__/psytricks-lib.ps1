@@ -50,17 +50,270 @@ $SessionProperties = @(
 
 
 
+#region filters
+
+# the filters supported by Get-MachineStatus / Get-Sessions, mapping the filter
+# name to the corresponding parameter of Get-BrokerMachine / Get-BrokerSession
+# (which is also the name of the property in the results):
+$MachineFilters = @{
+    "DesktopGroupName"  = "DesktopGroupName"
+    "DNSName"           = "DNSName"
+    "InMaintenanceMode" = "InMaintenanceMode"
+    "PowerState"        = "PowerState"
+    "SummaryState"      = "SummaryState"
+    "UserName"          = "SessionUserName"
+}
+
+$SessionFilters = @{
+    "DesktopGroupName" = "DesktopGroupName"
+    "DNSName"          = "DNSName"
+    "SummaryState"     = "MachineSummaryState"
+    "UserName"         = "UserName"
+}
+
+# the properties used for sorting and as the cursor when requesting listings
+# page by page (see Get-PagingParameters):
+$PageKeys = @{
+    "GetMachineStatus" = "DNSName"
+    "GetSessions"      = "Uid"
+}
+
+#endregion filters
+
+
+
 #region functions
 
+function Select-Fields {
+    param (
+        # the requested properties (may be comma-separated strings)
+        [Parameter()]
+        [string[]]
+        $Fields,
+
+        # the valid properties, used if no fields were requested
+        [Parameter(Mandatory = $true)]
+        [string[]]
+        $Valid
+    )
+    if (-not $Fields) {
+        return $Valid
+    }
+    $Requested = @(
+        $Fields | ForEach-Object { $_.Split(",") } |
+            ForEach-Object { $_.Trim() } |
+            Where-Object { $_ -ne "" }
+    )
+    if ($Requested.Length -eq 0) {
+        return $Valid
+    }
+    $Invalid = @($Requested | Where-Object { $Valid -notcontains $_ })
+    if ($Invalid.Length -gt 0) {
+        throw "Invalid field(s) requested: $($Invalid -join ', ')"
+    }
+    return $Requested
+}
+
+function ConvertTo-BrokerFilter {
+    param (
+        # the requested filters, either a dictionary, an object (e.g. parsed
+        # from JSON) or a string like "DesktopGroupName=Group 1;PowerState=On"
+        [Parameter()]
+        $Filters,
+
+        # the valid filters, mapping their names to the broker parameter names
+        [Parameter(Mandatory = $true)]
+        [hashtable]
+        $Valid
+    )
+    # convert the filters into a hashtable that can be splatted into the
+    # corresponding Get-Broker* cmdlet:
+    $Requested = @{}
+    if (-not $Filters) {
+        return $Requested
+    }
+    if ($Filters -is [string]) {
+        foreach ($Pair in $Filters.Split(";")) {
+            if ($Pair.Trim() -eq "") {
+                continue
+            }
+            $Name, $Value = $Pair.Split("=", 2)
+            $Requested[$Name.Trim()] = $Value
+        }
+    } elseif ($Filters -is [System.Collections.IDictionary]) {
+        foreach ($Name in $Filters.Keys) {
+            $Requested[$Name] = $Filters[$Name]
+        }
+    } else {
+        foreach ($Property in $Filters.PSObject.Properties) {
+            $Requested[$Property.Name] = $Property.Value
+        }
+    }
+
+    $BrokerFilter = @{}
+    foreach ($Name in $Requested.Keys) {
+        if (-not $Valid.ContainsKey($Name)) {
+            throw "Invalid filter requested: $Name"
+        }
+        $Value = $Requested[$Name]
+        if ($Name -eq "InMaintenanceMode") {
+            $Value = [bool]::Parse("$Value")
+        }
+        $BrokerFilter[$Valid[$Name]] = $Value
+    }
+    return $BrokerFilter
+}
+
+function Select-Filtered {
+    param (
+        # the records to filter
+        [Parameter(ValueFromPipeline = $true)]
+        $InputObject,
+
+        # the filter as returned by ConvertTo-BrokerFilter
+        [Parameter(Mandatory = $true)]
+        [hashtable]
+        $BrokerFilter
+    )
+    # apply a broker filter locally (for "dummy" data), using wildcard matching
+    # just like the Get-Broker* cmdlets do:
+    process {
+        foreach ($Name in $BrokerFilter.Keys) {
+            if (-not ("$($InputObject.$Name)" -like "$($BrokerFilter[$Name])")) {
+                return
+            }
+        }
+        $InputObject
+    }
+}
+
+function Get-PagingParameters {
+    param (
+        # the property to sort by and to compare the cursor with
+        [Parameter(Mandatory = $true)]
+        [string]
+        $KeyField,
+
+        # the maximum number of records of the page (0 = no limit)
+        [Parameter()]
+        [int]
+        $Limit = 0,
+
+        # the cursor, i.e. the key of the last record of the previous page
+        [Parameter()]
+        [string]
+        $After = ""
+    )
+    # assemble the parameters for a Get-Broker* cmdlet to request a single page,
+    # sorted by the key and starting after the cursor - one additional record
+    # is requested to find out if there is a next page (see Split-Page):
+    $Paging = @{}
+    if (($Limit -le 0) -and ($After -eq "")) {
+        return $Paging
+    }
+    $Paging["SortBy"] = $KeyField
+    if ($Limit -gt 0) {
+        $Paging["MaxRecordCount"] = $Limit + 1
+    }
+    if ($After -ne "") {
+        if ($KeyField -eq "Uid") {
+            $Paging["Filter"] = "$KeyField -gt $([int64]$After)"
+        } else {
+            $Paging["Filter"] = "$KeyField -gt '$($After.Replace("'", "''"))'"
+        }
+    }
+    return $Paging
+}
+
+function Split-Page {
+    param (
+        # the records as returned for the paging parameters (may be $null)
+        [Parameter()]
+        $Data,
+
+        # the requested page size (0 = no limit)
+        [Parameter()]
+        [int]
+        $Limit = 0,
+
+        # the property used as cursor
+        [Parameter(Mandatory = $true)]
+        [string]
+        $KeyField
+    )
+    # trim the records to the page size, the cursor for the next page is the key
+    # of the last record (empty if there are no more records):
+    $Records = @($Data | Where-Object { $null -ne $_ })
+    if (($Limit -le 0) -or ($Records.Length -le $Limit)) {
+        return @{ Data = $Data; NextCursor = "" }
+    }
+    $Records = $Records[0..($Limit - 1)]
+    return @{ Data = $Records; NextCursor = "$($Records[-1].$KeyField)" }
+}
+
 function Get-MachineStatus {
-    $Data = Get-BrokerMachine -AdminAddress $AdminAddress | `
-        Select-Object -Property $MachineProperties
+    param (
+        # restrict the result to these properties (default: $MachineProperties)
+        [Parameter()]
+        [string[]]
+        $Fields = $null,
+
+        # only return machines matching these filters (see $MachineFilters)
+        [Parameter()]
+        $Filters = $null,
+
+        # request a single page of (at most) this size, see Split-Page
+        [Parameter()]
+        [int]
+        $Limit = 0,
+
+        # request the page starting after this machine's DNSName
+        [Parameter()]
+        [string]
+        $After = ""
+    )
+    $Properties = Select-Fields -Fields $Fields -Valid $MachineProperties
+    $BrokerFilter = ConvertTo-BrokerFilter -Filters $Filters -Valid $MachineFilters
+    $Paging = Get-PagingParameters -KeyField "DNSName" -Limit $Limit -After $After
+    if (($Paging.Count -gt 0) -and ($Properties -notcontains "DNSName")) {
+        # the cursor needs to be present in the records:
+        $Properties = @($Properties) + "DNSName"
+    }
+    $Data = Get-BrokerMachine -AdminAddress $AdminAddress @BrokerFilter @Paging | `
+        Select-Object -Property $Properties
     return $Data
 }
 
 function Get-Sessions {
-    $Data = Get-BrokerSession -AdminAddress $AdminAddress | `
-        Select-Object -Property $SessionProperties
+    param (
+        # restrict the result to these properties (default: $SessionProperties)
+        [Parameter()]
+        [string[]]
+        $Fields = $null,
+
+        # only return sessions matching these filters (see $SessionFilters)
+        [Parameter()]
+        $Filters = $null,
+
+        # request a single page of (at most) this size, see Split-Page
+        [Parameter()]
+        [int]
+        $Limit = 0,
+
+        # request the page starting after this session's Uid
+        [Parameter()]
+        [string]
+        $After = ""
+    )
+    $Properties = Select-Fields -Fields $Fields -Valid $SessionProperties
+    $BrokerFilter = ConvertTo-BrokerFilter -Filters $Filters -Valid $SessionFilters
+    $Paging = Get-PagingParameters -KeyField "Uid" -Limit $Limit -After $After
+    if (($Paging.Count -gt 0) -and ($Properties -notcontains "Uid")) {
+        # the cursor needs to be present in the records:
+        $Properties = @($Properties) + "Uid"
+    }
+    $Data = Get-BrokerSession -AdminAddress $AdminAddress @BrokerFilter @Paging | `
+        Select-Object -Property $Properties
     return $Data
 }
 
@@ -257,4 +510,162 @@ function Send-SessionMessage {
         -Text $Text
 }
 
+function Invoke-WrapperCommand {
+    # Dispatch a command (as known by the wrapper script) to the corresponding
+    # function, returning its result. Shared by the wrapper script and the
+    # persistent worker, so both behave exactly the same.
+    param (
+        [Parameter(Mandatory = $true)]
+        [string]
+        $CommandName,
+
+        [Parameter()]
+        [string]
+        $DNSName = "",
+
+        [Parameter()]
+        [string]
+        $Group = "",
+
+        [Parameter()]
+        [string[]]
+        $UserNames = $null,
+
+        [Parameter()]
+        [string]
+        $MessageStyle = "Information",
+
+        [Parameter()]
+        [string]
+        $Action = "",
+
+        [Parameter()]
+        [string]
+        $Title,
+
+        [Parameter()]
+        [string]
+        $Text,
+
+        [Parameter()]
+        [switch]
+        $Disable,
+
+        [Parameter()]
+        [string[]]
+        $Fields = $null,
+
+        [Parameter()]
+        $Filters = $null,
+
+        [Parameter()]
+        [switch]
+        $Dummy
+    )
+    $Data = ""
+    if ($Dummy) {
+        # When running in "dummy" mode, no actual calls to the Citrix stack will
+        # be done, instead simply the contents of a file in a subdir called
+        # "sampledata" having the name of the requested command followed by a
+        # ".json" suffix will be loaded and returned as payload data.
+        # This is intended for very basic testing in an environment where a
+        # Citrix stack is not (always) available.
+        $LoadFrom = "$PSScriptRoot/sampledata/$CommandName.json"
+        Write-Verbose "Loading dummy data from [$LoadFrom]..."
+        $Data = Get-Content $LoadFrom | ConvertFrom-Json
+        if ($CommandName -eq "GetMachineStatus") {
+            $Properties = Select-Fields -Fields $Fields -Valid $MachineProperties
+            $Filter = ConvertTo-BrokerFilter -Filters $Filters -Valid $MachineFilters
+            $Data = $Data | Select-Filtered -BrokerFilter $Filter | `
+                Select-Object -Property $Properties
+        } elseif ($CommandName -eq "GetSessions") {
+            $Properties = Select-Fields -Fields $Fields -Valid $SessionProperties
+            $Filter = ConvertTo-BrokerFilter -Filters $Filters -Valid $SessionFilters
+            $Data = $Data | Select-Filtered -BrokerFilter $Filter | `
+                Select-Object -Property $Properties
+        }
+    } else {
+        switch ($CommandName) {
+            "GetMachineStatus" {
+                $Data = Get-MachineStatus -Fields $Fields -Filters $Filters
+            }
+
+            "GetSessions" {
+                $Data = Get-Sessions -Fields $Fields -Filters $Filters
+            }
+
+            "DisconnectSession" {
+                if ($DNSName -eq "") {
+                    throw "Parameter [DNSName] is missing!"
+                }
+                $Data = Disconnect-Session -DNSName $DNSName
+            }
+
+            "GetAccessUsers" {
+                if ($Group -eq "") {
+                    throw "Parameter [Group] is missing!"
+                }
+                $Data = Get-AccessUsers -Group $Group
+            }
+
+            "MachinePowerAction" {
+                if ($DNSName -eq "") {
+                    throw "Parameter [DNSName] is missing!"
+                }
+                if ($Action -eq "") {
+                    throw "Parameter [Action] is missing!"
+                }
+                $Data = Invoke-PowerAction `
+                    -DNSName $DNSName `
+                    -Action $Action
+            }
+
+            "SendSessionMessage" {
+                if ($DNSName -eq "") {
+                    throw "Parameter [DNSName] is missing!"
+                }
+                if ($Title -eq "") {
+                    throw "Parameter [Title] is missing!"
+                }
+                if ($Text -eq "") {
+                    throw "Parameter [Text] is missing!"
+                }
+                Send-SessionMessage `
+                    -DNSName $DNSName `
+                    -Title $Title `
+                    -Text $Text `
+                    -MessageStyle $MessageStyle
+            }
+
+            "SetAccessUsers" {
+                if ($Group -eq "") {
+                    throw "Parameter [Group] is missing!"
+                }
+                if (($UserNames.Length -eq 0) -or ($UserNames -eq "") ) {
+                    throw "Parameter [UserNames] is missing!"
+                }
+                $Data = Set-AccessUsers `
+                    -Group $Group `
+                    -UserNames $UserNames `
+                    -RemoveAccess:$Disable
+            }
+
+            "SetMaintenanceMode" {
+                if ($DNSName -eq "") {
+                    throw "Parameter [DNSName] is missing!"
+                }
+                $Data = Set-MaintenanceMode `
+                    -DNSName $DNSName `
+                    -Disable:$Disable
+            }
+
+            # the wrapper script validates $CommandName through ValidateSet, but
+            # the worker passes on whatever it receives on its input stream:
+            Default { throw "Unknown command: $CommandName" }
+        }
+    }
+
+    return $Data
+}
+
 #endregion functions
@@ -0,0 +1,160 @@
+[CmdletBinding()]
+param (
+    # the delivery controller address to connect to
+    [Parameter(Mandatory = $true)]
+    [string]
+    $AdminAddress,
+
+    # switch to prevent the Citrix snap-in being loaded (only useful for testing)
+    [Parameter()]
+    [switch]
+    $NoSnapIn,
+
+    # switch to request dummy data (testing)
+    [Parameter()]
+    [switch]
+    $Dummy
+)
+
+<#
+
+Long-running counterpart of "psytricks-wrapper.ps1": instead of processing a
+single command given on the command line, the worker loads the libs and the
+Citrix snap-in once and then keeps processing requests read from STDIN until
+that stream is closed (or an "Exit" request is received).
+
+Every request is a single line of JSON, e.g.
+
+  {"Id": 7, "CommandName": "SetMaintenanceMode", "Parameters": {"DNSName": "..."}}
+
+and every response is written as a single line to STDOUT, consisting of the
+frame marker "##PSYTRICKS##" followed by the (compressed) JSON with the "Id" of
+the request plus the usual "Status" and "Data" items. Anything else showing up
+on STDOUT (e.g. output of a cmdlet that wasn't captured) is not prefixed with
+the marker and will therefore be ignored by the Python side.
+
+Two additional commands are available for managing the worker itself: "Ping"
+(returning the process ID, its current memory usage and the number of commands
+processed so far) and "Exit" (terminating the worker after responding).
+
+#>
+
+#region boilerplate
+
+$ScriptPath = Split-Path $script:MyInvocation.MyCommand.Path
+$ScriptName = Split-Path -Leaf $script:MyInvocation.MyCommand.Path
+$LibPath = Join-Path $ScriptPath "psytricks-lib.ps1"
+
+if (!(Test-Path $LibPath)) {
+    throw "Error loading functions etc. (can't find $LibPath)!"
+}
+
+# dot-source the libs file:
+. $LibPath
+
+# use UTF-8 (without BOM) in both directions, independent of the code page:
+$Utf8 = New-Object System.Text.UTF8Encoding $false
+[Console]::InputEncoding = $Utf8
+[Console]::OutputEncoding = $Utf8
+
+$FrameMarker = "##PSYTRICKS##"
+
+#endregion boilerplate
+
+
+#region snapin
+
+if ($NoSnapIn) {
+    Write-Debug "NOT loading Citrix Broker Snap-In, can only work on 'dummy' data!"
+} else {
+    Add-PSSnapin Citrix.Broker.Admin.V2 -EA Stop
+}
+
+#endregion snapin
+
+
+#region main
+
+$Calls = 0
+$Started = Get-Date
+
+while ($true) {
+    $Line = [Console]::In.ReadLine()
+    if ($null -eq $Line) {
+        # STDIN was closed, the Python side is gone or has shut us down:
+        break
+    }
+    if ($Line.Trim() -eq "") {
+        continue
+    }
+
+    $Id = $null
+    $CommandName = ""
+    $Status = @{
+        "ExecutionStatus"  = "0"
+        "ErrorMessage"     = ""
+        "ScriptName"       = "$ScriptName"
+        "ScriptPath"       = "$ScriptPath"
+        "PSyTricksVersion" = "$Version"
+    }
+    $Data = ""
+
+    try {
+        $Request = $Line | ConvertFrom-Json
+        $Id = $Request.Id
+        $CommandName = $Request.CommandName
+
+        # convert the parameters object into a hashtable for splatting:
+        $Params = @{}
+        if ($null -ne $Request.Parameters) {
+            foreach ($Property in $Request.Parameters.PSObject.Properties) {
+                $Params[$Property.Name] = $Property.Value
+            }
+        }
+
+        switch ($CommandName) {
+            "Ping" {
+                $Data = @{
+                    "ProcessId"  = $PID
+                    "WorkingSet" = (Get-Process -Id $PID).WorkingSet64
+                    "Calls"      = $Calls
+                    "Uptime"     = [int]((Get-Date) - $Started).TotalSeconds
+                }
+            }
+
+            "Exit" { }
+
+            Default {
+                $Calls += 1
+                $Data = Invoke-WrapperCommand `
+                    -CommandName $CommandName `
+                    -Dummy:$Dummy `
+                    @Params
+            }
+        }
+    } catch {
+        $Status = @{
+            "ExecutionStatus"  = "1"
+            "ErrorMessage"     = "$_"
+            "ScriptName"       = "$ScriptName"
+            "ScriptPath"       = "$ScriptPath"
+            "PSyTricksVersion" = "$Version"
+        }
+        $Data = ""
+    }
+
+    $Json = @{
+        "Id"     = $Id
+        "Status" = $Status
+        "Data"   = $Data
+    } | ConvertTo-Json -Depth 4 -Compress
+
+    [Console]::Out.WriteLine("$FrameMarker$Json")
+    [Console]::Out.Flush()
+
+    if ($CommandName -eq "Exit") {
+        break
+    }
+}
+
+#endregion main
@@ -76,6 +76,16 @@ param (
     [switch]
     $Disable,
 
+    # the properties to restrict the results of GetMachineStatus / GetSessions to
+    [Parameter()]
+    [string[]]
+    $Fields = $null,
+
+    # filters for GetMachineStatus / GetSessions, e.g. "DNSName=vm0*;PowerState=On"
+    [Parameter()]
+    [string]
+    $Filters = "",
+
     # switch to prevent the Citrix snap-in being loaded (only useful for testing)
     [Parameter()]
     [switch]
@@ -127,92 +137,19 @@ $Status = @{
 $Data = ""
 
 try {
-    if ($Dummy) {
-        # When running in "dummy" mode, no actual calls to the Citrix stack will
-        # be done, instead simply the contents of a file in a subdir called
-        # "sampledata" having the name of the requested command followed by a
-        # ".json" suffix will be loaded and returned as payload data.
-        # This is intended for very basic testing in an environment where a
-        # Citrix stack is not (always) available.
-        $LoadFrom = "$PSScriptRoot/sampledata/$CommandName.json"
-        Write-Verbose "Loading dummy data from [$LoadFrom]..."
-        $Data = Get-Content $LoadFrom | ConvertFrom-Json
-    } else {
-        switch ($CommandName) {
-            "GetMachineStatus" { $Data = Get-MachineStatus }
-
-            "GetSessions" { $Data = Get-Sessions }
-
-            "DisconnectSession" {
-                if ($DNSName -eq "") {
-                    throw "Parameter [DNSName] is missing!"
-                }
-                $Data = Disconnect-Session -DNSName $DNSName
-            }
-
-            "GetAccessUsers" {
-                if ($Group -eq "") {
-                    throw "Parameter [Group] is missing!"
-                }
-                $Data = Get-AccessUsers -Group $Group
-            }
-
-            "MachinePowerAction" {
-                if ($DNSName -eq "") {
-                    throw "Parameter [DNSName] is missing!"
-                }
-                if ($Action -eq "") {
-                    throw "Parameter [Action] is missing!"
-                }
-                $Data = Invoke-PowerAction `
-                    -DNSName $DNSName `
-                    -Action $Action
-            }
-
-            "SendSessionMessage" {
-                if ($DNSName -eq "") {
-                    throw "Parameter [DNSName] is missing!"
-                }
-                if ($Title -eq "") {
-                    throw "Parameter [Title] is missing!"
-                }
-                if ($Text -eq "") {
-                    throw "Parameter [Text] is missing!"
-                }
-                Send-SessionMessage `
-                    -DNSName $DNSName `
-                    -Title $Title `
-                    -Text $Text `
-                    -MessageStyle $MessageStyle
-            }
-
-            "SetAccessUsers" {
-                if ($Group -eq "") {
-                    throw "Parameter [Group] is missing!"
-                }
-                if (($UserNames.Length -eq 0) -or ($UserNames -eq "") ) {
-                    throw "Parameter [UserNames] is missing!"
-                }
-                $Data = Set-AccessUsers `
-                    -Group $Group `
-                    -UserNames $UserNames `
-                    -RemoveAccess:$Disable
-            }
-
-            "SetMaintenanceMode" {
-                if ($DNSName -eq "") {
-                    throw "Parameter [DNSName] is missing!"
-                }
-                $Data = Set-MaintenanceMode `
-                    -DNSName $DNSName `
-                    -Disable:$Disable
-            }
-
-            # this should never be reached as $CommandName is backed by ValidateSet
-            # above, but it's good practice to have a default case nevertheless:
-            Default { throw "Unknown command: $CommandName" }
-        }
-    }
+    $Data = Invoke-WrapperCommand `
+        -CommandName $CommandName `
+        -DNSName $DNSName `
+        -Group $Group `
+        -UserNames $UserNames `
+        -MessageStyle $MessageStyle `
+        -Action $Action `
+        -Title $Title `
+        -Text $Text `
+        -Disable:$Disable `
+        -Fields $Fields `
+        -Filters $Filters `
+        -Dummy:$Dummy
 } catch {
     $Status = @{
         "ExecutionStatus"  = "1"
@@ -31,6 +31,39 @@ param (
     [string]
     $LogFile,
 
+    [Parameter(
+        ParameterSetName = "Startup",
+        HelpMessage = "The minimum size in bytes for a response to be gzip " + `
+            "compressed (default: 1024), use a negative value to disable."
+    )]
+    [int]
+    $CompressMinSize = 1024,
+
+    [Parameter(
+        ParameterSetName = "Startup",
+        HelpMessage = "Cache lifetimes in seconds per GET route, e.g. " + `
+            "'GetMachineStatus=5,GetSessions=5' (default: no caching)."
+    )]
+    [string]
+    $CacheTTL = "",
+
+    [Parameter(
+        ParameterSetName = "Startup",
+        HelpMessage = "The number of requests to process concurrently " + `
+            "(default: 1, meaning requests are processed one after another)."
+    )]
+    [int]
+    $MaxThreads = 1,
+
+    [Parameter(
+        ParameterSetName = "Startup",
+        HelpMessage = "The maximum number of concurrent calls to the " + `
+            "Delivery Controller when processing requests concurrently " + `
+            "(default: 4)."
+    )]
+    [int]
+    $MaxBrokerCalls = 4,
+
     [Parameter(
         ParameterSetName = "Shutdown",
         HelpMessage = "Shut down the listener and terminate the script."
@@ -43,6 +76,10 @@ $ErrorActionPreference = "Stop"
 
 #region globals
 
+# remember the (automatic) variables present before anything got defined, so
+# only the script's own ones will be passed on to the request runspaces:
+$PredefinedVariables = @(Get-Variable -Scope Script | ForEach-Object Name)
+
 $ScriptPath = Split-Path $script:MyInvocation.MyCommand.Path
 $ScriptName = Split-Path -Leaf $script:MyInvocation.MyCommand.Path
 
@@ -136,12 +173,92 @@ $PostRoutes = @(
 #endregion route-keywords
 
 
+#region response-cache
+
+# the GET routes that have to be invalidated after a successful POST request:
+$InvalidatedBy = @{
+    "DisconnectSession"  = @("GetMachineStatus", "GetSessions")
+    "MachinePowerAction" = @("GetMachineStatus")
+    "SetAccessUsers"     = @("GetAccessUsers")
+    "SetMaintenanceMode" = @("GetMachineStatus")
+}
+
+# parse the TTLs (in seconds) per GET route, e.g. "GetMachineStatus=5,..."
+$CacheTTLs = @{}
+foreach ($Item in $CacheTTL.Split(",")) {
+    if ($Item.Trim() -eq "") {
+        continue
+    }
+    $Route, $Seconds = $Item.Split("=", 2)
+    $CacheTTLs[$Route.Trim()] = [double]$Seconds
+}
+
+# entries (see ConvertTo-DataEntry) keyed by the request's RawUrl, synchronized
+# in case requests are being processed concurrently:
+$ResponseCache = [hashtable]::Synchronized(@{})
+
+# limit the number of concurrent calls to the Delivery Controller (only relevant
+# if requests are being processed concurrently):
+$BrokerSemaphore = [System.Threading.SemaphoreSlim]::new($MaxBrokerCalls)
+
+#endregion response-cache
+
+
+#region server-metrics
+
+# the upper bounds (in seconds) of the latency histogram buckets:
+$MetricsBuckets = @(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# counters and histograms reported by the "/metrics" route, shared by all
+# runspaces (updates have to lock "SyncRoot", see Complete-RequestMetrics):
+$ServerMetrics = [hashtable]::Synchronized(@{
+        Started          = Get-Date
+        ListenerStarts   = 0
+        Accepted         = 0  # requests received by the listener
+        RequestsStarted  = 0  # requests picked up by a handler
+        RequestsFinished = 0
+        Requests         = @{}  # "<route>|<method>|<status>" -> count
+        Histograms       = @{}  # "<route>|<phase>" -> @{ Counts; Count; Sum }
+        BytesSent        = @{}  # "<route>" -> bytes
+    })
+
+#endregion server-metrics
+
+
 #region functions
 
 function Format-Date {
     Get-Date -Format "yyyy-MM-dd HH:mm:ss"
 }
 
+function New-ResponseStatus {
+    param (
+        [Parameter()]
+        [string]
+        $ExecutionStatus = 0,
+
+        [Parameter()]
+        [string]
+        $ErrorMessage = "",
+
+        [Parameter(HelpMessage = "The cursor of the next page (if any).")]
+        [string]
+        $NextCursor = ""
+    )
+    $Status = @{
+        ExecutionStatus  = $ExecutionStatus
+        ErrorMessage     = $ErrorMessage
+        ScriptName       = $ScriptName
+        ScriptPath       = $ScriptPath
+        PSyTricksVersion = $Version
+        Timestamp        = [int64](Get-Date -UFormat %s)
+    }
+    if ($NextCursor -ne "") {
+        $Status["NextCursor"] = $NextCursor
+    }
+    return $Status
+}
+
 function Send-Response {
     param (
         [Parameter(
@@ -173,39 +290,675 @@ function Send-Response {
 
         [Parameter(HelpMessage = "Use 'text/html' instead of 'application/json'.")]
         [Switch]
-        $Html
+        $Html,
+
+        [Parameter(HelpMessage = "Send the body as-is, using this content type.")]
+        [string]
+        $ContentType = "",
+
+        [Parameter(HelpMessage = "Close the connection instead of keeping it alive.")]
+        [Switch]
+        $CloseConnection,
+
+        [Parameter(
+            HelpMessage = "The HttpListener context request object. If given " + `
+                "for a GET request, an ETag will be sent and 'If-None-Match' " + `
+                "will be honored. The response will be compressed if the " + `
+                "request's 'Accept-Encoding' allows it."
+        )]
+        $Request = $null,
+
+        [Parameter(
+            HelpMessage = "A pre-serialized 'Data' entry as returned by " + `
+                "ConvertTo-DataEntry, will be used instead of 'Body'."
+        )]
+        $Entry = $null,
+
+        [Parameter(HelpMessage = "Additional headers to send.")]
+        [hashtable]
+        $Headers = @{},
+
+        [Parameter(
+            HelpMessage = "The request headers the response depends on, sent " + `
+                "as 'Vary' if 'Request' is given (default='Accept-Encoding')."
+        )]
+        [string]
+        $Vary = "Accept-Encoding"
     )
+    # keep the connection open for subsequent requests of the (pooling) client
+    # unless explicitly requested otherwise:
+    $Response.KeepAlive = -not $CloseConnection
+    foreach ($Header in $Headers.GetEnumerator()) {
+        $Response.AddHeader($Header.Key, [string]$Header.Value)
+    }
+    # the representation is negotiated (and may be compressed) only if the
+    # request is known, caches need to know about it either way:
+    if ($null -ne $Request) {
+        $Response.AddHeader("Vary", $Vary)
+    }
+
+    $Stopwatch = [System.Diagnostics.Stopwatch]::StartNew()
     $Type = "application/json"
     if ($Html) {
-        $Type = "text/html"
+        $ContentType = "text/html"
+    }
+    if ($ContentType -ne "") {
+        $Type = $ContentType
         $Payload = $Body
     } else {
-        $Status = @{
-            ExecutionStatus  = $ExecutionStatus
-            ErrorMessage     = $ErrorMessage
-            ScriptName       = $ScriptName
-            ScriptPath       = $ScriptPath
-            PSyTricksVersion = $Version
-            Timestamp        = [int64](Get-Date -UFormat %s)
+        if ($null -eq $Entry) {
+            $Entry = ConvertTo-DataEntry -Body $Body
         }
+        Complete-DataEntry -Entry $Entry
+        $Status = New-ResponseStatus `
+            -ExecutionStatus $ExecutionStatus `
+            -ErrorMessage $ErrorMessage `
+            -NextCursor $Entry.NextCursor
+        $StatusJson = ConvertTo-Json -InputObject $Status
+        $Payload = "{`"Status`":$StatusJson,`"Data`":$($Entry.DataJson)}"
+    }
 
-        $Payload = @{
-            "Status" = $Status
-            "Data"   = $Body
-        } | ConvertTo-Json -Depth 4
+    $Size = [System.Text.Encoding]::UTF8.GetByteCount($Payload)
+    $Gzip = ($null -ne $Request) -and ($CompressMinSize -ge 0) -and `
+        ($Size -ge $CompressMinSize) -and `
+        (Test-AcceptsGzip -AcceptEncoding $Request.Headers["Accept-Encoding"])
+
+    if (($ContentType -eq "") -and ($null -ne $Request) -and `
+        ($Request.HttpMethod -eq "GET") -and ($StatusCode -eq 200)) {
+        # the gzip-encoded body is a different representation than the plain
+        # one, so it needs a different (strong) tag - see Test-ETagMatch:
+        $ETag = $Entry.ETag
+        if ($Gzip) {
+            $ETag = $ETag.TrimEnd('"') + '-gz"'
+        }
+        $Response.AddHeader("ETag", $ETag)
+        if (Test-ETagMatch -ETag $ETag -IfNoneMatch $Request.Headers["If-None-Match"]) {
+            $Elapsed = $Stopwatch.Elapsed.TotalSeconds
+            Add-RequestStats -Phase "serialize" -Seconds $Elapsed
+            $Response.StatusCode = 304
+            $Response.ContentLength64 = 0
+            $Response.Close()
+            Write-Host "Not modified ($ETag), sent 304." @Green
+            return
+        }
     }
 
     $Buffer = [System.Text.Encoding]::UTF8.GetBytes($Payload)  # convert to bytes
+    if ($Gzip) {
+        $Length = $Buffer.Length
+        $Buffer = Compress-Gzip -Buffer $Buffer
+        $Response.AddHeader("Content-Encoding", "gzip")
+        Write-Host "Compressed response: $Length -> $($Buffer.Length) bytes" @Cyan
+    }
+    Add-RequestStats -Phase "serialize" -Seconds $Stopwatch.Elapsed.TotalSeconds
+    $Stopwatch.Restart()
     $Response.ContentLength64 = $Buffer.Length
     $Response.ContentType = $Type
     $Response.StatusCode = $StatusCode
     $Response.OutputStream.Write($Buffer, 0, $Buffer.Length)
-    $Response.OutputStream.Close()
+    $Response.Close()
+    Add-RequestStats -Phase "write" -Seconds $Stopwatch.Elapsed.TotalSeconds `
+        -Bytes $Buffer.Length
     Write-Host "Response sent successfully." @Green
 
 }
 
 
+function ConvertTo-DataEntry {
+    param (
+        [Parameter()]
+        $Body = "",
+
+        [Parameter(HelpMessage = "The cursor of the next page (if any).")]
+        [string]
+        $NextCursor = ""
+    )
+    # the records are kept as they are (NDJSON responses serialize them one by
+    # one), "DataJson" and "ETag" are only filled in by Complete-DataEntry once
+    # a JSON response actually needs them:
+    return @{
+        Data       = $Body
+        DataJson   = $null
+        ETag       = $null
+        NextCursor = $NextCursor
+        Created    = Get-Date
+    }
+}
+
+
+function Complete-DataEntry {
+    param (
+        [Parameter(
+            Mandatory = $true,
+            HelpMessage = "The entry as returned by ConvertTo-DataEntry."
+        )]
+        [hashtable]
+        $Entry
+    )
+    # serialize "Data" on its own so its hash can be used as the ETag (the
+    # "Status" changes with every request due to the timestamp) - note that
+    # depth 3 is equivalent to depth 4 when being nested in the envelope; this
+    # is done once per entry, cached ones may be shared by several runspaces:
+    [System.Threading.Monitor]::Enter($Entry.SyncRoot)
+    try {
+        if ($null -eq $Entry.DataJson) {
+            $DataJson = ConvertTo-Json -InputObject $Entry.Data -Depth 3
+            $Entry.ETag = Get-ETag -Text $DataJson
+            $Entry.DataJson = $DataJson
+        }
+    } finally {
+        [System.Threading.Monitor]::Exit($Entry.SyncRoot)
+    }
+}
+
+
+function Test-AcceptsNdjson {
+    param (
+        [Parameter()]
+        [string]
+        $Accept = ""
+    )
+    # only send NDJSON if the client explicitly asks for it:
+    foreach ($Candidate in $Accept.Split(",")) {
+        $Type, $Params = $Candidate.Trim().Split(";", 2)
+        if ($Type.Trim() -ne "application/x-ndjson") {
+            continue
+        }
+        return -not ($Params -match "q\s*=\s*0(\.0*)?\s*$")
+    }
+    return $false
+}
+
+
+function Send-NdjsonResponse {
+    param (
+        [Parameter(Mandatory = $true)]
+        $Response,
+
+        [Parameter(Mandatory = $true)]
+        $Request,
+
+        [Parameter(
+            Mandatory = $true,
+            HelpMessage = "The entry as returned by ConvertTo-DataEntry."
+        )]
+        $Entry,
+
+        [Parameter(HelpMessage = "Additional headers to send.")]
+        [hashtable]
+        $Headers = @{}
+    )
+    # Send the records of a listing as newline-delimited JSON (one record per
+    # line) followed by a line holding only the "Status" object, using chunked
+    # transfer encoding so no buffer for the whole document is needed and the
+    # client can start processing with the first chunk:
+    $Response.KeepAlive = $true
+    foreach ($Header in $Headers.GetEnumerator()) {
+        $Response.AddHeader($Header.Key, [string]$Header.Value)
+    }
+    $Response.AddHeader("Vary", "Accept, Accept-Encoding")
+    $Response.ContentType = "application/x-ndjson"
+    $Response.StatusCode = 200
+    $Response.SendChunked = $true
+
+    $Stream = $Response.OutputStream
+    if (($CompressMinSize -ge 0) -and `
+        (Test-AcceptsGzip -AcceptEncoding $Request.Headers["Accept-Encoding"])) {
+        $Response.AddHeader("Content-Encoding", "gzip")
+        $Stream = [System.IO.Compression.GZipStream]::new(
+            $Stream, [System.IO.Compression.CompressionLevel]::Fastest
+        )
+    }
+    $Writer = [System.IO.StreamWriter]::new(
+        $Stream, [System.Text.UTF8Encoding]::new($false), 65536
+    )
+
+    # serializing and writing are interleaved, so the time spent in the former
+    # is measured separately and subtracted from the total:
+    $Stopwatch = [System.Diagnostics.Stopwatch]::StartNew()
+    $Serializing = [System.Diagnostics.Stopwatch]::new()
+    $Bytes = 0
+    $Count = 0
+    try {
+        foreach ($Record in @($Entry.Data)) {
+            if (($null -eq $Record) -or ($Record -is [string] -and $Record -eq "")) {
+                continue
+            }
+            $Serializing.Start()
+            $Line = (ConvertTo-Json -InputObject $Record -Depth 3 -Compress) + "`n"
+            $Serializing.Stop()
+            $Writer.Write($Line)
+            $Bytes += $Writer.Encoding.GetByteCount($Line)
+            $Count += 1
+        }
+        $Status = New-ResponseStatus -NextCursor $Entry.NextCursor
+        $Line = (ConvertTo-Json -InputObject @{ Status = $Status } -Compress) + "`n"
+        $Writer.Write($Line)
+        $Bytes += $Writer.Encoding.GetByteCount($Line)
+    } finally {
+        # disposing the writer flushes it and closes the (gzip) stream:
+        $Writer.Dispose()
+        $Response.Close()
+    }
+    $Serialize = $Serializing.Elapsed.TotalSeconds
+    Add-RequestStats -Phase "serialize" -Seconds $Serialize
+    # NOTE: the bytes are counted before a potential compression:
+    Add-RequestStats -Phase "write" `
+        -Seconds ($Stopwatch.Elapsed.TotalSeconds - $Serialize) `
+        -Bytes $Bytes
+    Write-Host "Streamed $Count records as NDJSON." @Green
+}
+
+
+function Read-PagingQuery {
+    param (
+        [Parameter()]
+        $Query = $null
+    )
+    # parse the "limit" and "after" query parameters of a listing request:
+    $Paging = @{ Limit = 0; After = "" }
+    if ($null -eq $Query) {
+        return $Paging
+    }
+    if ($Query["limit"]) {
+        $Limit = 0
+        if ((-not [int]::TryParse($Query["limit"], [ref]$Limit)) -or ($Limit -lt 1)) {
+            throw "Invalid 'limit', expecting a positive number: $($Query["limit"])"
+        }
+        $Paging.Limit = $Limit
+    }
+    if ($Query["after"]) {
+        $Paging.After = $Query["after"]
+    }
+    return $Paging
+}
+
+
+function Get-ETag {
+    param (
+        [Parameter(Mandatory = $true)]
+        [string]
+        $Text
+    )
+    # a strong entity tag derived from the SHA-1 hash of the (UTF-8) text:
+    $Sha1 = [System.Security.Cryptography.SHA1]::Create()
+    $Hash = $Sha1.ComputeHash([System.Text.Encoding]::UTF8.GetBytes($Text))
+    $Sha1.Dispose()
+    return '"' + [System.BitConverter]::ToString($Hash).Replace("-", "") + '"'
+}
+
+
+function Test-AcceptsGzip {
+    param (
+        [Parameter()]
+        [string]
+        $AcceptEncoding = ""
+    )
+    # Brotli would compress even better, but "BrotliStream" is not available
+    # in the .NET Framework that is used by Windows PowerShell, so the only
+    # encoding offered is gzip (unless the client explicitly refuses it):
+    foreach ($Candidate in $AcceptEncoding.Split(",")) {
+        $Coding, $Params = $Candidate.Trim().Split(";", 2)
+        if (($Coding -ne "gzip") -and ($Coding -ne "*")) {
+            continue
+        }
+        if ($Params -match "q\s*=\s*0(\.0*)?\s*$") {
+            return $false
+        }
+        return $true
+    }
+    return $false
+}
+
+
+function Compress-Gzip {
+    param (
+        [Parameter(Mandatory = $true)]
+        [byte[]]
+        $Buffer
+    )
+    $Stream = [System.IO.MemoryStream]::new()
+    $Gzip = [System.IO.Compression.GZipStream]::new(
+        $Stream, [System.IO.Compression.CompressionLevel]::Fastest
+    )
+    $Gzip.Write($Buffer, 0, $Buffer.Length)
+    $Gzip.Dispose()  # flushes the remaining data and writes the gzip footer
+    return , $Stream.ToArray()
+}
+
+
+function Test-ETagMatch {
+    param (
+        [Parameter(Mandatory = $true)]
+        [string]
+        $ETag,
+
+        [Parameter()]
+        [string]
+        $IfNoneMatch = ""
+    )
+    # the header may contain a list of (possibly weak) tags or a wildcard - the
+    # tags of the gzip-encoded ("<hash>-gz") and the plain representation of
+    # the same data are considered equal, so the client may switch encodings:
+    $ETag = $ETag -replace '-gz"$', '"'
+    foreach ($Candidate in $IfNoneMatch.Split(",")) {
+        $Candidate = $Candidate.Trim()
+        if ($Candidate.StartsWith("W/")) {
+            $Candidate = $Candidate.Substring(2)
+        }
+        $Candidate = $Candidate -replace '-gz"$', '"'
+        if (($Candidate -eq "*") -or ($Candidate -eq $ETag)) {
+            return $true
+        }
+    }
+    return $false
+}
+
+
+function Get-CachedEntry {
+    param (
+        [Parameter(Mandatory = $true)]
+        [string]
+        $RawUrl,
+
+        [Parameter(Mandatory = $true)]
+        [string]
+        $Command
+    )
+    # return a cached entry that hasn't expired yet or $null:
+    $TTL = $CacheTTLs[$Command]
+    if ($null -eq $TTL) {
+        return $null
+    }
+    $Entry = $ResponseCache[$RawUrl]
+    if ($null -eq $Entry) {
+        return $null
+    }
+    if (((Get-Date) - $Entry.Created).TotalSeconds -ge $TTL) {
+        $ResponseCache.Remove($RawUrl)
+        return $null
+    }
+    return $Entry
+}
+
+
+function Clear-CachedEntries {
+    param (
+        [Parameter(Mandatory = $true)]
+        [string]
+        $Command
+    )
+    # remove the cache entries of all GET routes affected by a POST command:
+    $Routes = $InvalidatedBy[$Command]
+    if ($null -eq $Routes) {
+        return
+    }
+    foreach ($Key in @($ResponseCache.Keys)) {
+        if ($Routes -contains $Key.Split("?")[0].Split("/")[1]) {
+            $ResponseCache.Remove($Key)
+            Write-Host "Invalidated cache entry [$Key]." @Cyan
+        }
+    }
+}
+
+
+function Add-RequestStats {
+    param (
+        [Parameter(HelpMessage = "The phase (broker, serialize or write).")]
+        [string]
+        $Phase = "",
+
+        [Parameter()]
+        [double]
+        $Seconds = 0,
+
+        [Parameter(HelpMessage = "The number of bytes sent.")]
+        [int64]
+        $Bytes = 0
+    )
+    # add to the stats of the request currently being processed (defined in
+    # Invoke-RequestHandler), the phases may be recorded multiple times:
+    if ($null -eq $RequestStats) {
+        return
+    }
+    if ($Phase -ne "") {
+        $RequestStats.Phases[$Phase] += $Seconds
+    }
+    $RequestStats.Bytes += $Bytes
+}
+
+
+function Get-RouteLabel {
+    param (
+        [Parameter()]
+        [string]
+        $RawUrl
+    )
+    # the first segment of the URL, unknown ones are combined into "other" to
+    # keep the number of distinct labels bounded:
+    $Route = $RawUrl.Split("?")[0].Split("/")[1]
+    if ($Route -eq "") {
+        return "index"
+    }
+    $Known = $GetRoutes + $PostRoutes + @("end", "metrics", "version")
+    if ($Known -notcontains $Route) {
+        return "other"
+    }
+    return $Route
+}
+
+
+function Add-HistogramValue {
+    param (
+        [Parameter(Mandatory = $true)]
+        [string]
+        $Key,
+
+        [Parameter(Mandatory = $true)]
+        [double]
+        $Value
+    )
+    # NOTE: needs to be called while holding the lock on $ServerMetrics!
+    $Histogram = $ServerMetrics.Histograms[$Key]
+    if ($null -eq $Histogram) {
+        $Histogram = @{
+            Counts = [int64[]]::new($MetricsBuckets.Length + 1)
+            Count  = 0
+            Sum    = 0.0
+        }
+        $ServerMetrics.Histograms[$Key] = $Histogram
+    }
+    $Index = 0
+    $Last = $MetricsBuckets.Length
+    while (($Index -lt $Last) -and ($Value -gt $MetricsBuckets[$Index])) {
+        $Index += 1
+    }
+    $Histogram.Counts[$Index] += 1
+    $Histogram.Count += 1
+    $Histogram.Sum += $Value
+}
+
+
+function Complete-RequestMetrics {
+    param (
+        [Parameter(Mandatory = $true)]
+        $Request,
+
+        [Parameter(Mandatory = $true)]
+        $Response,
+
+        [Parameter(HelpMessage = "The total time spent on the request.")]
+        [double]
+        $Seconds = 0
+    )
+    $Route = Get-RouteLabel -RawUrl $Request.RawUrl
+    $Key = "$Route|$($Request.HttpMethod)|$($Response.StatusCode)"
+    [System.Threading.Monitor]::Enter($ServerMetrics.SyncRoot)
+    try {
+        $ServerMetrics.RequestsFinished += 1
+        $ServerMetrics.Requests[$Key] += 1
+        $ServerMetrics.BytesSent[$Route] += $RequestStats.Bytes
+        Add-HistogramValue -Key "$Route|total" -Value $Seconds
+        foreach ($Phase in $RequestStats.Phases.Keys) {
+            $Value = $RequestStats.Phases[$Phase]
+            Add-HistogramValue -Key "$Route|$Phase" -Value $Value
+        }
+    } finally {
+        [System.Threading.Monitor]::Exit($ServerMetrics.SyncRoot)
+    }
+}
+
+
+function Get-MetricsSnapshot {
+    # copy the metrics (while holding the lock) into a serializable structure:
+    [System.Threading.Monitor]::Enter($ServerMetrics.SyncRoot)
+    try {
+        $Requests = @()
+        foreach ($Key in $ServerMetrics.Requests.Keys) {
+            $Route, $Method, $Status = $Key.Split("|")
+            $Requests += @{
+                Route  = $Route
+                Method = $Method
+                Status = $Status
+                Count  = $ServerMetrics.Requests[$Key]
+            }
+        }
+        $Latency = @()
+        foreach ($Key in $ServerMetrics.Histograms.Keys) {
+            $Route, $Phase = $Key.Split("|")
+            $Histogram = $ServerMetrics.Histograms[$Key]
+            $Cumulative = 0
+            $Buckets = @()
+            foreach ($Count in $Histogram.Counts) {
+                $Cumulative += $Count
+                $Buckets += $Cumulative
+            }
+            $Latency += @{
+                Route   = $Route
+                Phase   = $Phase
+                Count   = $Histogram.Count
+                Sum     = $Histogram.Sum
+                Buckets = $Buckets
+            }
+        }
+        $BytesSent = @{}
+        foreach ($Route in $ServerMetrics.BytesSent.Keys) {
+            $BytesSent[$Route] = $ServerMetrics.BytesSent[$Route]
+        }
+        # requests handed to the runspace pool but not yet picked up (always 0
+        # when processing requests one after another):
+        $Queued = $ServerMetrics.Accepted - $ServerMetrics.RequestsStarted
+        $InFlight = $ServerMetrics.RequestsStarted - $ServerMetrics.RequestsFinished
+    } finally {
+        [System.Threading.Monitor]::Exit($ServerMetrics.SyncRoot)
+    }
+
+    return @{
+        UptimeSeconds       = [int](((Get-Date) - $ServerMetrics.Started).TotalSeconds)
+        ListenerRestarts    = [Math]::Max(0, $ServerMetrics.ListenerStarts - 1)
+        QueueDepth          = [Math]::Max(0, $Queued)
+        RequestsInFlight    = $InFlight
+        BrokerCallsInFlight = $MaxBrokerCalls - $BrokerSemaphore.CurrentCount
+        BucketBounds        = $MetricsBuckets
+        Requests            = $Requests
+        Latency             = $Latency
+        BytesSent           = $BytesSent
+    }
+}
+
+
+function Format-PrometheusMetrics {
+    param (
+        [Parameter(
+            Mandatory = $true,
+            HelpMessage = "The metrics as returned by Get-MetricsSnapshot."
+        )]
+        $Snapshot
+    )
+    $Lines = [System.Collections.Generic.List[string]]::new()
+
+    $Lines.Add("# HELP restricks_requests_total Requests by route, method and status.")
+    $Lines.Add("# TYPE restricks_requests_total counter")
+    foreach ($Item in $Snapshot.Requests) {
+        $Labels = "route=`"$($Item.Route)`",method=`"$($Item.Method)`"," + `
+            "status=`"$($Item.Status)`""
+        $Lines.Add("restricks_requests_total{$Labels} $($Item.Count)")
+    }
+
+    $Families = @(
+        @(
+            "restricks_request_duration_seconds",
+            "Total time spent per request.",
+            { $_.Phase -eq "total" }
+        ),
+        @(
+            "restricks_phase_duration_seconds",
+            "Time spent per phase of a request (broker cmdlets, serialization, " + `
+                "writing the response).",
+            { $_.Phase -ne "total" }
+        )
+    )
+    foreach ($Family in $Families) {
+        $Name = $Family[0]
+        $Lines.Add("# HELP $Name $($Family[1])")
+        $Lines.Add("# TYPE $Name histogram")
+        foreach ($Item in ($Snapshot.Latency | Where-Object $Family[2])) {
+            $Labels = "route=`"$($Item.Route)`""
+            if ($Item.Phase -ne "total") {
+                $Labels += ",phase=`"$($Item.Phase)`""
+            }
+            for ($i = 0; $i -lt $Item.Buckets.Length; $i++) {
+                $Bound = "+Inf"
+                if ($i -lt $Snapshot.BucketBounds.Length) {
+                    $Bound = "$($Snapshot.BucketBounds[$i])"
+                }
+                $Lines.Add("$($Name)_bucket{$Labels,le=`"$Bound`"} $($Item.Buckets[$i])")
+            }
+            $Lines.Add("$($Name)_sum{$Labels} $($Item.Sum)")
+            $Lines.Add("$($Name)_count{$Labels} $($Item.Count)")
+        }
+    }
+
+    $Lines.Add("# HELP restricks_response_bytes_total Bytes sent by route.")
+    $Lines.Add("# TYPE restricks_response_bytes_total counter")
+    foreach ($Route in $Snapshot.BytesSent.Keys) {
+        $Bytes = $Snapshot.BytesSent[$Route]
+        $Lines.Add("restricks_response_bytes_total{route=`"$Route`"} $Bytes")
+    }
+
+    $Scalars = [ordered]@{
+        restricks_queue_depth             = @(
+            "Requests waiting for a free runspace.", $Snapshot.QueueDepth
+        )
+        restricks_requests_in_flight      = @(
+            "Requests being processed.", $Snapshot.RequestsInFlight
+        )
+        restricks_broker_calls_in_flight  = @(
+            "Calls to the Delivery Controller in progress.",
+            $Snapshot.BrokerCallsInFlight
+        )
+        restricks_uptime_seconds          = @(
+            "Time since the server was started.", $Snapshot.UptimeSeconds
+        )
+        restricks_listener_restarts_total = @(
+            "Restarts of the HTTP listener.", $Snapshot.ListenerRestarts
+        )
+    }
+    foreach ($Name in $Scalars.Keys) {
+        $Help, $Value = $Scalars[$Name]
+        $Type = "gauge"
+        if ($Name.EndsWith("_total")) {
+            $Type = "counter"
+        }
+        $Lines.Add("# HELP $Name $Help")
+        $Lines.Add("# TYPE $Name $Type")
+        $Lines.Add("$Name $Value")
+    }
+
+    return ($Lines -join "`n") + "`n"
+}
+
+
 function Split-RawUrl {
     param (
         [Parameter()]
@@ -216,7 +969,8 @@ function Split-RawUrl {
     if (-not($RawUrl[0] -eq "/")) {
         throw "Invalid 'RawUrl' property: $RawUrl"
     }
-    $Parsed = $RawUrl.Split("/")
+    # the query string (if any) is available through $Request.QueryString:
+    $Parsed = $RawUrl.Split("?")[0].Split("/")
     Write-Host "Parsed URL ($($Parsed.Length) segments): $Parsed" @Cyan
     return $Parsed
 }
@@ -224,21 +978,54 @@ function Split-RawUrl {
 
 function Get-BrokerData {
     param (
-        $ParsedUrl
+        $ParsedUrl,
+
+        # the parsed query string of the request (a NameValueCollection)
+        $Query = $null,
+
+        # the paging parameters as returned by Read-PagingQuery
+        $Paging = @{ Limit = 0; After = "" }
     )
     $Command = $ParsedUrl[1]
     Write-Host "Get-BrokerData($Command)" @Cyan
 
+    $Fields = $null
+    $Filters = @{}
+    if ($null -ne $Query) {
+        $Fields = $Query["fields"]
+        # any other query parameter is considered to be a filter, validation is
+        # done by ConvertTo-BrokerFilter:
+        foreach ($Name in $Query.AllKeys) {
+            if (@($null, "fields", "limit", "after") -notcontains $Name) {
+                $Filters[$Name] = $Query[$Name]
+            }
+        }
+    }
+    if ($Fields) {
+        Write-Host "> Fields=[$Fields]" @Cyan
+    }
+    foreach ($Name in $Filters.Keys) {
+        Write-Host "> Filter: $Name=[$($Filters[$Name])]" @Cyan
+    }
+
     $TStart = Get-Date
     switch ($Command) {
         "GetSessions" {
             $Desc = "sessions"
-            $BrokerData = Get-Sessions
+            $BrokerData = Get-Sessions `
+                -Fields $Fields `
+                -Filters $Filters `
+                -Limit $Paging.Limit `
+                -After $Paging.After
         }
 
         "GetMachineStatus" {
             $Desc = "machines"
-            $BrokerData = Get-MachineStatus
+            $BrokerData = Get-MachineStatus `
+                -Fields $Fields `
+                -Filters $Filters `
+                -Limit $Paging.Limit `
+                -After $Paging.After
         }
 
         "GetAccessUsers" {
@@ -252,8 +1039,10 @@ function Get-BrokerData {
 
         Default { throw "Invalid: $Command" }
     }
+    $Elapsed = (Get-Date) - $TStart
+    Add-RequestStats -Phase "broker" -Seconds $Elapsed.TotalSeconds
     Write-Host "Got $($BrokerData.Length) $Desc from Citrix." @Cyan
-    Write-Host "Took $(($(Get-Date) - $TStart).TotalMilliseconds) ms" @Magenta
+    Write-Host "Took $($Elapsed.TotalMilliseconds) ms" @Magenta
 
     return $BrokerData
 }
@@ -335,8 +1124,10 @@ function Send-BrokerRequest {
 
         Default { throw "Invalid: $Command" }
     }
+    $Elapsed = (Get-Date) - $TStart
+    Add-RequestStats -Phase "broker" -Seconds $Elapsed.TotalSeconds
     Write-Host "Sent $Desc request to Citrix." @Cyan
-    Write-Host "Took $(($(Get-Date) - $TStart).TotalMilliseconds) ms" @Magenta
+    Write-Host "Took $($Elapsed.TotalMilliseconds) ms" @Magenta
 
     return $BrokerData
 }
@@ -352,7 +1143,7 @@ function Switch-GetRequest {
     $Command = $ParsedUrl[1]
 
     if ($Command -eq 'end') {
-        Send-Response -Response $Response -Body "Terminating."
+        Send-Response -Response $Response -Body "Terminating." -CloseConnection
         Write-Host "Received a termination request, stopping." @Red
         break
 
@@ -363,13 +1154,87 @@ function Switch-GetRequest {
     } elseif ($Command -eq 'version') {
         Send-Response -Response $Response -Body ""
 
+    } elseif ($Command -eq 'metrics') {
+        $Snapshot = Get-MetricsSnapshot
+        if ($Request.QueryString["format"] -eq "json") {
+            # serialize it here, as the default depth of the entries is too low:
+            $Entry = @{
+                DataJson   = ConvertTo-Json -InputObject $Snapshot -Depth 5 -Compress
+                NextCursor = ""
+            }
+            Send-Response -Response $Response -Entry $Entry
+        } else {
+            Send-Response `
+                -Response $Response `
+                -Body (Format-PrometheusMetrics -Snapshot $Snapshot) `
+                -ContentType "text/plain; version=0.0.4; charset=utf-8"
+        }
+
     } elseif ($GetRoutes -contains $Command) {
-        try {
-            $Body = Get-BrokerData -ParsedUrl $ParsedUrl
-        } catch {
-            Send-Response -Response $Response -StatusCode 400 -Body $_ -Html
+        # listings can be paginated and sent as NDJSON:
+        $Listing = $PageKeys.ContainsKey($Command)
+        $Ndjson = $Listing -and (Test-AcceptsNdjson -Accept $Request.Headers["Accept"])
+        $Cacheable = $CacheTTLs[$Command] -gt 0
+        $Entry = Get-CachedEntry -RawUrl $Request.RawUrl -Command $Command
+        if ($null -ne $Entry) {
+            $Age = [int]((Get-Date) - $Entry.Created).TotalSeconds
+            Write-Host "Cache HIT for [$($Request.RawUrl)], age: $Age s" @Cyan
+            $Headers = @{ "X-Cache" = "HIT"; "Age" = $Age }
+        } else {
+            $BrokerSemaphore.Wait()
+            try {
+                $Paging = @{ Limit = 0; After = "" }
+                if ($Listing) {
+                    $Paging = Read-PagingQuery -Query $Request.QueryString
+                }
+                $Body = Get-BrokerData `
+                    -ParsedUrl $ParsedUrl `
+                    -Query $Request.QueryString `
+                    -Paging $Paging
+            } catch {
+                Send-Response -Response $Response -StatusCode 400 -Body $_ -Html
+                return
+            } finally {
+                $null = $BrokerSemaphore.Release()
+            }
+            $NextCursor = ""
+            if ($Listing) {
+                $Page = Split-Page `
+                    -Data $Body `
+                    -Limit $Paging.Limit `
+                    -KeyField $PageKeys[$Command]
+                $Body = $Page.Data
+                $NextCursor = $Page.NextCursor
+            }
+            # nothing is serialized here, a JSON response does it as part of its
+            # "serialize" phase (see Send-Response), NDJSON record by record:
+            $Entry = ConvertTo-DataEntry -Body $Body -NextCursor $NextCursor
+            $Headers = @{}
+            if ($Cacheable) {
+                $ResponseCache[$Request.RawUrl] = $Entry
+                $Headers = @{ "X-Cache" = "MISS"; "Age" = 0 }
+            }
+        }
+
+        if ($Ndjson) {
+            Send-NdjsonResponse `
+                -Response $Response `
+                -Request $Request `
+                -Entry $Entry `
+                -Headers $Headers
+        } else {
+            # listings are sent as NDJSON as well, depending on "Accept":
+            $Vary = "Accept-Encoding"
+            if ($Listing) {
+                $Vary = "Accept, Accept-Encoding"
+            }
+            Send-Response `
+                -Response $Response `
+                -Entry $Entry `
+                -Request $Request `
+                -Headers $Headers `
+                -Vary $Vary
         }
-        Send-Response -Response $Response -Body $Body
 
     } else {
         Send-Response `
@@ -403,7 +1268,13 @@ function Switch-PostRequest {
             return
         }
 
-        $BrokerData = Send-BrokerRequest -ParsedUrl $ParsedUrl -Payload $Decoded
+        $BrokerSemaphore.Wait()
+        try {
+            $BrokerData = Send-BrokerRequest -ParsedUrl $ParsedUrl -Payload $Decoded
+        } finally {
+            $null = $BrokerSemaphore.Release()
+        }
+        Clear-CachedEntries -Command $Command
         Send-Response -Response $Response -Body $BrokerData
 
     } else {
@@ -416,7 +1287,131 @@ function Switch-PostRequest {
 }
 
 
-function Start-ListenerBlocking {
+function Invoke-RequestHandler {
+    param (
+        [Parameter(Mandatory = $true)]
+        $Context
+    )
+    # NOTE: the "Switch-*Request" functions and "Send-Response" calls rely on
+    # the $Response variable defined here (and "Add-RequestStats" on the
+    # $RequestStats one)!
+    $Request = $Context.Request
+    $Response = $Context.Response
+    $RequestStats = @{ Phases = @{}; Bytes = 0 }
+    $Stopwatch = [System.Diagnostics.Stopwatch]::StartNew()
+    [System.Threading.Monitor]::Enter($ServerMetrics.SyncRoot)
+    try {
+        $ServerMetrics.RequestsStarted += 1
+    } finally {
+        [System.Threading.Monitor]::Exit($ServerMetrics.SyncRoot)
+    }
+    try {
+        if ($Request.HttpMethod -eq 'GET') {
+            Switch-GetRequest -Request $Request
+        }
+
+        if ($Request.HttpMethod -eq 'POST') {
+            Switch-PostRequest -Request $Request
+        }
+    } catch {
+        $Message = "ERROR processing request"
+        Write-Host "$($Message): $_" @Red
+        try {
+            Send-Response `
+                -Response $Response `
+                -StatusCode 400 `
+                -ExecutionStatus 1 `
+                -ErrorMessage $_ `
+                -Body $Message
+        } catch {
+            Write-Host "Unable to send the response: $_" @Red
+        }
+    } finally {
+        Complete-RequestMetrics `
+            -Request $Request `
+            -Response $Response `
+            -Seconds $Stopwatch.Elapsed.TotalSeconds
+    }
+}
+
+
+function New-RequestRunspacePool {
+    # Create a pool of runspaces having the Citrix snap-in loaded and all the
+    # functions and variables of this script and "psytricks-lib.ps1" defined,
+    # so "Invoke-RequestHandler" can be used there exactly like here.
+    $Types = "System.Management.Automation.Runspaces"
+    $State = [System.Management.Automation.Runspaces.InitialSessionState]::CreateDefault()
+    $Warning = $null
+    $null = $State.ImportPSSnapIn("Citrix.Broker.Admin.V2", [ref]$Warning)
+
+    $Parameters = @($script:MyInvocation.MyCommand.Parameters.Keys)
+    foreach ($Variable in Get-Variable -Scope Script) {
+        if (($PredefinedVariables -contains $Variable.Name) -and `
+            ($Parameters -notcontains $Variable.Name)) {
+            continue
+        }
+        # NOTE: objects are passed by reference, e.g. the response cache and the
+        # broker semaphore are shared by all runspaces:
+        $Entry = New-Object "$Types.SessionStateVariableEntry" `
+            -ArgumentList $Variable.Name, $Variable.Value, ""
+        $State.Variables.Add($Entry)
+    }
+
+    $Files = @($PSCommandPath, $LibPath)
+    foreach ($Function in Get-Command -CommandType Function) {
+        if ($Files -notcontains $Function.ScriptBlock.File) {
+            continue
+        }
+        $Entry = New-Object "$Types.SessionStateFunctionEntry" `
+            -ArgumentList $Function.Name, $Function.Definition
+        $State.Commands.Add($Entry)
+    }
+
+    # NOTE: no $Host is passed on to the pool, so the "Write-Host" output of the
+    # handlers ends up in their "Information" stream instead of going straight
+    # to the console (see Complete-RequestJobs):
+    $Pool = [runspacefactory]::CreateRunspacePool($State)
+    $null = $Pool.SetMaxRunspaces($MaxThreads)
+    $Pool.Open()
+    Write-Host "Opened runspace pool ($MaxThreads threads)." @Yellow
+    return $Pool
+}
+
+
+function Complete-RequestJobs {
+    param (
+        [Parameter(Mandatory = $true)]
+        [System.Collections.Generic.List[object]]
+        $Jobs,
+
+        [Parameter(HelpMessage = "Wait for all jobs to complete.")]
+        [switch]
+        $All
+    )
+    foreach ($Job in @($Jobs)) {
+        if ((-not $All) -and (-not $Job.Handle.IsCompleted)) {
+            continue
+        }
+        try {
+            $null = $Job.PowerShell.EndInvoke($Job.Handle)
+        } catch {
+            Write-Host "Request handler failed: $_" @Red
+        }
+        # pass on the output of the handler (see the note on $Host in
+        # New-RequestRunspacePool) to the (possibly redirected) main stream:
+        foreach ($Record in $Job.PowerShell.Streams.Information) {
+            Write-Host "$($Record.MessageData)"
+        }
+        foreach ($Record in $Job.PowerShell.Streams.Error) {
+            Write-Host "Request handler error: $Record" @Red
+        }
+        $Job.PowerShell.Dispose()
+        $null = $Jobs.Remove($Job)
+    }
+}
+
+
+function Start-ListenerConcurrent {
     try {
         $Prefix = "http://localhost:$ListenPort/"
         $Listener = [System.Net.HttpListener]::new()
@@ -427,35 +1422,76 @@ function Start-ListenerBlocking {
             Write-Host "[$(Format-Date)] $ScriptName listening: $Prefix" @Yellow
         }
 
+        $Pool = New-RequestRunspacePool
+        $Jobs = [System.Collections.Generic.List[object]]::new()
+        $Handler = {
+            param ($Context)
+            $ErrorActionPreference = "Stop"
+            Invoke-RequestHandler -Context $Context
+        }
+
         while ($Listener.IsListening) {
-            try {
-                # when a request is made GetContext() will return it as an object:
-                $Context = $Listener.GetContext()
+            $Pending = $Listener.BeginGetContext($null, $null)
+            # collect finished requests while waiting for the next one:
+            while (-not $Pending.AsyncWaitHandle.WaitOne(200)) {
+                Complete-RequestJobs -Jobs $Jobs
+            }
+            $Context = $Listener.EndGetContext($Pending)
+            $ServerMetrics.Accepted += 1
+
+            if ($Context.Request.RawUrl -eq "/end") {
+                # handle the termination request right here, as its "break"
+                # needs to stop this very loop:
+                Complete-RequestJobs -Jobs $Jobs -All
+                Invoke-RequestHandler -Context $Context
+            }
 
-                $Request = $Context.Request
-                $Response = $Context.Response
+            $PowerShell = [powershell]::Create()
+            $PowerShell.RunspacePool = $Pool
+            $null = $PowerShell.AddScript($Handler).AddArgument($Context)
+            $Jobs.Add(@{
+                    PowerShell = $PowerShell
+                    Handle     = $PowerShell.BeginInvoke()
+                })
+            Complete-RequestJobs -Jobs $Jobs
+        }
 
-                if ($Request.HttpMethod -eq 'GET') {
-                    Switch-GetRequest -Request $Request
-                }
+    } catch {
+        Write-Host "Unexpected error, terminating: $_" @Red
 
-                if ($Request.HttpMethod -eq 'POST') {
-                    Switch-PostRequest -Request $Request
-                }
-            } catch {
-                $Message = "ERROR processing request"
-                Write-Host "$($Message): $_" @Red
-                try {
-                    Send-Response `
-                        -Response $Response `
-                        -StatusCode 400 `
-                        -ExecutionStatus 1 `
-                        -ErrorMessage $_ `
-                        -Body $Message
-                } catch {
-                    Write-Host "Unable to send the response: $_" @Red
-                }
-            }
+    } finally {
+        if ($null -ne $Jobs) {
+            Complete-RequestJobs -Jobs $Jobs -All
+        }
+        if ($null -ne $Pool) {
+            $Pool.Close()
+        }
+        if ($Listener.IsListening) {
+            Write-Host "Stopping HTTP listener..." @Yellow
+            $Listener.Stop()
+        }
+        Write-Host "[$(Format-Date)] $ScriptName terminated." @Yellow
+        Write-Host "----------------------------------------------------" @Blue
+    }
+}
+
+
+function Start-ListenerBlocking {
+    try {
+        $Prefix = "http://localhost:$ListenPort/"
+        $Listener = [System.Net.HttpListener]::new()
+        $Listener.Prefixes.Add($Prefix)
+        $Listener.Start()
+
+        if ($Listener.IsListening) {
+            Write-Host "[$(Format-Date)] $ScriptName listening: $Prefix" @Yellow
+        }
+
+        while ($Listener.IsListening) {
+            # when a request is made GetContext() will return it as an object:
+            $Context = $Listener.GetContext()
+            $ServerMetrics.Accepted += 1
+            Invoke-RequestHandler -Context $Context
         }
 
     } catch {
@@ -478,13 +1514,25 @@ function Start-ListenerLoop {
     Write-Host "Starting: $ScriptPath" @Blue
     Write-Host "PSyTricksVersion: $Version" @Blue
     Write-Host "Citrix 'AdminAddress': $AdminAddress" @Blue
+    if ($MaxThreads -gt 1) {
+        Write-Host "Concurrent requests: $MaxThreads" @Blue
+        Write-Host "Concurrent Delivery Controller calls: $MaxBrokerCalls" @Blue
+    }
+    foreach ($Route in $CacheTTLs.Keys) {
+        Write-Host "Caching [$Route] responses for $($CacheTTLs[$Route]) s" @Blue
+    }
     Write-Host "====================================================" @Blue
 
 
     while ($true) {
         Write-Host "++++++++++++++++++++++++++++++++++++++++++++++++++++" @Blue
         Write-Host "PID: [$PID]" @Blue
-        Start-ListenerBlocking
+        $ServerMetrics.ListenerStarts += 1
+        if ($MaxThreads -gt 1) {
+            Start-ListenerConcurrent
+        } else {
+            Start-ListenerBlocking
+        }
 
         Write-Host "HTTP listener was stopped, checking for shutdown file..." @Yellow
         $StopMarker = Join-Path $env:TEMP "_shutdown_restricks_server_"
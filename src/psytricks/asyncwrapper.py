@@ -0,0 +1,630 @@
+"""Asynchronous (`asyncio`) variant of the ResTricks wrapper.
+
+Requires the optional `httpx` dependency, which can be installed through the
+`async` extra, e.g. `pip install psytricks[async]`.
+"""
+
+import asyncio
+import codecs
+import json
+from typing import AsyncIterator, Iterable
+
+from loguru import logger as log
+
+try:
+    import httpx
+except ImportError as err:  # pragma: no cover
+    raise ImportError(
+        "The async wrapper requires 'httpx', install 'psytricks[async]'!"
+    ) from err
+
+from .cache import command_of
+from .literals import (
+    Action,
+    MachineFilter,
+    MachineProperty,
+    MsgStyle,
+    SessionFilter,
+    RequestName,
+    SessionProperty,
+)
+from .metrics import ClientMetrics
+from .streaming import NDJSON_TYPE, parser_for
+from .wrapper import ResTricksBase, validate_fields, validate_filters, with_query
+
+
+class AsyncResTricksWrapper(ResTricksBase):
+    """Perform non-blocking requests to a ResTricks service.
+
+    Provides the same request methods as `psytricks.wrapper.ResTricksWrapper`
+    but as coroutines, so they can be awaited from within an `asyncio` event
+    loop. Many requests can be issued at once (e.g. through `asyncio.gather`),
+    the number of requests being actually in flight at any time is limited by
+    `max_concurrency`.
+
+    As a constructor can't be awaited, the connection check is done either when
+    entering the wrapper as an async context manager or (if `lazy` is set to
+    `True`) right before the first request is sent.
+
+    Parameters
+    ----------
+    base_url : str, optional
+        The base URL where to find the ResTricks service. Will default to
+        `http://localhost:8080/` if nothing is specified.
+    verify : bool, optional
+        Validate the server version as soon as a connection is established. Set
+        to `False` to disable the version check and ignore potential problems
+        during the connection check.
+    lazy : bool, optional
+        By default entering the async context manager will establish the
+        connection to the ResTricks service. If this is set to `True`, the
+        connection will only be established once a request has to be sent.
+    max_concurrency : int, optional
+        The maximum number of requests being sent at the same time (a streamed
+        response being iterated over doesn't count, once its headers have been
+        received), which is also the number of idle connections to the ResTricks
+        service kept open for re-use, defaulting to 20.
+
+    Attributes
+    ----------
+    base_url : str
+        See the constructor for details.
+    timeout : int
+        The timeout in seconds to use for requests, defaulting to 5.
+    server_version : list
+        The server version as a list of version components, see
+        `psytricks.wrapper.ResTricksWrapper` for details.
+    headers : dict
+        A dict of headers to be sent along the requests.
+    client : httpx.AsyncClient
+        The client object holding the connection pool used for all requests.
+    metrics : psytricks.metrics.ClientMetrics
+        The latency histograms, payload sizes and error counters of the
+        requests sent by this wrapper.
+    capture : psytricks.capture.ResponseCapture or None
+        Captures (a sample of) the responses received, disabled by default.
+
+    Example
+    -------
+    ```Python
+    async with AsyncResTricksWrapper(base_url="http://localhost:8080/") as wrapper:
+        machines, sessions = await asyncio.gather(
+            wrapper.get_machine_status(),
+            wrapper.get_sessions(),
+        )
+    ```
+    """
+
+    def __init__(  # pylint: disable-msg=too-many-arguments
+        self,
+        base_url: str = "",
+        verify: bool = True,
+        lazy: bool = False,
+        max_concurrency: int = 20,
+    ):
+        self.base_url = "http://localhost:8080/" if not base_url else base_url
+        self.timeout = 5
+        self.server_version = [0, 0, 0, 0]
+
+        # FIXME: see the corresponding note in `ResTricksWrapper.__init__()`
+        self.headers = {"Host": "localhost"}
+        self.metrics = ClientMetrics()
+        self.capture = None
+
+        self._connected = False
+        self._verify = verify
+        self._lazy = lazy
+        self._read_only = False
+        self._dump_responses_to = None
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._connect_lock = asyncio.Lock()
+        self.client = httpx.AsyncClient(
+            # the number of requests is limited through the semaphore, not the
+            # pool (streamed responses keep their connection while iterating):
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=max_concurrency,
+            ),
+        )
+
+        log.debug(f"Initialized {self.__class__.__name__}({base_url}) ✨")
+
+    async def __aenter__(self):
+        """Enter the async context manager, connecting unless `lazy` was set."""
+        if not self._lazy:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        """Leave the async context manager, closing the client."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the client, releasing all pooled connections."""
+        await self.client.aclose()
+        self._connected = False
+
+    async def connect(self) -> None:
+        """Connect to the ResTricks service unless already connected.
+
+        Concurrent calls are serialized, so only a single connection check will
+        be performed even if many requests are started at once.
+
+        Raises
+        ------
+        ValueError
+            Raised in case the server version doesn't match the local version.
+        ConnectionError
+            Raised in case the initial connection check failed.
+        """
+        if self._connected:
+            log.trace("Connection 🔌 established previously, not reconnecting.")
+            return
+
+        async with self._connect_lock:
+            if self._connected:
+                return
+
+            log.debug(f"Trying to connect 🔌 to ResTricks server: {self.base_url}")
+
+            with self.metrics.timed("version", "connect"):
+                try:
+                    response = await self.send_get_request("version", auto_conn=False)
+                    status = response["Status"]
+                    log.trace(f"Server status: [{status}]")
+                    server_version = status["PSyTricksVersion"]
+
+                    log.debug("Successfully connected 🔌 to ResTricks server 🆗")
+                    if self._verify:
+                        version_matching = self.validate_version(server_version)
+                        if not version_matching:
+                            raise ValueError(
+                                f"Unexpected server version: {server_version}"
+                            )
+                    else:
+                        log.warning(
+                            f"Skipping version check (server: {server_version})"
+                        )
+                    self._connected = True
+
+                except Exception as ex:  # pylint: disable-msg=broad-except
+                    if self._verify:
+                        raise ConnectionError(
+                            f"Connecting to {self.base_url} failed: {ex}"
+                        ) from ex
+
+    async def send_get_request(
+        self, raw_url: str, auto_conn: bool = True
+    ) -> list[dict] | dict | None:
+        """Perform a `GET` request and process the response.
+
+        Parameters
+        ----------
+        raw_url : str
+            The part of the URL that will be appended to `self.base_url`.
+        auto_conn: bool, optional
+            If set to `True` (default), `self.connect()` will be awaited before
+            sending the request.
+
+        Returns
+        -------
+        list or dict or None
+            The parsed `JSON` of the response, often a dict or a list of dict.
+        """
+        if auto_conn:
+            await self.connect()
+
+        command = command_of(raw_url)
+        request = self.client.build_request(
+            "GET", self.base_url + raw_url, timeout=self.timeout, headers=self.headers
+        )
+        try:
+            response = await self._send(command, request)
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            log.error(f"GET request [{raw_url}] failed: {ex}")
+            raise ex
+
+        self._record_response(response)
+
+        try:
+            data = self._decode_content(command, response.content)
+        except json.JSONDecodeError as ex:
+            msg = (
+                f"Decoding JSON failed at pos {ex.pos}\n"
+                f"Response text (lim. to 500 chars):\n--\n{response.text[:500]}\n--\n"
+            )
+            log.error(msg)
+            raise json.JSONDecodeError(msg, doc=ex.doc, pos=ex.pos) from ex
+
+        self._check_response(response)
+
+        return data
+
+    async def send_post_request(
+        self, raw_url: str, payload: dict, no_json: bool = False
+    ) -> list[dict] | dict | None:
+        """Perform a `POST` request and process the response.
+
+        Respects the `read_only` instance attribute, see
+        `psytricks.wrapper.ResTricksWrapper.send_post_request` for details.
+
+        Parameters
+        ----------
+        raw_url : str
+            The part of the URL that will be appended to `self.base_url`.
+        payload : dict
+            The parameters to pass as `JSON` payload to the POST request.
+        no_json : bool
+            If set to `True` the response is expected to contain no `JSON` and
+            an empty list will be returned.
+
+        Returns
+        -------
+        list or dict or None
+            The parsed `JSON` of the response, often a dict or a list of dict.
+        """
+        await self.connect()
+
+        command = command_of(raw_url)
+        if self.read_only:
+            log.warning(
+                f"{self.__class__.__name__} is running in READ-ONLY mode, the "
+                f"following request has **NOT** been performed:\n"
+                f"> raw_url: [{raw_url}]\n"
+                f"> payload:\n------\n{payload}\n------\n"
+            )
+            self.metrics.count_read_only(command)
+            return [] if no_json else {"Data": []}
+
+        request = self.client.build_request(
+            "POST",
+            self.base_url + raw_url,
+            json=payload,
+            timeout=self.timeout,
+            headers=self.headers,
+        )
+        try:
+            response = await self._send(command, request)
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            log.error(f"POST request [{raw_url}] failed: {ex}")
+            raise ex
+
+        self._record_response(response)
+        self._check_response(response)
+
+        if no_json:
+            log.debug(f"No-payload response status code: {response.status_code}")
+            return []
+
+        return self._decode_content(command, response.content)
+
+    async def _send(self, command: str, request: httpx.Request) -> httpx.Response:
+        """Send a request and receive its response, recording both phases.
+
+        Parameters
+        ----------
+        command : str
+            The command name (for the metrics), e.g. `GetMachineStatus`.
+        request : httpx.Request
+            The request to send.
+
+        Returns
+        -------
+        httpx.Response
+            The response, with its body already received.
+        """
+        async with self._semaphore:
+            with self.metrics.timed(command, "request"):
+                response = await self.client.send(request, stream=True)
+            try:
+                with self.metrics.timed(command, "transfer"):
+                    await response.aread()
+            finally:
+                await response.aclose()
+        return response
+
+    async def _iter_data(
+        self, raw_url: str, envelope: dict | None = None
+    ) -> AsyncIterator[dict]:
+        """Perform a `GET` request and stream the items of its `Data` part.
+
+        See `psytricks.wrapper.ResTricksWrapper._iter_data` for details.
+
+        Parameters
+        ----------
+        raw_url : str
+            The part of the URL that will be appended to `self.base_url`.
+        envelope : dict, optional
+            A dict to be updated with the other top-level items of the response
+            (i.e. `Status`) once it has been received completely.
+
+        Yields
+        ------
+        dict
+        """
+        await self.connect()
+
+        command = command_of(raw_url)
+        headers = {**self.headers, "Accept": f"{NDJSON_TYPE}, application/json;q=0.9"}
+        request = self.client.build_request(
+            "GET", self.base_url + raw_url, timeout=self.timeout, headers=headers
+        )
+        response = None
+        size = 0
+        captured = None
+        try:
+            # only sending the request counts against `max_concurrency`, holding
+            # the slot while yielding would block callers sending requests from
+            # within the loop (and keep it if they stop iterating early):
+            async with self._semaphore:
+                with self.metrics.timed(command, "request"):
+                    response = await self.client.send(request, stream=True)
+            parser = parser_for(response.headers.get("Content-Type"))
+            if response.status_code != 200 or self.dump_responses_to:
+                await response.aread()
+                self._record_response(response)
+                self._check_response(response)
+            elif self.capture is not None and self.capture.wants(raw_url):
+                captured = []
+            # see the sync `_iter_data` (only the size is recorded):
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if captured is not None:
+                    captured.append(chunk)
+                for item in parser.feed(decoder.decode(chunk)):
+                    yield item
+            for item in parser.feed(decoder.decode(b"", final=True)):
+                yield item
+            for item in parser.close():
+                yield item
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            log.error(f"Streaming GET request [{raw_url}] failed: {ex}")
+            raise ex
+        finally:
+            if response is not None:
+                await response.aclose()
+
+        if captured is not None:
+            self.capture.record(response, raw_url, body=b"".join(captured))
+        self.metrics.observe_size(command, size)
+        log.debug(f"Streamed {parser.count} items from [{raw_url}].")
+        if envelope is not None:
+            envelope.update(parser.envelope)
+
+    async def _iter_listing(
+        self, command: RequestName, params: dict, page_size: int | None
+    ) -> AsyncIterator[dict]:
+        """Stream the items of a listing, optionally requesting it page by page.
+
+        See `psytricks.wrapper.ResTricksWrapper._iter_listing` for details.
+        """
+        cursor = None
+        while True:
+            query = params
+            if page_size:
+                query = {**params, "limit": page_size, "after": cursor}
+            envelope = {}
+            async for item in self._iter_data(with_query(command, query), envelope):
+                yield item
+            cursor = envelope.get("Status", {}).get("NextCursor")
+            if not page_size or not cursor:
+                return
+            log.trace(f"Requesting the next page of [{command}] after [{cursor}]")
+
+    async def get_machine_status(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> list:
+        """Send a `GET` request with `GetMachineStatus`.
+
+        See `psytricks.wrapper.ResTricksWrapper.get_machine_status` for details.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, by default all of them.
+        filters : dict, optional
+            Only request machines matching all of these filters.
+        """
+        log.debug("Requesting current status of machines...")
+        fields = validate_fields(fields, MachineProperty)
+        filters = validate_filters(filters, MachineFilter)
+        raw_url = with_query("GetMachineStatus", {"fields": fields, **filters})
+        return (await self.send_get_request(raw_url))["Data"]
+
+    async def get_sessions(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> list:
+        """Send a `GET` request with `GetSessions`.
+
+        See `psytricks.wrapper.ResTricksWrapper.get_sessions` for details.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, by default all of them.
+        filters : dict, optional
+            Only request sessions matching all of these filters.
+        """
+        log.debug("Requesting current sessions...")
+        fields = validate_fields(fields, SessionProperty)
+        filters = validate_filters(filters, SessionFilter)
+        raw_url = with_query("GetSessions", {"fields": fields, **filters})
+        return (await self.send_get_request(raw_url))["Data"]
+
+    async def iter_machines(
+        self,
+        fields: Iterable[str] | None = None,
+        filters: dict | None = None,
+        page_size: int | None = None,
+    ) -> AsyncIterator[dict]:
+        """Stream the machine status records of a `GetMachineStatus` request.
+
+        See `psytricks.wrapper.ResTricksWrapper.iter_machines` for details, use
+        it through `async for`.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, by default all of them.
+        filters : dict, optional
+            Only request machines matching all of these filters.
+        page_size : int, optional
+            Request the listing in pages of (at most) this many machines.
+        """
+        log.debug("Streaming current status of machines...")
+        fields = validate_fields(fields, MachineProperty)
+        filters = validate_filters(filters, MachineFilter)
+        params = {"fields": fields, **filters}
+        async for item in self._iter_listing("GetMachineStatus", params, page_size):
+            yield item
+
+    async def iter_sessions(
+        self,
+        fields: Iterable[str] | None = None,
+        filters: dict | None = None,
+        page_size: int | None = None,
+    ) -> AsyncIterator[dict]:
+        """Stream the session records of a `GetSessions` request.
+
+        See `psytricks.wrapper.ResTricksWrapper.iter_sessions` for details, use
+        it through `async for`.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, by default all of them.
+        filters : dict, optional
+            Only request sessions matching all of these filters.
+        page_size : int, optional
+            Request the listing in pages of (at most) this many sessions.
+        """
+        log.debug("Streaming current sessions...")
+        fields = validate_fields(fields, SessionProperty)
+        filters = validate_filters(filters, SessionFilter)
+        params = {"fields": fields, **filters}
+        async for item in self._iter_listing("GetSessions", params, page_size):
+            yield item
+
+    async def disconnect_session(self, machine: str) -> dict:
+        """Send a `POST` request with `DisconnectSession`.
+
+        See `psytricks.wrapper.ResTricksWrapper.disconnect_session` for details.
+
+        Parameters
+        ----------
+        machine : str
+            The FQDN of the machine to disconnect the session on.
+        """
+        log.debug(f"Requesting session on [{machine}] to be disconnected...")
+        payload = {"DNSName": machine}
+        session = (await self.send_post_request("DisconnectSession", payload))["Data"]
+        if session is None:
+            log.debug(f"No data received, probably [{machine}] has no session.")
+            return {}
+
+        return session
+
+    async def get_access_users(self, group: str) -> list:
+        """Send a `GET` request with `GetAccessUsers`.
+
+        See `psytricks.wrapper.ResTricksWrapper.get_access_users` for details.
+
+        Parameters
+        ----------
+        group : str
+            The name of the Delivery Group to request users having access.
+        """
+        log.debug(f"Requesting users having access to group [{group}]...")
+        return (await self.send_get_request(f"GetAccessUsers/{group}"))["Data"]
+
+    async def set_access_users(self, group: str, users: str, disable: bool) -> list:
+        """Send a `POST` request with `SetAccessUsers`.
+
+        See `psytricks.wrapper.ResTricksWrapper.set_access_users` for details.
+
+        Parameters
+        ----------
+        group : str
+            The name of the Delivery Group to request users having access.
+        users : str
+            A string with one or more (comma-separated) usernames.
+        disable : bool
+            A flag requesting the permissions for the given username(s) to be
+            removed (if True) instead of being added (if False).
+        """
+        verb = "Removing" if disable else "Adding"
+        log.debug(f"{verb} access to group [{group}] for user(s) [{users}]...")
+        payload = {
+            "Group": group,
+            "UserNames": users,
+            "RemoveAccess": disable,
+        }
+        return (await self.send_post_request("SetAccessUsers", payload))["Data"]
+
+    async def set_maintenance(self, machine: str, disable: bool) -> dict:
+        """Send a `POST` request with `SetMaintenanceMode`.
+
+        See `psytricks.wrapper.ResTricksWrapper.set_maintenance` for details.
+
+        Parameters
+        ----------
+        machine : str
+            The FQDN of the machine to modify maintenance mode on.
+        disable : bool
+            A flag requesting maintenance mode for the given machine(s) to be
+            turned off (if True) instead of being turned on (if False).
+        """
+        verb = "Disabling" if disable else "Enabling"
+        log.debug(f"{verb} maintenance mode on [{machine}]...")
+        payload = {
+            "DNSName": machine,
+            "Disable": disable,
+        }
+        return (await self.send_post_request("SetMaintenanceMode", payload))["Data"]
+
+    async def send_message(
+        self, machine: str, message: str, title: str, style: MsgStyle
+    ) -> None:
+        """Send a `POST` request with `SendSessionMessage`.
+
+        Parameters
+        ----------
+        machine : str
+            The FQDN of the machine to send the message to.
+        message : str
+            The message body.
+        title : str
+            The message title.
+        style : str
+            The message style defining the icon shown in the pop-up message as
+            defined in `psytricks.literals.MsgStyle`.
+        """
+        log.debug(f'Sending a pop-up message ("{title}") to [{machine}]...')
+        payload = {
+            "DNSName": machine,
+            "Text": message,
+            "Title": title,
+            "MessageStyle": style,
+        }
+        await self.send_post_request("SendSessionMessage", payload, no_json=True)
+
+    async def perform_poweraction(self, machine: str, action: Action) -> dict:
+        """Send a `POST` request with `MachinePowerAction`.
+
+        See `psytricks.wrapper.ResTricksWrapper.perform_poweraction` for details.
+
+        Parameters
+        ----------
+        machine : str
+            The FQDN of the machine to perform the power action on.
+        action : str
+            The power action to perform, one of `psytricks.literals.Action`.
+        """
+        log.debug(f"Requesting action [{action}] for machine [{machine}]...")
+        payload = {
+            "DNSName": machine,
+            "Action": action,
+        }
+        return (await self.send_post_request("MachinePowerAction", payload))["Data"]
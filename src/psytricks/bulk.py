@@ -0,0 +1,293 @@
+"""Bulk operations running many wrapper calls through a bounded worker pool."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+
+from loguru import logger as log
+
+from .literals import Action, MsgStyle
+from .metrics import ClientMetrics, MetricEvent
+
+
+@dataclass
+class MachineResult:
+    """The outcome of a single call of a bulk operation.
+
+    Attributes
+    ----------
+    machine : str
+        The FQDN of the machine the call was performed for.
+    success : bool
+        `True` in case the call returned without raising an exception and
+        without an error being reported by the service.
+    data : Any
+        The value returned by the call (kept even if the service reported an
+        error, as it usually carries the error details).
+    error : Exception or None
+        The exception raised by the call or a `RuntimeError` describing the
+        error reported by the service (only if it failed).
+    elapsed : float
+        The time in seconds it took to perform the call.
+    """
+
+    machine: str
+    success: bool
+    data: Any = None
+    error: Exception | None = None
+    elapsed: float = 0.0
+
+
+@dataclass
+class BulkResult:
+    """The collected per-machine results of a bulk operation.
+
+    Attributes
+    ----------
+    results : dict(str, MachineResult)
+        The results keyed by machine FQDN, in the order of completion.
+    elapsed : float
+        The time in seconds it took to perform the entire bulk operation.
+    """
+
+    results: dict[str, MachineResult] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def successes(self) -> list[MachineResult]:
+        """The results of all calls that were successful."""
+        return [x for x in self.results.values() if x.success]
+
+    @property
+    def failures(self) -> list[MachineResult]:
+        """The results of all calls that have failed."""
+        return [x for x in self.results.values() if not x.success]
+
+    @property
+    def ok(self) -> bool:
+        """`True` in case none of the calls has failed."""
+        return not self.failures
+
+
+def run_many(
+    func: Callable,
+    machines: Iterable[str],
+    *args,
+    max_workers: int = 8,
+    metrics: ClientMetrics | None = None,
+) -> BulkResult:
+    """Call a function once per machine through a bounded thread pool.
+
+    Exceptions raised by the individual calls are caught and recorded in the
+    corresponding `MachineResult`, i.e. a failing call will **not** abort the
+    remaining ones.
+
+    As the ResTricks wrappers don't raise on error responses (but count them in
+    their metrics), a call is also considered as failed if an `error` event is
+    emitted by `metrics` while it is running (in the same thread).
+
+    Parameters
+    ----------
+    func : Callable
+        The function to call, taking the machine FQDN as the first argument.
+    machines : Iterable[str]
+        The FQDNs of the machines to call the function for (duplicates will
+        only be processed once).
+    *args
+        Any additional positional arguments to pass on to each call.
+    max_workers : int, optional
+        The maximum number of calls to run in parallel, by default 8.
+    metrics : ClientMetrics, optional
+        The metrics of the wrapper `func` belongs to, used to detect errors
+        reported by the service. By default `None` (only exceptions count).
+
+    Returns
+    -------
+    BulkResult
+    """
+    # metrics hooks are called synchronously in the thread sending the request:
+    last_error = threading.local()
+
+    def track_errors(event: MetricEvent) -> None:
+        if event.kind == "error":
+            last_error.value = f"{event.command} failed: {event.error}"
+
+    def timed_call(machine: str) -> MachineResult:
+        last_error.value = None
+        tstart = time.perf_counter()
+        try:
+            data = func(machine, *args)
+            if last_error.value is None:
+                result = MachineResult(machine, True, data=data)
+            else:
+                error = RuntimeError(last_error.value)
+                log.error(
+                    f"Bulk call [{func.__name__}] failed for [{machine}]: {error}"
+                )
+                result = MachineResult(machine, False, data=data, error=error)
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            log.error(f"Bulk call [{func.__name__}] failed for [{machine}]: {ex}")
+            result = MachineResult(machine, False, error=ex)
+        result.elapsed = time.perf_counter() - tstart
+        return result
+
+    machines = list(dict.fromkeys(machines))
+    log.debug(
+        f"Running [{func.__name__}] for {len(machines)} machines "
+        f"({max_workers} workers)..."
+    )
+    bulk = BulkResult()
+    if metrics is not None:
+        metrics.add_hook(track_errors)
+    tstart = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(timed_call, machine) for machine in machines]
+            for future in as_completed(futures):
+                result = future.result()
+                bulk.results[result.machine] = result
+    finally:
+        if metrics is not None:
+            metrics.remove_hook(track_errors)
+    bulk.elapsed = time.perf_counter() - tstart
+
+    log.debug(
+        f"Bulk [{func.__name__}] done in {bulk.elapsed:.3}s: "
+        f"{len(bulk.successes)} succeeded, {len(bulk.failures)} failed."
+    )
+    return bulk
+
+
+class BulkActionsMixin:
+    """Bulk variants of the wrapper *action* methods.
+
+    Meant to be mixed into a wrapper class providing the methods
+    `set_maintenance()`, `perform_poweraction()`, `disconnect_session()` and
+    `send_message()`. As each single call is done through those methods, any
+    restriction they apply (e.g. the `read_only` mode of
+    `psytricks.wrapper.ResTricksWrapper`) is respected for every machine. If
+    the wrapper has a `metrics` attribute, errors reported through it are
+    recorded as failures as well (see `run_many()`).
+
+    Attributes
+    ----------
+    bulk_workers : int
+        The default number of calls to run in parallel (class variable!).
+    """
+
+    bulk_workers = 8
+
+    def set_maintenance_many(
+        self, machines: Iterable[str], disable: bool, max_workers: int | None = None
+    ) -> BulkResult:
+        """Call `set_maintenance()` for many machines in parallel.
+
+        Parameters
+        ----------
+        machines : Iterable[str]
+            The FQDNs of the machines to modify maintenance mode on.
+        disable : bool
+            A flag requesting maintenance mode to be turned off (if True)
+            instead of being turned on (if False).
+        max_workers : int, optional
+            The number of calls to run in parallel, defaults to `bulk_workers`.
+
+        Returns
+        -------
+        BulkResult
+        """
+        return run_many(
+            self.set_maintenance,
+            machines,
+            disable,
+            max_workers=max_workers or self.bulk_workers,
+            metrics=getattr(self, "metrics", None),
+        )
+
+    def perform_poweraction_many(
+        self, machines: Iterable[str], action: Action, max_workers: int | None = None
+    ) -> BulkResult:
+        """Call `perform_poweraction()` for many machines in parallel.
+
+        Parameters
+        ----------
+        machines : Iterable[str]
+            The FQDNs of the machines to perform the power action on.
+        action : str
+            The power action to perform, one of `psytricks.literals.Action`.
+        max_workers : int, optional
+            The number of calls to run in parallel, defaults to `bulk_workers`.
+
+        Returns
+        -------
+        BulkResult
+        """
+        return run_many(
+            self.perform_poweraction,
+            machines,
+            action,
+            max_workers=max_workers or self.bulk_workers,
+            metrics=getattr(self, "metrics", None),
+        )
+
+    def disconnect_sessions_many(
+        self, machines: Iterable[str], max_workers: int | None = None
+    ) -> BulkResult:
+        """Call `disconnect_session()` for many machines in parallel.
+
+        Parameters
+        ----------
+        machines : Iterable[str]
+            The FQDNs of the machines to disconnect the sessions on.
+        max_workers : int, optional
+            The number of calls to run in parallel, defaults to `bulk_workers`.
+
+        Returns
+        -------
+        BulkResult
+        """
+        return run_many(
+            self.disconnect_session,
+            machines,
+            max_workers=max_workers or self.bulk_workers,
+            metrics=getattr(self, "metrics", None),
+        )
+
+    def send_message_many(  # pylint: disable-msg=too-many-arguments
+        self,
+        machines: Iterable[str],
+        message: str,
+        title: str,
+        style: MsgStyle,
+        max_workers: int | None = None,
+    ) -> BulkResult:
+        """Call `send_message()` for many machines in parallel.
+
+        Parameters
+        ----------
+        machines : Iterable[str]
+            The FQDNs of the machines to send the message to.
+        message : str
+            The message body.
+        title : str
+            The message title.
+        style : str
+            The message style, one of `psytricks.literals.MsgStyle`.
+        max_workers : int, optional
+            The number of calls to run in parallel, defaults to `bulk_workers`.
+
+        Returns
+        -------
+        BulkResult
+        """
+        return run_many(
+            self.send_message,
+            machines,
+            message,
+            title,
+            style,
+            max_workers=max_workers or self.bulk_workers,
+            metrics=getattr(self, "metrics", None),
+        )
@@ -0,0 +1,213 @@
+"""Time-based cache for the results of read-only (GET) requests."""
+
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable
+
+from loguru import logger as log
+
+INVALIDATED_BY = {
+    "DisconnectSession": ["GetSessions", "GetMachineStatus"],
+    "MachinePowerAction": ["GetMachineStatus"],
+    "SetAccessUsers": ["GetAccessUsers/{Group}"],
+    "SetMaintenanceMode": ["GetMachineStatus"],
+}
+"""Cache keys to invalidate after a successful `POST` request of a command.
+
+Placeholders in curly braces will be filled in from the request's payload.
+"""
+
+
+def command_of(key: str) -> str:
+    """Get the command of a key, e.g. `GetSessions?fields=Uid` -> `GetSessions`."""
+    return key.split("?")[0].split("/")[0]
+
+
+class ResponseCache:
+    """A thread-safe cache with per-command TTLs and background revalidation.
+
+    Entries are keyed by the request URL part (e.g. `GetMachineStatus` or
+    `GetAccessUsers/<group>` or `GetSessions?fields=Uid`), the *command* of an
+    entry is the first component of its key (see `command_of()`), so e.g. all
+    projections of a listing share the same TTL and are invalidated together.
+    Values are returned as-is, i.e. the very same object will be handed out to
+    all callers until the entry expires - make sure to not modify it in place!
+
+    An entry that is older than its TTL but still within the `stale_ttl` grace
+    period will be returned immediately while a background thread fetches a
+    fresh value (*stale-while-revalidate*). Entries that are older than that are
+    fetched synchronously.
+
+    Parameters
+    ----------
+    ttls : dict(str, float), optional
+        Time-to-live in seconds per command, e.g. `{"GetSessions": 2.0}`.
+        Commands not listed here will use `default_ttl`, a TTL of `0` disables
+        caching for a command.
+    default_ttl : float, optional
+        The TTL for commands not listed in `ttls`, by default 5 seconds.
+    stale_ttl : float, optional
+        The grace period in seconds after expiry during which a stale entry is
+        served while being refreshed in the background, by default 0 (meaning
+        no stale entries will be served).
+    max_entries : int, optional
+        The maximum number of entries to keep, the least recently used ones will
+        be evicted when exceeded (relevant for parameterised requests like
+        `GetAccessUsers/<group>`), by default 64.
+
+    Attributes
+    ----------
+    stats : dict(str, collections.Counter)
+        Counters per command for `hits`, `stale_hits`, `misses`, `refreshes`,
+        `invalidations` and `evictions`.
+    """
+
+    def __init__(
+        self,
+        ttls: dict[str, float] | None = None,
+        default_ttl: float = 5.0,
+        stale_ttl: float = 0.0,
+        max_entries: int = 64,
+    ):
+        self.ttls = ttls if ttls else {}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.stats: dict[str, Counter] = {}
+
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._refreshing: set[str] = set()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, counter: str) -> None:
+        command = command_of(key)
+        self.stats.setdefault(command, Counter())[counter] += 1
+
+    def ttl(self, key: str) -> float:
+        """Get the TTL for a cache key (based on its command).
+
+        Parameters
+        ----------
+        key : str
+            The cache key, e.g. `GetAccessUsers/<group>`.
+
+        Returns
+        -------
+        float
+        """
+        return self.ttls.get(command_of(key), self.default_ttl)
+
+    def _store(self, key: str, value: Any, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                # an invalidation happened while fetching, the value is outdated:
+                log.trace(f"Not storing outdated value for [{key}]")
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._count(evicted, "evictions")
+                log.trace(f"Evicted cache entry [{evicted}] 🗑️")
+
+    def _refresh(self, key: str, loader: Callable[[], Any], generation: int) -> None:
+        try:
+            self._store(key, loader(), generation)
+            log.trace(f"Refreshed cache entry [{key}] in the background 🔄")
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            log.warning(f"Background refresh of [{key}] failed: {ex}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Get a value from the cache, calling `loader` to fetch it if required.
+
+        Parameters
+        ----------
+        key : str
+            The cache key, e.g. `GetMachineStatus`.
+        loader : Callable
+            A function without arguments fetching the (fresh) value.
+
+        Returns
+        -------
+        Any
+            The cached or freshly fetched value.
+        """
+        ttl = self.ttl(key)
+        if ttl <= 0:
+            return loader()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                self._entries.move_to_end(key)
+                if age < ttl:
+                    self._count(key, "hits")
+                    return entry[1]
+
+                if age < ttl + self.stale_ttl:
+                    self._count(key, "stale_hits")
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._count(key, "refreshes")
+                        threading.Thread(
+                            target=self._refresh,
+                            args=(key, loader, self._generation),
+                            daemon=True,
+                        ).start()
+                    return entry[1]
+
+            self._count(key, "misses")
+            generation = self._generation
+
+        value = loader()
+        self._store(key, value, generation)
+        return value
+
+    def invalidate(self, key: str | None = None) -> None:
+        """Remove entries from the cache.
+
+        Parameters
+        ----------
+        key : str, optional
+            The key of the entry to remove. If the key doesn't contain a `/`,
+            all entries of that command will be removed (e.g. `GetAccessUsers`
+            will remove the entries for all groups). If omitted, the entire
+            cache will be cleared.
+        """
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+                return
+
+            if "/" in key:
+                keys = [key] if key in self._entries else []
+            else:
+                keys = [x for x in self._entries if command_of(x) == key]
+
+            for stale in keys:
+                del self._entries[stale]
+                self._count(stale, "invalidations")
+                log.trace(f"Invalidated cache entry [{stale}] ♻️")
+
+    def invalidate_after(self, command: str, payload: dict) -> None:
+        """Invalidate the entries affected by a (successful) `POST` request.
+
+        Parameters
+        ----------
+        command : str
+            The command of the request, e.g. `SetMaintenanceMode`.
+        payload : dict
+            The payload that was sent along the request.
+        """
+        for key in INVALIDATED_BY.get(command, []):
+            try:
+                self.invalidate(key.format(**payload))
+            except KeyError:
+                self.invalidate(command_of(key))
@@ -0,0 +1,353 @@
+"""Sampled capture of responses, safe to be used in production.
+
+Unlike `dump_responses_to` (which synchronously writes every response to a new
+file), a `ResponseCapture` only keeps a reference to the body of each response
+in a bounded in-memory ring buffer. Writing happens in a background thread, into
+gzip-compressed JSON-lines files that are rotated by size. Which responses end
+up on disk is controlled by:
+
+* `rate` - the fraction of responses to write right away (sampling).
+* `commands` - the commands to capture at all, e.g. `["GetMachineStatus"]`.
+* `on_error` - write the ring buffer (i.e. the responses leading up to the
+  error) as soon as an error response is received. Setting `rate` to `0` and
+  `buffer_size` to `0` captures nothing but the failing responses.
+
+The buffer can also be written explicitly via `ResponseCapture.flush()`, e.g.
+when the caller runs into an error of its own:
+
+```Python
+wrapper.capture = ResponseCapture(Path("/var/log/psytricks"), rate=0.01)
+try:
+    process(wrapper.get_machine_status())
+except Exception:
+    wrapper.capture.flush()
+    raise
+```
+
+Each line of the capture files holds the same items as the `.meta.json` files
+of `dump_responses_to` plus `timestamp` and `body`, so they can be replayed by
+`psytricks.replay.ReplayServer` as well.
+"""
+
+# pylint: disable-msg=too-many-arguments,too-many-instance-attributes
+
+import atexit
+import collections
+import gzip
+import json
+import queue
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable
+
+from loguru import logger as log
+
+from .cache import command_of
+
+CAPTURE_PATTERN = "capture-*.jsonl.gz"
+"""The name pattern of the files written by `ResponseCapture`."""
+
+
+def response_latency(response) -> float | None:
+    """Get the time in seconds it took for a response to arrive.
+
+    Parameters
+    ----------
+    response : requests.Response or httpx.Response
+        The response to check.
+
+    Returns
+    -------
+    float or None
+        The `elapsed` time of the response, `None` in case it's not available
+        (e.g. a streamed `httpx` response that hasn't been closed yet).
+    """
+    try:
+        return round(response.elapsed.total_seconds(), 6)
+    except (AttributeError, RuntimeError):
+        return None
+
+
+@dataclass
+class CapturedResponse:
+    """A response held in the ring buffer of a `ResponseCapture`."""
+
+    timestamp: float
+    url: str
+    method: str
+    status: int
+    content_type: str
+    latency: float | None
+    body: bytes
+
+    def to_json(self) -> str:
+        """Serialize the response to a single line of JSON."""
+        record = asdict(self)
+        record["body"] = self.body.decode("utf8", errors="replace")
+        return json.dumps(record)
+
+
+class ResponseCapture:
+    """Capture (a sample of) the responses received by a wrapper.
+
+    Assign an instance to the `capture` attribute of a wrapper to enable it.
+
+    Parameters
+    ----------
+    path : Path
+        The (existing) directory to write the capture files to.
+    rate : float, optional
+        The fraction of responses to write right away, by default 0 (meaning
+        responses are only written when flushing the buffer).
+    commands : iterable(str), optional
+        The commands to capture, by default all of them.
+    on_error : bool, optional
+        Flush the buffer when an error response (HTTP status 400 or higher) is
+        received, by default `True`.
+    buffer_size : int, optional
+        The maximum number of responses kept in the ring buffer, by default 50.
+    buffer_bytes : int, optional
+        The maximum total size of the bodies kept in the ring buffer, by default
+        16 MiB. The oldest responses are discarded first.
+    max_file_size : int, optional
+        The (compressed) size in bytes after which a new file is started, by
+        default 10 MiB.
+    max_files : int, optional
+        The number of files to keep, older ones are deleted, by default 10.
+    max_pending : int, optional
+        The maximum number of responses waiting to be written. If the writer
+        can't keep up, further responses are dropped instead of piling up in
+        memory. By default 1000.
+
+    Attributes
+    ----------
+    written : int
+        The number of responses written to disk.
+    dropped : int
+        The number of responses dropped as the writer couldn't keep up.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        rate: float = 0.0,
+        commands: Iterable[str] | None = None,
+        on_error: bool = True,
+        buffer_size: int = 50,
+        buffer_bytes: int = 16 * 1024 * 1024,
+        max_file_size: int = 10 * 1024 * 1024,
+        max_files: int = 10,
+        max_pending: int = 1000,
+    ):
+        if not path.is_dir():
+            raise ValueError(f"Path needs to be an existing directory: {path}")
+
+        self.path = path
+        self.rate = rate
+        self.commands = set(commands) if commands is not None else None
+        self.on_error = on_error
+        self.buffer_bytes = buffer_bytes
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+
+        self._buffer: collections.deque[CapturedResponse] = collections.deque(
+            maxlen=buffer_size
+        )
+        self._buffered_bytes = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: threading.Thread | None = None
+        self._file = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def wants(self, url: str) -> bool:
+        """Check if responses to a request URL are captured (see `commands`).
+
+        Parameters
+        ----------
+        url : str
+            The request URL relative to the service, e.g. `GetSessions`.
+
+        Returns
+        -------
+        bool
+        """
+        return self.commands is None or command_of(url) in self.commands
+
+    def record(self, response, url: str, body: bytes | None = None) -> None:
+        """Record a (fully received) response.
+
+        This is called by the wrappers for every response and only does the
+        bookkeeping, writing is left to the background thread.
+
+        Parameters
+        ----------
+        response : requests.Response or httpx.Response
+            The response to record.
+        url : str
+            The request URL relative to the service, e.g. `GetSessions`.
+        body : bytes, optional
+            The body of the response, required if it has been streamed (i.e. it
+            is not available as `response.content` any more).
+        """
+        if not self.wants(url):
+            return
+
+        entry = CapturedResponse(
+            timestamp=time.time(),
+            url=url,
+            method=response.request.method,
+            status=response.status_code,
+            content_type=response.headers.get("Content-Type", ""),
+            latency=response_latency(response),
+            body=response.content if body is None else body,
+        )
+
+        if entry.status >= 400 and self.on_error:
+            with self._lock:
+                pending = list(self._buffer)
+                self._clear()
+            log.warning(f"Error response for [{url}], flushing captures 🚨")
+            self._enqueue(pending + [entry])
+        elif self.rate and self._rng.random() < self.rate:
+            self._enqueue([entry])
+        else:
+            with self._lock:
+                self._append(entry)
+
+    def flush(self) -> int:
+        """Write the responses currently held in the ring buffer.
+
+        Returns
+        -------
+        int
+            The number of responses handed over to the writer.
+        """
+        with self._lock:
+            pending = list(self._buffer)
+            self._clear()
+        return self._enqueue(pending)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write all pending responses and stop the writer thread.
+
+        Responses still held in the ring buffer are discarded (call `flush()`
+        first to keep them).
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time in seconds to wait for the writer, by default 10.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout)
+            self._writer = None
+
+    def _append(self, entry: CapturedResponse) -> None:
+        """Add a response to the ring buffer (the lock has to be held)."""
+        if self._buffer.maxlen == 0:
+            return
+
+        if len(self._buffer) == self._buffer.maxlen:
+            self._buffered_bytes -= len(self._buffer[0].body)
+        self._buffer.append(entry)
+        self._buffered_bytes += len(entry.body)
+        while self._buffered_bytes > self.buffer_bytes and self._buffer:
+            self._buffered_bytes -= len(self._buffer.popleft().body)
+
+    def _clear(self) -> None:
+        """Empty the ring buffer (the lock has to be held)."""
+        self._buffer.clear()
+        self._buffered_bytes = 0
+
+    def _enqueue(self, entries: list[CapturedResponse]) -> int:
+        """Hand responses over to the writer thread (starting it if required)."""
+        if not entries or self._closed:
+            return 0
+
+        if self._queue.qsize() + len(entries) > self.max_pending:
+            self.dropped += len(entries)
+            log.warning(f"Capture writer is lagging, dropped {len(entries)} 🗑️")
+            return 0
+
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="psytricks-capture", daemon=True
+                )
+                self._writer.start()
+        for entry in entries:
+            self._queue.put(entry)
+        return len(entries)
+
+    def _write_loop(self) -> None:
+        """Write queued responses until `close()` is called."""
+        running = True
+        while running:
+            entries = [self._queue.get()]
+            # drain the queue, so a whole batch is written with a single flush:
+            while not self._queue.empty():
+                entries.append(self._queue.get_nowait())
+            if None in entries:
+                running = False
+                entries = [x for x in entries if x is not None]
+
+            try:
+                self._write(entries)
+            except Exception as ex:  # pylint: disable-msg=broad-except
+                log.error(f"🔥 Error writing captured responses: {ex}")
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entries: list[CapturedResponse]) -> None:
+        """Append responses to the current file, rotating it if required."""
+        if not entries:
+            return
+
+        if self._file is None:
+            self._file = self._open_new_file()
+        for entry in entries:
+            self._file.write(entry.to_json().encode("utf8") + b"\n")
+        # make the responses available on disk right away (e.g. in case the
+        # process is about to crash), at the cost of a slightly worse ratio:
+        self._file.flush()
+        self.written += len(entries)
+
+        if self._file.fileobj.tell() >= self.max_file_size:
+            self._file.close()
+            self._file = None
+
+    def _open_new_file(self) -> gzip.GzipFile:
+        """Start a new capture file, removing the oldest ones beyond `max_files`."""
+        timestamp = int(time.time_ns() / 1000000)
+        target = self.path / f"capture-{timestamp}.jsonl.gz"
+        while target.exists():
+            timestamp += 1
+            target = self.path / f"capture-{timestamp}.jsonl.gz"
+
+        existing = sorted(
+            self.path.glob(CAPTURE_PATTERN),
+            key=lambda x: int(x.name.split("-")[1].split(".")[0]),
+        )
+        for outdated in existing[: max(0, len(existing) - self.max_files + 1)]:
+            log.debug(f"Removing outdated capture file [{outdated}]")
+            outdated.unlink()
+
+        log.debug(f"Writing captured responses to [{target}] 📼")
+        return gzip.GzipFile(target, mode="wb", compresslevel=6)
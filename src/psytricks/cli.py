@@ -2,14 +2,35 @@
 
 # pylint: disable-msg=too-many-arguments
 
+import csv
+import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pprint import pprint, pformat
+from typing import IO, Any
 
 import click
 from loguru import logger as log
 
 from . import __version__
-from .wrapper import PSyTricksWrapper
+from .wrapper import PSyTricksWrapper, ResTricksWrapper
+
+BATCH_OPTIONS = (
+    "machine",
+    "group",
+    "action",
+    "message",
+    "title",
+    "style",
+    "users",
+    "disable",
+)
+"""The items of a batch line passed on as options of the command."""
+
+STREAMED_COMMANDS = {"machines": "iter_machines", "sessions": "iter_sessions"}
+"""The listing commands and the wrapper methods streaming their records."""
 
 
 def configure_logging(verbose: int):
@@ -35,13 +56,362 @@ def configure_logging(verbose: int):
     log.info(f"Set logging level to [{level}] ({verbose}).")
 
 
+def create_wrapper(
+    backend: str,
+    cdc: str | None = None,
+    url: str = "",
+    read_only: bool = False,
+    verify: bool = True,
+    timeout: float | None = None,
+    retries: int = 0,
+    workers: int = 1,
+    persistent: bool = False,
+) -> PSyTricksWrapper | ResTricksWrapper:
+    """Create the wrapper for the backend selected on the command line.
+
+    Parameters
+    ----------
+    backend : str
+        Either `ps` (run the PowerShell commands locally, requires `cdc`) or
+        `rest` (send requests to a ResTricks service at `url`).
+    cdc : str, optional
+        The address of the Citrix Delivery Controller (`ps` only).
+    url : str, optional
+        The base URL of the ResTricks service (`rest` only), by default
+        `http://localhost:8080/`.
+    read_only : bool, optional
+        Don't perform any state-changing requests (`rest` only), see
+        `psytricks.wrapper.ResTricksBase.read_only`.
+    verify : bool, optional
+        Validate the version of the ResTricks service (`rest` only).
+    timeout : float, optional
+        The time in seconds to wait for a command / request, by default the one
+        of the wrapper class.
+    retries : int, optional
+        The number of times a failed `GET` request is retried (`rest` only).
+    workers : int, optional
+        The number of commands to be run concurrently, by default 1.
+    persistent : bool, optional
+        Use persistent PowerShell processes (`ps` only).
+
+    Returns
+    -------
+    PSyTricksWrapper or ResTricksWrapper
+
+    Raises
+    ------
+    click.UsageError
+        Raised in case an option isn't supported by the selected backend.
+    """
+    if backend == "rest":
+        wrapper = ResTricksWrapper(
+            base_url=url,
+            verify=verify,
+            pool_size=max(10, workers),
+            retries=retries,
+        )
+        wrapper.read_only = read_only
+        if timeout is not None:
+            wrapper.timeout = timeout
+        return wrapper
+
+    if cdc is None:
+        raise click.UsageError("Backend 'ps' requires --cdc!")
+    if read_only:
+        raise click.UsageError("Option --read-only requires '--backend rest'!")
+    return PSyTricksWrapper(
+        deliverycontroller=cdc, persistent=persistent, timeout=timeout, workers=workers
+    )
+
+
+def perform_command(
+    wrapper,
+    command: str,
+    machine: str | None = None,
+    group: str | None = None,
+    action: str | None = None,
+    message: str | None = None,
+    title: str | None = None,
+    style: str = "information",
+    users: str | None = None,
+    disable: bool = False,
+) -> Any:
+    """Call the wrapper method corresponding to a command of the CLI.
+
+    Parameters
+    ----------
+    wrapper : PSyTricksWrapper
+        The wrapper to use.
+    command : str
+        The command indicating which wrapper method to call, e.g. `machines`.
+    machine, group, action, message, title, style, users, disable
+        The options of the command, see `run_cli()`.
+
+    Returns
+    -------
+    Any
+        The details returned by the wrapper method.
+
+    Raises
+    ------
+    click.UsageError
+        Raised in case the command is unknown or an option required by it is
+        missing.
+    """
+    details = ""
+
+    if command == "machines":
+        details = wrapper.get_machine_status()
+
+    elif command == "sessions":
+        details = wrapper.get_sessions()
+
+    elif command == "disconnect":
+        if machine is None:
+            raise click.UsageError("Command 'disconnect' requires --machine!")
+        details = wrapper.disconnect_session(machine)
+
+    elif command == "getaccess":
+        if group is None:
+            raise click.UsageError("Command 'getaccess' requires --group!")
+        details = wrapper.get_access_users(group)
+
+    elif command == "setaccess":
+        if users is None:
+            raise click.UsageError("Command 'setaccess' requires --users!")
+        if group is None:
+            raise click.UsageError("Command 'setaccess' requires --group!")
+        details = wrapper.set_access_users(group, users, disable)
+
+    elif command == "poweraction":
+        if machine is None:
+            raise click.UsageError("Command 'poweraction' requires --machine!")
+        if action is None:
+            raise click.UsageError("Command 'poweraction' requires --action!")
+        details = wrapper.perform_poweraction(machine, action)
+
+    elif command == "sendmessage":
+        style = style[0].upper() + style[1:]
+        if machine is None:
+            raise click.UsageError("Command 'sendmessage' requires --machine!")
+        if message is None:
+            raise click.UsageError("Command 'sendmessage' requires --message!")
+        if title is None:
+            raise click.UsageError("Command 'sendmessage' requires --title!")
+        wrapper.send_message(machine, message, title, style)
+
+    elif command == "maintenance":
+        if machine is None:
+            raise click.UsageError("Command 'maintenance' requires --machine!")
+        details = wrapper.set_maintenance(machine, disable)
+
+    else:
+        raise click.UsageError(f"Unknown command: [{command}]")
+
+    return details
+
+
+def _json_default(obj: Any) -> Any:
+    """Serialize the objects not supported by `json` (e.g. timestamps)."""
+    return obj.isoformat() if isinstance(obj, datetime) else str(obj)
+
+
+def _csv_value(value: Any) -> Any:
+    """Flatten a value for a CSV cell (nested values are written as JSON)."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    return value
+
+
+def write_records(details: Any, fh: IO[str], output_format: str) -> int:
+    """Write the output of a command one record after another.
+
+    Parameters
+    ----------
+    details : Any
+        The output of the command, either a list or an iterator of records (as
+        for the listing commands) or a single object.
+    fh : IO[str]
+        The file to write to.
+    output_format : str
+        One of `json` (a single JSON document), `ndjson` (one JSON object per
+        line) or `csv` (a header line with the properties of the first record
+        and one line per record).
+
+    Returns
+    -------
+    int
+        The number of records written.
+    """
+    if isinstance(details, (dict, str)) or details is None:
+        if output_format == "json":
+            fh.write(json.dumps(details, default=_json_default) + "\n")
+            return 1
+        details = [] if details in ("", None) else [details]
+
+    count = 0
+    writer = None
+    if output_format == "json":
+        fh.write("[")
+    for record in details:
+        if output_format == "csv":
+            if writer is None:
+                fieldnames = list(record) if isinstance(record, dict) else ["Value"]
+                writer = csv.DictWriter(fh, fieldnames, extrasaction="ignore")
+                writer.writeheader()
+            if not isinstance(record, dict):
+                record = {"Value": record}
+            writer.writerow({k: _csv_value(v) for k, v in record.items()})
+        elif output_format == "json":
+            prefix = ",\n" if count else "\n"
+            fh.write(prefix + json.dumps(record, default=_json_default))
+        else:
+            fh.write(json.dumps(record, default=_json_default) + "\n")
+        count += 1
+    if output_format == "json":
+        fh.write("\n]\n" if count else "]\n")
+
+    return count
+
+
+def run_batch(wrapper, infile: IO[str], outfile: IO[str], concurrency: int) -> int:
+    """Run commands read as JSON lines, writing a result line for each of them.
+
+    Every input line is an object with a `command` item and the options of that
+    command (named like the CLI options, e.g. `{"command": "maintenance",
+    "machine": "vm1.example.xy", "disable": true}`), optionally an `id` that
+    will be copied into the result. The results are written in the order the
+    commands finish, each one as a JSON object having the `line` number of the
+    input, the `command`, `ok`, `result` and / or `error` (failed requests to
+    a ResTricks service may come with both).
+
+    Parameters
+    ----------
+    wrapper : PSyTricksWrapper
+        The wrapper to use for all commands.
+    infile : IO[str]
+        The file to read the commands from.
+    outfile : IO[str]
+        The file to write the results to.
+    concurrency : int
+        The number of commands to run at the same time.
+
+    Returns
+    -------
+    int
+        The number of failed commands.
+    """
+    write_lock = threading.Lock()
+    # don't read (much) further ahead than the commands can be processed:
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    failed = 0
+
+    # the ResTricks wrappers don't raise on error responses but count them in
+    # their metrics (synchronously, i.e. in the thread sending the request):
+    last_error = threading.local()
+
+    def track_errors(event) -> None:
+        if event.kind == "error":
+            last_error.value = f"{event.command} failed: {event.error}"
+
+    def process(lineno: int, line: str) -> None:
+        nonlocal failed
+        result: dict[str, Any] = {"line": lineno}
+        last_error.value = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise click.UsageError("Expecting a JSON object per line!")
+            if "id" in request:
+                result["id"] = request["id"]
+            result["command"] = request.get("command")
+            unknown = set(request) - set(BATCH_OPTIONS) - {"id", "command"}
+            if unknown:
+                raise click.UsageError(f"Unknown options: {sorted(unknown)}")
+            options = {k: v for k, v in request.items() if k in BATCH_OPTIONS}
+            details = perform_command(wrapper, result["command"], **options)
+            result.update(ok=last_error.value is None, result=details)
+            if last_error.value is not None:
+                result["error"] = last_error.value
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            log.error(f"Batch line {lineno} failed: {ex}")
+            result.update(ok=False, error=f"{ex.__class__.__name__}: {ex}")
+        finally:
+            slots.release()
+
+        output = json.dumps(result, default=_json_default)
+        with write_lock:
+            if not result["ok"]:
+                failed += 1
+            outfile.write(output + "\n")
+            outfile.flush()
+
+    wrapper.metrics.add_hook(track_errors)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for lineno, line in enumerate(infile, start=1):
+                if not line.strip():
+                    continue
+                slots.acquire()  # pylint: disable-msg=consider-using-with
+                pool.submit(process, lineno, line)
+    finally:
+        wrapper.metrics.remove_hook(track_errors)
+
+    return failed
+
+
 @click.command(help="Run the PSyTricks command line interface.", no_args_is_help=True)
 @click.version_option(__version__)
+@click.option(
+    "--backend",
+    type=click.Choice(["ps", "rest"]),
+    default="ps",
+    show_default=True,
+    help=(
+        "Run the PowerShell commands locally ('ps') or use a ResTricks service "
+        "('rest', see --url)."
+    ),
+)
 @click.option(
     "--cdc",
     type=str,
-    help="The address of the Citrix Delivery Controller (CDC) to connect to.",
-    required=True,
+    help=(
+        "The address of the Citrix Delivery Controller (CDC) to connect to. "
+        "[required for: '--backend ps']"
+    ),
+)
+@click.option(
+    "--url",
+    type=str,
+    default="http://localhost:8080/",
+    show_default=True,
+    help="The base URL of the ResTricks service. [applies to: '--backend rest']",
+)
+@click.option(
+    "--read-only",
+    is_flag=True,
+    help=(
+        "Don't perform any requests changing the state of the Citrix platform, "
+        "only log them. [applies to: '--backend rest']"
+    ),
+)
+@click.option(
+    "--no-verify",
+    is_flag=True,
+    help="Skip the version check of the service. [applies to: '--backend rest']",
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Retry failed GET requests this many times. [applies to: '--backend rest']",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    help="The time in seconds to wait for a command to complete.",
 )
 @click.option(
     "-v",
@@ -63,8 +433,7 @@ def configure_logging(verbose: int):
             "setaccess",
         ]
     ),
-    required=True,
-    help="The command to perform.",
+    help="The command to perform. [required unless using --batch]",
 )
 @click.option(
     "--machine",
@@ -128,13 +497,45 @@ def configure_logging(verbose: int):
         "[applies to: 'maintenance', 'setaccess']"
     ),
 )
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["pprint", "json", "ndjson", "csv"]),
+    default="pprint",
+    show_default=True,
+    help=(
+        "The output format, all but 'pprint' are written record by record (and "
+        "the records of 'machines' and 'sessions' as they are being received)."
+    ),
+)
 @click.option(
     "--outfile",
     type=click.Path(dir_okay=False, writable=True),
     help="The path to a file to write the output into (default=stdout).",
 )
+@click.option(
+    "--batch",
+    type=click.File("r", encoding="utf-8"),
+    help=(
+        "Run the commands read as JSON lines from a file ('-' for stdin), "
+        'e.g. {"command": "maintenance", "machine": "vm1.example.xy"}, writing '
+        "a JSON result line for each of them."
+    ),
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=1,
+    help="The number of batch commands to run at the same time (default=1).",
+)
 def run_cli(
+    backend,
     cdc,
+    url,
+    read_only,
+    no_verify,
+    retries,
+    timeout,
     verbose,
     command,
     machine,
@@ -145,71 +546,127 @@ def run_cli(
     style,
     users,
     disable,
+    output_format,
     outfile,
+    batch,
+    concurrency,
 ):
     """Create a wrapper object and call the method requested on the command line.
 
     Parameters
     ----------
+    backend : str
+        The backend to use, `ps` or `rest`.
     cdc : str
         The address of the Citrix Delivery Controller (CDC) to connect to.
+    url : str
+        The base URL of the ResTricks service (`rest` backend only).
+    read_only : bool
+        Only log requests changing the state of the Citrix platform instead of
+        performing them (`rest` backend only).
+    no_verify : bool
+        Skip the version check of the service (`rest` backend only).
+    retries : int
+        The number of times to retry failed `GET` requests (`rest` backend only).
+    timeout : float or None
+        The time in seconds to wait for a command to complete.
     verbose : int
         The logging verbosity.
-    command : str
-        The command indicating which wrapper method to call.
+    command : str or None
+        The command indicating which wrapper method to call, required unless
+        `batch` is given.
+    machine : str or None
+        The FQDN of the machine to perform an action on.
+    group : str or None
+        The name of the Delivery Group to get or set the access users of.
+    action : str or None
+        The power action to perform, see `psytricks.literals.Action`.
+    message : str or None
+        The body of the message to send.
+    title : str or None
+        The title of the message to send.
+    style : str
+        The style of the message to send, see `psytricks.literals.MsgStyle`.
+    users : str or None
+        A comma-separated list of usernames to set the access for.
+    disable : bool
+        Turn maintenance mode off or remove access instead of adding it.
+    output_format : str
+        The output format, one of `pprint`, `json`, `ndjson` or `csv`.
+    outfile : str or None
+        The file to append the output to, by default it's written to `stdout`.
+    batch : file or None
+        A file to read the commands to run from (as JSON lines), see
+        `run_batch()`.
+    concurrency : int
+        The number of batch commands to run at the same time.
     """
     configure_logging(verbose)
-    wrapper = PSyTricksWrapper(deliverycontroller=cdc)
-    details = ""
-
-    if command == "machines":
-        details = wrapper.get_machine_status()
-
-    if command == "sessions":
-        details = wrapper.get_sessions()
-
-    elif command == "disconnect":
-        if machine is None:
-            raise click.UsageError("Command 'disconnect' requires --machine!")
-        details = wrapper.disconnect_session(machine)
+    options = {
+        "backend": backend,
+        "cdc": cdc,
+        "url": url,
+        "read_only": read_only,
+        "verify": not no_verify,
+        "timeout": timeout,
+        "retries": retries,
+    }
 
-    elif command == "getaccess":
-        if group is None:
-            raise click.UsageError("Command 'getaccess' requires --group!")
-        details = wrapper.get_access_users(group)
-
-    elif command == "setaccess":
-        if users is None:
-            raise click.UsageError("Command 'setaccess' requires --users!")
-        if group is None:
-            raise click.UsageError("Command 'setaccess' requires --group!")
-        details = wrapper.set_access_users(group, users, disable)
+    if batch is not None:
+        # a batch is processed by persistent PowerShell processes, so neither
+        # the interpreter nor the snap-in have to be loaded for every command:
+        wrapper = create_wrapper(**options, workers=concurrency, persistent=True)
+        try:
+            if outfile:
+                with open(outfile, "a", encoding="utf-8") as fh:
+                    failed = run_batch(wrapper, batch, fh, concurrency)
+            else:
+                failed = run_batch(wrapper, batch, sys.stdout, concurrency)
+        finally:
+            wrapper.close()
+        if failed:
+            log.warning(f"{failed} batch command(s) failed.")
+            sys.exit(1)
+        return
 
-    elif command == "poweraction":
-        if machine is None:
-            raise click.UsageError("Command 'poweraction' requires --machine!")
-        if action is None:
-            raise click.UsageError("Command 'poweraction' requires --action!")
-        details = wrapper.perform_poweraction(machine, action)
+    if command is None:
+        raise click.UsageError("Missing option '--command' (or use '--batch')!")
 
-    elif command == "sendmessage":
-        style = style[0].upper() + style[1:]
-        if machine is None:
-            raise click.UsageError("Command 'sendmessage' requires --machine!")
-        if message is None:
-            raise click.UsageError("Command 'sendmessage' requires --message!")
-        if title is None:
-            raise click.UsageError("Command 'sendmessage' requires --title!")
-        wrapper.send_message(machine, message, title, style)
+    wrapper = create_wrapper(**options)
+    try:
+        if output_format != "pprint" and command in STREAMED_COMMANDS:
+            details = getattr(wrapper, STREAMED_COMMANDS[command])()
+        else:
+            details = perform_command(
+                wrapper,
+                command,
+                machine=machine,
+                group=group,
+                action=action,
+                message=message,
+                title=title,
+                style=style,
+                users=users,
+                disable=disable,
+            )
 
-    elif command == "maintenance":
-        if machine is None:
-            raise click.UsageError("Command 'maintenance' requires --machine!")
-        details = wrapper.set_maintenance(machine, disable)
+        if output_format != "pprint":
+            if outfile:
+                with open(outfile, "a", encoding="utf-8", newline="") as fh:
+                    count = write_records(details, fh, output_format)
+                log.success(f"Done writing {count} record(s) into [{outfile}].")
+            else:
+                write_records(details, sys.stdout, output_format)
+        elif outfile:
+            with open(outfile, "a", encoding="utf-8") as fh:
+                fh.writelines(pformat(details))
+            log.success(f"Done writing output into [{outfile}].")
+        else:
+            pprint(details)
 
-    if outfile:
-        with open(outfile, "a", encoding="utf-8") as fh:
-            fh.writelines(pformat(details))
-        log.success(f"Done writing output into [{outfile}].")
-    else:
-        pprint(details)
+        # error responses of the service are only logged (and counted):
+        if wrapper.metrics.errors:
+            log.error(f"Command '{command}' failed: {list(wrapper.metrics.errors)}")
+            sys.exit(1)
+    finally:
+        wrapper.close()
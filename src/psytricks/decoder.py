@@ -1,12 +1,23 @@
-"""PowerShell JSON decoding helper."""
+"""PowerShell JSON decoding helpers."""
 
+import json
 import re
 from datetime import datetime
+from typing import Any, get_args
 
 from loguru import logger as log
 
+from .literals import MachineProperty, SessionProperty
 from .mappings import by_keyword
 
+_DATE_SPLIT = re.compile(r"\(|\)")
+
+_FLAT_KEYS = frozenset(get_args(MachineProperty) + get_args(SessionProperty))
+"""Keys known to never contain nested objects that would need decoding."""
+
+_plans: dict[tuple, tuple] = {}
+"""Cache of conversion plans, keyed by the tuple of keys of an object."""
+
 
 def parse_powershell_json(json_dict):
     """Process PowerShell 5.1 / Citrix JSON.
@@ -42,7 +53,7 @@ def parse_powershell_json(json_dict):
         # log.trace(f"{key} -> {value}")
         if key.endswith("Time") and value is not None and "/Date(" in value:
             log.trace(f"{key} -> {value}")
-            epoch_ms = re.split(r"\(|\)", value)[1]
+            epoch_ms = _DATE_SPLIT.split(value)[1]
             ret[key] = datetime.fromtimestamp(int(epoch_ms[:10]))
         elif key in by_keyword:
             mapping = by_keyword[key]
@@ -58,3 +69,132 @@ def parse_powershell_json(json_dict):
             ret[key] = value
 
     return ret
+
+
+def _plan(keys: tuple) -> tuple:
+    """Assemble the conversion plan for objects having the given keys.
+
+    Parameters
+    ----------
+    keys : tuple(str)
+        The keys of the object (in their original order).
+
+    Returns
+    -------
+    tuple
+        A tuple with three items: the keys of potential timestamp values, tuples
+        of keys and mapping dicts for state values and a flag indicating if the
+        object may contain nested objects (i.e. if not all keys are known to
+        hold plain values).
+    """
+    plan = (
+        tuple(key for key in keys if key.endswith("Time")),
+        tuple((key, by_keyword[key]) for key in keys if key in by_keyword),
+        not _FLAT_KEYS.issuperset(keys),
+    )
+    # object key sets are very limited, but better be safe than sorry:
+    if len(_plans) < 1024:
+        _plans[keys] = plan
+    return plan
+
+
+def _map_value(value: Any) -> str:
+    """Generate the replacement for an unmappable state value (and log it)."""
+    mapped_value = f"undefined-mapping-{value}"
+    log.error(f"No mapping for value '{value}' - using '{mapped_value}'!")
+    return mapped_value
+
+
+def convert_powershell_objects(obj: Any) -> Any:
+    """Apply the PowerShell / Citrix conversions to already decoded JSON.
+
+    Performs the same conversions as `parse_powershell_json` (timestamps and
+    state values) but in-place on the objects returned by a plain call to
+    `json.loads()`, which is a lot faster than using an `object_hook`:
+
+    * Only the keys that may need a conversion are visited, based on a plan
+      that is created once per distinct set of keys (in practice this is one
+      plan for all machines and one for all sessions of a listing).
+    * Objects having only keys of the known machine / session properties (see
+      `psytricks.literals.MachineProperty` and
+      `psytricks.literals.SessionProperty`) are not searched for nested objects.
+    * Timestamps are parsed without using regular expressions and no logging is
+      done unless a state value can't be mapped.
+
+    Parameters
+    ----------
+    obj : Any
+        The decoded JSON, usually a dict or a list of dicts.
+
+    Returns
+    -------
+    Any
+        The very same object, with conversions applied.
+    """
+    if isinstance(obj, list):
+        plan_keys, plan = None, None
+        for item in obj:
+            if item.__class__ is dict:
+                # consecutive objects usually share their keys (and hence the plan):
+                keys = tuple(item)
+                if keys != plan_keys:
+                    plan_keys = keys
+                    plan = _plans.get(keys) or _plan(keys)
+                _apply_plan(item, plan)
+            elif item.__class__ is list:
+                convert_powershell_objects(item)
+        return obj
+
+    if obj.__class__ is dict:
+        keys = tuple(obj)
+        _apply_plan(obj, _plans.get(keys) or _plan(keys))
+
+    return obj
+
+
+def _apply_plan(obj: dict, plan: tuple) -> None:
+    """Convert the values of an object in-place according to a plan."""
+    time_keys, state_keys, nested = plan
+
+    for key in time_keys:
+        value = obj[key]
+        if value.__class__ is str and value.startswith("/Date("):
+            obj[key] = datetime.fromtimestamp(int(value[6 : value.find(")", 6)][:10]))
+
+    for key, mapping in state_keys:
+        value = obj[key]
+        try:
+            obj[key] = mapping[value]
+        except (KeyError, TypeError):
+            obj[key] = _map_value(value)
+
+    if nested:
+        for value in obj.values():
+            if value.__class__ is dict or value.__class__ is list:
+                convert_powershell_objects(value)
+
+
+def decode_powershell_json(text: str | bytes) -> Any:
+    """Decode PowerShell 5.1 / Citrix JSON (fast path).
+
+    Equivalent to `json.loads(text, object_hook=parse_powershell_json)` but
+    considerably faster on large payloads, see `convert_powershell_objects` for
+    details.
+
+    Parameters
+    ----------
+    text : str or bytes
+        The JSON document, e.g. the body of a response or the output of the
+        PowerShell wrapper script.
+
+    Returns
+    -------
+    Any
+        The decoded and converted JSON, usually a dict or a list of dicts.
+
+    Raises
+    ------
+    json.JSONDecodeError
+        Raised in case `text` is not a valid JSON document.
+    """
+    return convert_powershell_objects(json.loads(text))
@@ -0,0 +1,248 @@
+"""Change detection between machine / session snapshots.
+
+Instead of comparing full listings in every consumer, `diff_snapshots()` compares
+two `psytricks.tables.Snapshot` objects (keyed by `DNSName` for machines and by
+`Uid` for sessions) and returns one `ChangeEvent` per added or removed record
+and per changed field. The `WatchMixin` builds a polling `watch()` generator on
+top of it, yielding only the events, e.g.
+
+```Python
+for event in wrapper.watch():
+    if event.field == "RegistrationState":
+        print(f"{event.key}: {event.old} -> {event.new}")
+```
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator
+
+from loguru import logger as log
+
+from .literals import ChangeKind
+from .tables import MachineTable, RecordTable, SessionTable, Snapshot
+
+
+@dataclass
+class ChangeEvent:
+    """A single change between two snapshots.
+
+    Attributes
+    ----------
+    kind : str
+        The kind of change, one of `psytricks.literals.ChangeKind`.
+    table : str
+        The listing the record belongs to, either `machines` or `sessions`.
+    key : Any
+        The key of the record, i.e. its `DNSName` (machines) or `Uid`
+        (sessions).
+    field : str or None
+        The name of the changed field (only for `changed` events).
+    old : Any
+        The previous value of the field (only for `changed` events).
+    new : Any
+        The current value of the field (only for `changed` events).
+    record : dict or None
+        The current record (for `removed` events the last known one).
+    """
+
+    kind: ChangeKind
+    table: str
+    key: Any
+    field: str | None = None
+    old: Any = None
+    new: Any = None
+    record: dict | None = None
+
+    def __str__(self) -> str:
+        """Describe the change in a single line."""
+        if self.kind == "changed":
+            return f"[{self.key}] {self.field}: {self.old!r} -> {self.new!r}"
+        return f"[{self.key}] {self.kind} ({self.table})"
+
+
+def diff_records(
+    old: Iterable[dict],
+    new: Iterable[dict],
+    key_field: str,
+    table: str = "",
+    ignore: Iterable[str] = (),
+) -> list[ChangeEvent]:
+    """Compare two listings of records.
+
+    Records are matched through their `key_field`. Records being equal (which
+    is checked first, in one go) don't produce any events, so the work done
+    per unchanged record is a single dict lookup and comparison.
+
+    Parameters
+    ----------
+    old : Iterable[dict]
+        The previous records.
+    new : Iterable[dict]
+        The current records.
+    key_field : str
+        The name of the field identifying a record, e.g. `DNSName`.
+    table : str, optional
+        The name of the listing, will be put into the events.
+    ignore : Iterable[str], optional
+        Names of fields whose changes should not be reported.
+
+    Returns
+    -------
+    list(ChangeEvent)
+        The `removed` events first, followed by the `added` and `changed` ones
+        in the order of the current records. A field missing from one of the
+        two records is reported with a value of `None` on that side.
+    """
+    ignore = set(ignore)
+    before = {x.get(key_field): x for x in old}
+    events = []
+    current = set()
+    for record in new:
+        key = record.get(key_field)
+        current.add(key)
+        previous = before.get(key)
+        if previous is None:
+            events.append(ChangeEvent("added", table, key, record=record))
+            continue
+        if previous == record:
+            continue
+        # fields that are gone from the current record are changes as well:
+        fields = list(record) + [x for x in previous if x not in record]
+        for field in fields:
+            if field in ignore:
+                continue
+            old_value = previous.get(field)
+            value = record.get(field)
+            if old_value != value:
+                events.append(
+                    ChangeEvent(
+                        "changed", table, key, field, old_value, value, record=record
+                    )
+                )
+
+    removed = [
+        ChangeEvent("removed", table, key, record=record)
+        for key, record in before.items()
+        if key not in current
+    ]
+    return removed + events
+
+
+def diff_tables(
+    old: RecordTable, new: RecordTable, ignore: Iterable[str] = ()
+) -> list[ChangeEvent]:
+    """Compare two tables of the same type, see `diff_records()` for details.
+
+    Parameters
+    ----------
+    old : psytricks.tables.RecordTable
+        The previous table, e.g. a `MachineTable`.
+    new : psytricks.tables.RecordTable
+        The current table, of the same type as `old`.
+    ignore : Iterable[str], optional
+        Names of fields whose changes should not be reported.
+
+    Returns
+    -------
+    list(ChangeEvent)
+    """
+    table = "machines" if isinstance(new, MachineTable) else "sessions"
+    return diff_records(old, new, new.key_field, table, ignore)
+
+
+def diff_snapshots(
+    old: Snapshot, new: Snapshot, ignore: Iterable[str] = ()
+) -> list[ChangeEvent]:
+    """Compare two snapshots, see `diff_records()` for details.
+
+    Parameters
+    ----------
+    old : psytricks.tables.Snapshot
+        The previous snapshot.
+    new : psytricks.tables.Snapshot
+        The current snapshot.
+    ignore : Iterable[str], optional
+        Names of fields whose changes should not be reported.
+
+    Returns
+    -------
+    list(ChangeEvent)
+        The events of the machines followed by the ones of the sessions.
+    """
+    return diff_tables(old.machines, new.machines, ignore) + diff_tables(
+        old.sessions, new.sessions, ignore
+    )
+
+
+class WatchMixin:
+    """Polling change detection for the wrapper classes.
+
+    Meant to be mixed into a wrapper class providing the methods
+    `get_machine_table()` and `get_session_table()`.
+    """
+
+    def _poll_snapshot(self, machines: bool, sessions: bool) -> Snapshot:
+        return Snapshot(
+            self.get_machine_table() if machines else MachineTable([]),
+            self.get_session_table() if sessions else SessionTable([]),
+        )
+
+    def watch(  # pylint: disable-msg=too-many-arguments
+        self,
+        min_interval: float = 2.0,
+        max_interval: float = 30.0,
+        machines: bool = True,
+        sessions: bool = True,
+        ignore: Iterable[str] = (),
+    ) -> Iterator[ChangeEvent]:
+        """Poll the machines / sessions and yield the changes between polls.
+
+        The polling interval adapts to the amount of change: it is halved
+        (down to `min_interval`) after a poll that found changes and grows by
+        half (up to `max_interval`) after one that found none. The first poll
+        only establishes the baseline and doesn't yield any events. Failing
+        polls (e.g. a temporary connection problem) are logged and retried
+        after `max_interval`.
+
+        Note that in case a `psytricks.cache.ResponseCache` is set on the
+        wrapper, changes can only be detected once its entries have expired.
+
+        Parameters
+        ----------
+        min_interval : float, optional
+            The minimum time in seconds between two polls, by default 2.
+        max_interval : float, optional
+            The maximum time in seconds between two polls, by default 30.
+        machines : bool, optional
+            Watch the machines (`get_machine_table()`), by default `True`.
+        sessions : bool, optional
+            Watch the sessions (`get_session_table()`), by default `True`.
+        ignore : Iterable[str], optional
+            Names of fields whose changes should not be reported.
+
+        Yields
+        ------
+        ChangeEvent
+            The changes, in the order described in `diff_snapshots()`.
+        """
+        ignore = tuple(ignore)
+        interval = min_interval
+        snapshot = self._poll_snapshot(machines, sessions)
+        while True:
+            time.sleep(interval)
+            try:
+                current = self._poll_snapshot(machines, sessions)
+            except Exception as ex:  # pylint: disable-msg=broad-except
+                log.warning(f"Polling for changes failed, retrying: {ex}")
+                interval = max_interval
+                continue
+
+            events = diff_snapshots(snapshot, current, ignore)
+            snapshot = current
+            if events:
+                interval = max(min_interval, interval / 2)
+            else:
+                interval = min(max_interval, interval * 1.5)
+            log.trace(f"Found {len(events)} changes, next poll in {interval:.3}s.")
+            yield from events
@@ -2,7 +2,6 @@
 
 from typing import Literal
 
-
 RequestName = Literal[
     "DisconnectSession",
     "GetAccessUsers",
@@ -29,3 +28,66 @@ Action = Literal[
 
 MsgStyle = Literal["Information", "Exclamation", "Critical", "Question"]
 """Valid style names to be used for desktop pop-up messages."""
+
+
+MachineProperty = Literal[
+    "AgentVersion",
+    "AssociatedUserUPNs",
+    "DesktopGroupName",
+    "DNSName",
+    "HostedDNSName",
+    "InMaintenanceMode",
+    "PowerState",
+    "RegistrationState",
+    "SessionClientVersion",
+    "SessionDeviceId",
+    "SessionStartTime",
+    "SessionStateChangeTime",
+    "SessionUserName",
+    "SummaryState",
+]
+"""Machine properties selected by `Get-MachineStatus` (`$MachineProperties`)."""
+
+SessionProperty = Literal[
+    "ClientAddress",
+    "ClientName",
+    "ClientPlatform",
+    "ClientProductId",
+    "ClientVersion",
+    "ConnectedViaHostName",
+    "DesktopGroupName",
+    "DNSName",
+    "MachineSummaryState",
+    "Protocol",
+    "SessionState",
+    "SessionStateChangeTime",
+    "StartTime",
+    "Uid",
+    "UserName",
+    "UserUPN",
+]
+"""Session properties selected by `Get-Sessions` (`$SessionProperties`)."""
+
+MachineFilter = Literal[
+    "DesktopGroupName",
+    "DNSName",
+    "InMaintenanceMode",
+    "PowerState",
+    "SummaryState",
+    "UserName",
+]
+"""Filters supported by `Get-MachineStatus` (`$MachineFilters`)."""
+
+SessionFilter = Literal[
+    "DesktopGroupName",
+    "DNSName",
+    "SummaryState",
+    "UserName",
+]
+"""Filters supported by `Get-Sessions` (`$SessionFilters`)."""
+
+ChangeKind = Literal["added", "removed", "changed"]
+"""Kinds of changes between two snapshots, see `psytricks.diff.ChangeEvent`."""
+
+MetricPhase = Literal["connect", "request", "transfer", "decode", "mapping"]
+"""Phases of a request recorded by `psytricks.metrics.ClientMetrics`."""
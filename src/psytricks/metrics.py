@@ -0,0 +1,413 @@
+"""Client-side latency metrics and tracing hooks.
+
+Every wrapper carries a `ClientMetrics` object (as its `metrics` attribute),
+recording the duration of each phase of a request per command in a
+`Histogram`:
+
+* `connect` - establishing the connection to the service (the version check of
+  the ResTricks wrappers) or starting the persistent PowerShell process(es).
+* `request` - sending the request until the response headers are received (for
+  the PowerShell wrapper: running the command).
+* `transfer` - receiving the response body (for the PowerShell wrapper:
+  decoding the output of the process).
+* `decode` - parsing the JSON.
+* `mapping` - converting timestamps and state values, see
+  `psytricks.decoder.convert_powershell_objects`.
+
+On top of that the sizes of the response payloads, errors (per command, phase
+and type) and requests suppressed by the `read_only` mode are counted. The
+metrics can be inspected through `ClientMetrics.snapshot()`, e.g.
+
+```Python
+wrapper.get_machine_status()
+latency = wrapper.metrics.snapshot()["latency"]["GetMachineStatus"]["request"]
+print(f"p95: {latency['p95']:.3f}s ({latency['count']} requests)")
+```
+
+For forwarding the measurements to other systems, hook callbacks receiving
+every single `MetricEvent` can be registered via `ClientMetrics.add_hook()`.
+Setting `ClientMetrics.tracer` to an OpenTelemetry tracer (or any object
+providing a compatible `start_as_current_span()` method) will additionally
+create a span for each recorded phase.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator
+
+from loguru import logger as log
+
+from .literals import MetricPhase
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+"""Default upper bounds (in seconds) of the latency histogram buckets."""
+
+SIZE_BUCKETS = tuple(2**x for x in range(8, 29, 2))
+"""Default upper bounds (in bytes, 256 B to 256 MiB) of the payload buckets."""
+
+
+@dataclass
+class MetricEvent:
+    """A single measurement, as handed to the hooks of `ClientMetrics`.
+
+    Attributes
+    ----------
+    kind : str
+        The kind of measurement: `latency` (a duration in seconds), `size` (a
+        payload size in bytes), `error` or `read_only` (an intercepted `POST`
+        request).
+    command : str
+        The command the measurement belongs to, e.g. `GetMachineStatus` (or
+        `version` for the connection check of the ResTricks wrappers).
+    phase : str
+        The phase of the request (see `psytricks.literals.MetricPhase`), empty
+        for `size` and `read_only` events.
+    value : float
+        The duration / size, `1` for counted events.
+    error : str
+        The type of the error (only for `error` events), e.g. `ConnectTimeout`
+        or `HTTP 500`.
+    """
+
+    kind: str
+    command: str
+    phase: str = ""
+    value: float = 1
+    error: str = ""
+
+
+class Histogram:
+    """A histogram with fixed buckets, e.g. for latencies.
+
+    Parameters
+    ----------
+    buckets : tuple(float)
+        The (sorted) upper bounds of the buckets, values exceeding the last
+        one are counted in an additional overflow bucket.
+
+    Attributes
+    ----------
+    buckets : tuple(float)
+        The upper bounds of the buckets.
+    counts : list(int)
+        The number of observations per bucket (non-cumulative), having one
+        item more than `buckets` for the overflow bucket.
+    count : int
+        The total number of observations.
+    total : float
+        The sum of all observed values.
+    min : float or None
+        The smallest observed value.
+    max : float or None
+        The largest observed value.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    def observe(self, value: float) -> None:
+        """Add an observation to the histogram (not thread-safe by itself)."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate a quantile by interpolating linearly within its bucket.
+
+        Parameters
+        ----------
+        q : float
+            The quantile to estimate, e.g. `0.95`.
+
+        Returns
+        -------
+        float or None
+            The estimate (clamped to the observed `min` and `max` values) or
+            `None` if nothing has been observed yet.
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - cumulative) / count
+                return min(max(estimate, self.min), self.max)
+            cumulative += count
+
+        return self.max
+
+    def as_dict(self) -> dict:
+        """Summarize the histogram, e.g. for serializing it to JSON.
+
+        Returns
+        -------
+        dict
+            The `count`, `sum`, `min`, `max`, the estimated `p50`, `p95` and
+            `p99` quantiles and the `buckets` as a list of (cumulative) counts
+            per upper bound (the last one being `inf`).
+        """
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class ClientMetrics:
+    """Thread-safe registry of the metrics of a wrapper.
+
+    An instance may be shared by several wrappers (by assigning it to their
+    `metrics` attributes) to aggregate their measurements.
+
+    Parameters
+    ----------
+    buckets : tuple(float), optional
+        The upper bounds (in seconds) of the latency histogram buckets, by
+        default `LATENCY_BUCKETS`.
+    size_buckets : tuple(int), optional
+        The upper bounds (in bytes) of the payload size histogram buckets, by
+        default `SIZE_BUCKETS`.
+
+    Attributes
+    ----------
+    latency : dict((str, str), Histogram)
+        The latency histograms, keyed by command and phase.
+    sizes : dict(str, Histogram)
+        The payload size histograms, keyed by command.
+    errors : dict((str, str, str), int)
+        The error counters, keyed by command, phase and error type.
+    read_only_intercepts : dict(str, int)
+        The number of `POST` requests suppressed by the `read_only` mode, keyed
+        by command.
+    tracer : Any
+        An optional OpenTelemetry tracer (e.g. from `trace.get_tracer()`) used
+        to create a span named `psytricks.<phase>` for each phase recorded via
+        `timed()`, default is `None`.
+    """
+
+    def __init__(
+        self, buckets: tuple = LATENCY_BUCKETS, size_buckets: tuple = SIZE_BUCKETS
+    ):
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.sizes: dict[str, Histogram] = {}
+        self.errors: dict[tuple[str, str, str], int] = {}
+        self.read_only_intercepts: dict[str, int] = {}
+        self.tracer: Any = None
+
+        self._buckets = buckets
+        self._size_buckets = size_buckets
+        self._hooks: list[Callable[[MetricEvent], None]] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[MetricEvent], None]) -> None:
+        """Register a callback to be called with every `MetricEvent`.
+
+        Hooks are called synchronously in the thread performing the request, so
+        they should return quickly. Exceptions raised by a hook are logged and
+        otherwise ignored.
+
+        Parameters
+        ----------
+        hook : Callable[[MetricEvent], None]
+            The callback.
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[MetricEvent], None]) -> None:
+        """Unregister a callback previously added through `add_hook()`."""
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def _emit(self, event: MetricEvent) -> None:
+        """Hand an event to all registered hooks."""
+        # hooks may be added / removed by other threads while requests are in
+        # flight (e.g. by `psytricks.bulk.run_many()`), so iterate a snapshot:
+        with self._lock:
+            hooks = tuple(self._hooks)
+        for hook in hooks:
+            try:
+                hook(event)
+            except Exception as ex:  # pylint: disable-msg=broad-except
+                log.warning(f"Metrics hook {hook} failed: {ex}")
+
+    def observe(self, command: str, phase: MetricPhase, seconds: float) -> None:
+        """Record the duration of a phase of a request.
+
+        Parameters
+        ----------
+        command : str
+            The command name, e.g. `GetMachineStatus`.
+        phase : str
+            The phase, one of `psytricks.literals.MetricPhase`.
+        seconds : float
+            The duration.
+        """
+        with self._lock:
+            histogram = self.latency.get((command, phase))
+            if histogram is None:
+                histogram = self.latency[(command, phase)] = Histogram(self._buckets)
+            histogram.observe(seconds)
+        self._emit(MetricEvent("latency", command, phase, seconds))
+
+    def observe_size(self, command: str, size: int) -> None:
+        """Record the size (in bytes) of a response payload.
+
+        Parameters
+        ----------
+        command : str
+            The command name, e.g. `GetMachineStatus`.
+        size : int
+            The size of the (uncompressed) payload.
+        """
+        with self._lock:
+            histogram = self.sizes.get(command)
+            if histogram is None:
+                histogram = self.sizes[command] = Histogram(self._size_buckets)
+            histogram.observe(size)
+        self._emit(MetricEvent("size", command, value=size))
+
+    def count_error(self, command: str, phase: MetricPhase, error: str) -> None:
+        """Count an error.
+
+        Parameters
+        ----------
+        command : str
+            The command name, e.g. `GetMachineStatus`.
+        phase : str
+            The phase in which the error occurred.
+        error : str
+            The type of the error, e.g. the name of the exception class.
+        """
+        with self._lock:
+            key = (command, phase, error)
+            self.errors[key] = self.errors.get(key, 0) + 1
+        self._emit(MetricEvent("error", command, phase, error=error))
+
+    def count_read_only(self, command: str) -> None:
+        """Count a `POST` request that was suppressed by the `read_only` mode."""
+        with self._lock:
+            self.read_only_intercepts[command] = (
+                self.read_only_intercepts.get(command, 0) + 1
+            )
+        self._emit(MetricEvent("read_only", command))
+
+    @contextmanager
+    def timed(self, command: str, phase: MetricPhase) -> Iterator[None]:
+        """Context manager recording the duration of the enclosed block.
+
+        The duration is recorded even if the block raises an exception, which
+        is counted as an error of the phase (and passed on).
+
+        Parameters
+        ----------
+        command : str
+            The command name, e.g. `GetMachineStatus`.
+        phase : str
+            The phase, one of `psytricks.literals.MetricPhase`.
+        """
+        span = None
+        if self.tracer is not None:
+            span = self.tracer.start_as_current_span(
+                f"psytricks.{phase}", attributes={"psytricks.command": command}
+            )
+            span.__enter__()  # pylint: disable-msg=unnecessary-dunder-call
+
+        tstart = time.perf_counter()
+        try:
+            yield
+        except BaseException as ex:
+            self.observe(command, phase, time.perf_counter() - tstart)
+            self.count_error(command, phase, ex.__class__.__name__)
+            if span is not None:
+                span.__exit__(ex.__class__, ex, ex.__traceback__)
+            raise
+
+        self.observe(command, phase, time.perf_counter() - tstart)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+    def snapshot(self) -> dict:
+        """Get a summary of all metrics, e.g. for serializing it to JSON.
+
+        Returns
+        -------
+        dict
+            A dict with the following items:
+                - `latency`: a dict with the commands as keys, each value being
+                  a dict mapping phases to histogram summaries (see
+                  `Histogram.as_dict()`).
+                - `payload_bytes`: a dict mapping commands to histogram
+                  summaries of the payload sizes.
+                - `errors`: a dict of commands, each value being a dict mapping
+                  strings of the form `<phase>:<error type>` to counts.
+                - `read_only_intercepts`: a dict mapping commands to counts.
+        """
+        with self._lock:
+            latency = {}
+            for (command, phase), histogram in sorted(self.latency.items()):
+                latency.setdefault(command, {})[phase] = histogram.as_dict()
+            errors = {}
+            for (command, phase, error), count in sorted(self.errors.items()):
+                errors.setdefault(command, {})[f"{phase}:{error}"] = count
+
+            return {
+                "latency": latency,
+                "payload_bytes": {
+                    command: histogram.as_dict()
+                    for command, histogram in sorted(self.sizes.items())
+                },
+                "errors": errors,
+                "read_only_intercepts": dict(self.read_only_intercepts),
+            }
+
+    def reset(self) -> None:
+        """Discard all recorded measurements (keeping hooks and tracer)."""
+        with self._lock:
+            self.latency.clear()
+            self.sizes.clear()
+            self.errors.clear()
+            self.read_only_intercepts.clear()
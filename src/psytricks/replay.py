@@ -0,0 +1,388 @@
+"""Replay of responses recorded through `dump_responses_to`, e.g. for load tests.
+
+The `ReplayServer` serves a directory of responses dumped by the wrappers (see
+`psytricks.wrapper.ResTricksBase.dump_responses_to`) or captured through a
+`psytricks.capture.ResponseCapture` in place of the ResTricks service.
+Requests are answered with the recorded responses of the same route in the
+order they were captured, each one delayed by its recorded latency. With `pace`
+enabled (the default), responses are additionally held back until the time they
+were originally received (relative to the first request), so the original
+inter-request timing of the captured traffic is kept. A `speed` factor replays
+everything N times faster, e.g. to load-test a consumer with real production
+traffic without a Citrix environment:
+
+```Python
+with ReplayServer(load_captures(Path("dumps")), port=0, speed=10).start() as server:
+    wrapper = ResTricksWrapper(base_url=server.base_url)
+    machines = wrapper.get_machine_status()
+```
+
+or from the command line:
+
+```bash
+python -m psytricks.replay dumps/ --port 8080 --speed 10
+```
+"""
+
+# pylint: disable-msg=too-many-arguments
+
+import gzip
+import json
+import threading
+import time
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import click
+from loguru import logger as log
+
+from . import __version__
+from .capture import CAPTURE_PATTERN
+from .standin import PROMETHEUS_TYPE, ServerMetrics, StandInHandler, format_prometheus
+
+
+@dataclass
+class Capture:
+    """A recorded response, see `load_captures()`.
+
+    Attributes
+    ----------
+    key : str
+        The route of the request, with `/` replaced by `-` and without the query
+        (the `<command>` part of the dump's name), e.g. `GetAccessUsers-group`.
+    url : str
+        The full request URL relative to the service, including the query (for
+        dumps without a `.meta.json` file only the route is known).
+    method : str
+        The request method, `GET` or `POST`.
+    status : int
+        The HTTP status of the response.
+    timestamp : float
+        The time the response was received in seconds since the epoch.
+    latency : float
+        The time in seconds it took for the response to arrive (0 if unknown).
+    body : bytes
+        The body of the response.
+    content_type : str
+        The content type of the response.
+    """
+
+    key: str
+    url: str
+    method: str
+    status: int
+    timestamp: float
+    latency: float
+    body: bytes
+    content_type: str = "application/json"
+
+
+def route_key(path: str) -> str:
+    """Get the route of a request path the way dumps are named.
+
+    Parameters
+    ----------
+    path : str
+        The request path, e.g. `/GetAccessUsers/group?fields=x`.
+
+    Returns
+    -------
+    str
+        The route, e.g. `GetAccessUsers-group`.
+    """
+    return urlsplit(path).path.strip("/").replace("/", "-")
+
+
+def load_captures(path: Path) -> list[Capture]:
+    """Load the responses dumped into a directory, in the order of their capture.
+
+    Both the files written by `dump_responses_to` and the (compressed) files of
+    a `psytricks.capture.ResponseCapture` are loaded.
+
+    Dumps of `304 Not Modified` responses carry no body, they are replaced by
+    the previous successful response for the same URL (or skipped if there is
+    none). Responses to the `version` requests of the wrappers are skipped, the
+    `ReplayServer` answers those itself.
+
+    Parameters
+    ----------
+    path : Path
+        The directory containing the dumped responses.
+
+    Returns
+    -------
+    list(Capture)
+    """
+    captures = []
+    for dump in path.glob("*-*-*-*.txt"):
+        key, method, status, timestamp = dump.stem.rsplit("-", 3)
+        if not (status.isdigit() and timestamp.isdigit()):
+            continue
+
+        capture = Capture(
+            key=key,
+            url=key.replace("-", "/"),
+            method=method,
+            status=int(status),
+            timestamp=int(timestamp) / 1000,
+            latency=0.0,
+            body=dump.read_bytes(),
+        )
+        meta_path = dump.with_suffix(".meta.json")
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf8"))
+            capture.url = meta.get("url") or capture.url
+            capture.latency = meta.get("latency") or 0.0
+            capture.content_type = meta.get("content_type") or capture.content_type
+        captures.append(capture)
+
+    for capture_file in path.glob(CAPTURE_PATTERN):
+        with gzip.open(capture_file, "rt", encoding="utf8") as infile:
+            for line in infile:
+                record = json.loads(line)
+                captures.append(
+                    Capture(
+                        key=route_key(record["url"]),
+                        url=record["url"],
+                        method=record["method"],
+                        status=record["status"],
+                        timestamp=record["timestamp"],
+                        latency=record["latency"] or 0.0,
+                        body=record["body"].encode("utf8"),
+                        content_type=record["content_type"] or "application/json",
+                    )
+                )
+
+    captures = [x for x in captures if x.key != "version"]
+    captures.sort(key=lambda x: x.timestamp)
+
+    replayed = []
+    previous = {}
+    for capture in captures:
+        if capture.status == 304:
+            if capture.url not in previous:
+                log.debug(f"Skipping 304 capture without a predecessor: {capture.url}")
+                continue
+            last = previous[capture.url]
+            capture.status = last.status
+            capture.body = last.body
+            capture.content_type = last.content_type
+        elif capture.status == 200:
+            previous[capture.url] = capture
+        replayed.append(capture)
+
+    log.debug(f"Loaded {len(replayed)} captures from [{path}].")
+    return replayed
+
+
+class ReplayHandler(StandInHandler):
+    """Request handler of the `ReplayServer`."""
+
+    server: "ReplayServer"
+
+    def _process_get(self) -> None:
+        command, _, query = self._parse_path()
+        if command == "end":
+            self._send_html(200, "Terminating.")
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif command == "":
+            self._send_html(200, f"<h1>replay.py ({__version__})</h1>")
+        elif command == "version":
+            self._send_envelope("")
+        elif command == "metrics":
+            snapshot = self.server.metrics.snapshot()
+            if query.get("format") == "json":
+                self._send_envelope(snapshot)
+            else:
+                body = format_prometheus(snapshot).encode("utf8")
+                self._send(200, body, PROMETHEUS_TYPE)
+        else:
+            self._replay()
+
+    def _process_post(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self._replay()
+
+    def _replay(self) -> None:
+        """Answer the request with the next capture of its route."""
+        capture, delay = self.server.next_capture(self.command, self.path)
+        if capture is None:
+            self._send_html(404, f"No captured response for [{self.path}]")
+            return
+
+        with self._broker():
+            if delay > 0:
+                time.sleep(delay)
+        self._send(capture.status, capture.body, capture.content_type)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """A multi-threaded HTTP server replaying captured responses.
+
+    Parameters
+    ----------
+    captures : list(Capture)
+        The responses to replay, see `load_captures()`.
+    host : str, optional
+        The address to listen on, by default `localhost`.
+    port : int, optional
+        The port to listen on, by default 8080. Use `0` to pick a free one.
+    speed : float, optional
+        The factor to speed up the replay by, by default 1 (the original
+        timing). Recorded latencies and inter-request times are divided by this
+        value, use `0` to answer all requests right away.
+    pace : bool, optional
+        Hold back responses until their original (relative) time of arrival,
+        by default `True`. Otherwise, only the recorded latency is applied.
+    compress_min_size : int, optional
+        The minimum size in bytes for responses to be gzip compressed (if the
+        client accepts it), by default 1024. Use a negative value to disable.
+
+    Attributes
+    ----------
+    metrics : ServerMetrics
+        The request counters and latency histograms reported by `/metrics`.
+
+    Notes
+    -----
+    Requests are matched against the captures having the very same URL (path
+    and query) and method, falling back to the captures of the same route. Once
+    all captures of a route have been served, they are served again from the
+    start (without pacing).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        captures: list[Capture],
+        host: str = "localhost",
+        port: int = 8080,
+        speed: float = 1.0,
+        pace: bool = True,
+        compress_min_size: int = 1024,
+    ):
+        super().__init__((host, port), ReplayHandler)
+        self.speed = speed
+        self.pace = pace
+        self.compress_min_size = compress_min_size
+        self.metrics = ServerMetrics()
+
+        self._origin = captures[0].timestamp if captures else 0.0
+        self._queues: dict[tuple[str, str], list[Capture]] = {}
+        for capture in captures:
+            self._queues.setdefault((capture.method, capture.url), []).append(capture)
+            self._queues.setdefault((capture.method, capture.key), []).append(capture)
+        self._served: dict[tuple[str, str], int] = {}
+        self._started: float | None = None
+        self._lock = threading.Lock()
+        self._thread = None
+        log.debug(f"Initialized {self.__class__.__name__}({self.base_url}) ✨")
+
+    @property
+    def base_url(self) -> str:
+        """The base URL to pass to the wrapper classes."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def next_capture(self, method: str, path: str) -> tuple[Capture | None, float]:
+        """Get the next capture to answer a request with.
+
+        Parameters
+        ----------
+        method : str
+            The request method.
+        path : str
+            The request path, including the query.
+
+        Returns
+        -------
+        (Capture, float)
+            The capture (`None` if there is none for the request) and the time
+            in seconds to wait before sending it.
+        """
+        now = time.monotonic()
+        url = path.lstrip("/")
+        key = (method, url) if (method, url) in self._queues else None
+        key = key or (method, route_key(path))
+        with self._lock:
+            if self._started is None:
+                self._started = now
+            queue = self._queues.get(key)
+            if not queue:
+                return None, 0.0
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+
+        capture = queue[served % len(queue)]
+        if not self.speed:
+            return capture, 0.0
+
+        delay = capture.latency / self.speed
+        if self.pace and served < len(queue):
+            due = self._started + (capture.timestamp - self._origin) / self.speed
+            delay = max(delay, due - now)
+        return capture, delay
+
+    def start(self) -> "ReplayServer":
+        """Start serving requests in a background thread.
+
+        Returns
+        -------
+        ReplayServer
+            The server itself, e.g. for using it as a context manager.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        log.debug(f"Replay server listening on {self.base_url} 📼")
+        return self
+
+    def stop(self) -> None:
+        """Stop serving requests and close the listening socket."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        """Enter the context manager (see `start()` for running in a thread)."""
+        return self
+
+    def __exit__(self, *exc):
+        """Leave the context manager, stopping the server."""
+        self.stop()
+
+
+@click.command(help="Replay responses dumped by the wrappers (for load tests).")
+@click.argument(
+    "captures", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.option("--host", default="localhost", help="The address to listen on.")
+@click.option("--port", default=8080, help="The port to listen on.")
+@click.option("--speed", default=1.0, help="Replay N times faster (0: no delays).")
+@click.option(
+    "--pace/--no-pace",
+    default=True,
+    help="Keep the original timing between responses (default) or only delay "
+    "each one by its recorded latency.",
+)
+def main(captures, host, port, speed, pace):  # noqa: D417
+    """Run the replay server in the foreground until interrupted."""
+    server = ReplayServer(
+        load_captures(captures), host=host, port=port, speed=speed, pace=pace
+    )
+    click.echo(f"Replaying [{captures}] on {server.base_url}")
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable-msg=no-value-for-parameter
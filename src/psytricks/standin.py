@@ -0,0 +1,1154 @@
+"""Pure-Python stand-in for the ResTricks service, for testing and load tests.
+
+The `StandInServer` implements the routes of `restricks-server.ps1` with the
+same `Status` / `Data` envelope (including field projection, filters, paging,
+NDJSON, ETags and gzip), serving the records of a `StandInState` instead of
+talking to a Citrix Delivery Controller. The state is initialized either from
+the sample data shipped in `__ps1__/sampledata` or from a directory of responses
+dumped through `psytricks.wrapper.ResTricksWrapper.dump_responses_to`, and is
+updated by the `POST` requests, e.g. a machine placed in maintenance mode will
+show up like that in subsequent `GetMachineStatus` requests.
+
+Latency, jitter and an error rate can be configured to simulate a (slow and
+unreliable) Delivery Controller, so client throughput and concurrency can be
+measured on any machine without network access, e.g.
+
+```Python
+with StandInServer(port=0, latency=0.05, jitter=0.02).start() as server:
+    wrapper = ResTricksWrapper(base_url=server.base_url)
+    machines = wrapper.get_machine_status()
+```
+
+or from the command line:
+
+```bash
+python -m psytricks.standin --port 8080 --latency 0.05 --error-rate 0.01
+```
+"""
+
+# pylint: disable-msg=too-many-arguments
+
+import copy
+import fnmatch
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator, get_args
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import click
+from loguru import logger as log
+
+from . import __version__
+from .literals import MachineProperty, SessionProperty
+from .mappings import by_keyword, power_action
+from .metrics import Histogram
+from .streaming import NDJSON_TYPE
+
+SAMPLEDATA = Path(__file__).parent / "__ps1__" / "sampledata"
+"""The directory with the sample data of the PowerShell scripts' `-Dummy` mode."""
+
+GET_ROUTES = ("DisconnectAll", "GetAccessUsers", "GetMachineStatus", "GetSessions")
+"""The `GET` routes of `restricks-server.ps1` (`$GetRoutes`)."""
+
+POST_ROUTES = (
+    "DisconnectSession",
+    "MachinePowerAction",
+    "SendSessionMessage",
+    "SetAccessUsers",
+    "SetMaintenanceMode",
+)
+"""The `POST` routes of `restricks-server.ps1` (`$PostRoutes`)."""
+
+MACHINE_FILTERS = {
+    "DesktopGroupName": "DesktopGroupName",
+    "DNSName": "DNSName",
+    "InMaintenanceMode": "InMaintenanceMode",
+    "PowerState": "PowerState",
+    "SummaryState": "SummaryState",
+    "UserName": "SessionUserName",
+}
+"""Filter names of machine listings and the properties they apply to."""
+
+SESSION_FILTERS = {
+    "DesktopGroupName": "DesktopGroupName",
+    "DNSName": "DNSName",
+    "SummaryState": "MachineSummaryState",
+    "UserName": "UserName",
+}
+"""Filter names of session listings and the properties they apply to."""
+
+PAGE_KEYS = {"GetMachineStatus": "DNSName", "GetSessions": "Uid"}
+"""The properties used for sorting and as cursor when paging through listings."""
+
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+"""The latency histogram buckets of `restricks-server.ps1` (`$MetricsBuckets`)."""
+
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""The content type of the Prometheus text format."""
+
+# the (numerical) states used when updating the records through POST requests,
+# see `psytricks.mappings` for their meaning:
+_POWER_ON, _POWER_OFF, _POWER_SUSPENDED = 4, 3, 5
+_SUMMARY_OFF, _SUMMARY_AVAILABLE, _SUMMARY_DISCONNECTED = 0, 2, 3
+_SESSION_DISCONNECTED = 3
+_ACTION_COMPLETED = 2
+
+
+class RequestError(Exception):
+    """An invalid request, answered with an HTML error page (like the service)."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _ps_date(timestamp: float | None = None) -> str:
+    """Format a timestamp the way `ConvertTo-Json` of PowerShell 5.1 does."""
+    if timestamp is None:
+        timestamp = time.time()
+    return f"/Date({int(timestamp * 1000)})/"
+
+
+def _load_records(text: str) -> list:
+    """Get the records from a sample data file or a dumped response.
+
+    Sample data files contain a bare list, dumped responses either the JSON
+    envelope (`Status` and `Data`) or NDJSON with a trailing `Status` line.
+    """
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        parsed = [json.loads(line) for line in text.splitlines() if line.strip()]
+        return [x for x in parsed if not (isinstance(x, dict) and "Status" in x)]
+
+    if isinstance(parsed, dict) and "Data" in parsed:
+        parsed = parsed["Data"]
+    if parsed is None or parsed == "":
+        return []
+    return parsed if isinstance(parsed, list) else [parsed]
+
+
+def _matches(value: Any, pattern: str, mapping: dict | None) -> bool:
+    """Check a value against a filter pattern (like PowerShell's `-like`)."""
+    pattern = pattern.lower()
+    candidates = [str(value).lower()]
+    if mapping is not None and value in mapping:
+        candidates.append(mapping[value])
+    return any(fnmatch.fnmatchcase(x, pattern) for x in candidates)
+
+
+class StandInState:
+    """The (mutable) records served by a `StandInServer`.
+
+    All access goes through the methods of this class, which are thread-safe.
+    Records are stored in their *raw* form, i.e. exactly as produced by
+    PowerShell's `ConvertTo-Json` (numerical states, `/Date(...)/` strings).
+
+    Parameters
+    ----------
+    machines : list(dict)
+        The machine records, see `psytricks.literals.MachineProperty`.
+    sessions : list(dict)
+        The session records, see `psytricks.literals.SessionProperty`.
+    access_users : list(dict)
+        The users having access to a Delivery Group, used as the initial value
+        for every group name requested.
+
+    Attributes
+    ----------
+    messages : list(dict)
+        The payloads of all `SendSessionMessage` requests received.
+    power_actions : list(dict)
+        The power action records created by `MachinePowerAction` requests.
+    """
+
+    def __init__(self, machines: list, sessions: list, access_users: list):
+        self.machines = {x["DNSName"]: x for x in copy.deepcopy(machines)}
+        self.sessions = {x["Uid"]: x for x in copy.deepcopy(sessions)}
+        self.access_users: dict[str, list] = {}
+        self.messages: list[dict] = []
+        self.power_actions: list[dict] = []
+
+        self._default_users = copy.deepcopy(access_users)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_sampledata(cls, path: Path = SAMPLEDATA) -> "StandInState":
+        """Create the state from the `-Dummy` mode sample data files.
+
+        Parameters
+        ----------
+        path : Path, optional
+            The directory containing `GetMachineStatus.json`, `GetSessions.json`
+            and `GetAccessUsers.json` (encoded in `cp850`), by default the one
+            shipped with the package.
+
+        Returns
+        -------
+        StandInState
+        """
+
+        def load(command: str) -> list:
+            return _load_records((path / f"{command}.json").read_text("cp850"))
+
+        return cls(
+            load("GetMachineStatus"), load("GetSessions"), load("GetAccessUsers")
+        )
+
+    @classmethod
+    def from_dumps(cls, path: Path) -> "StandInState":
+        """Create the state from a directory of dumped responses.
+
+        The most recent successful `GET` response of each listing will be used
+        (see `psytricks.wrapper.ResTricksBase.dump_responses_to` for the naming
+        scheme). Listings not present in the directory are taken from the
+        sample data.
+
+        Parameters
+        ----------
+        path : Path
+            The directory containing the dumped responses.
+
+        Returns
+        -------
+        StandInState
+        """
+        fallback = cls.from_sampledata()
+
+        def newest(pattern: str) -> Path | None:
+            files = sorted(
+                path.glob(f"{pattern}-GET-200-*.txt"),
+                key=lambda x: int(x.stem.rsplit("-", 1)[-1]),
+            )
+            if not files:
+                return None
+            log.debug(f"Loading records from [{files[-1]}]...")
+            return files[-1]
+
+        machines = list(fallback.machines.values())
+        dump = newest("GetMachineStatus")
+        if dump:
+            machines = _load_records(dump.read_text("utf8"))
+
+        sessions = list(fallback.sessions.values())
+        dump = newest("GetSessions")
+        if dump:
+            sessions = _load_records(dump.read_text("utf8"))
+
+        users = fallback._default_users  # pylint: disable-msg=protected-access
+        dump = newest("GetAccessUsers-*")
+        if dump:
+            users = _load_records(dump.read_text("utf8"))
+
+        return cls(machines, sessions, users)
+
+    def listing(self, command: str) -> list[dict]:
+        """Get a copy of the records of a listing command.
+
+        Parameters
+        ----------
+        command : str
+            Either `GetMachineStatus` or `GetSessions`.
+
+        Returns
+        -------
+        list(dict)
+        """
+        with self._lock:
+            records = self.machines if command == "GetMachineStatus" else self.sessions
+            return copy.deepcopy(list(records.values()))
+
+    def get_access_users(self, group: str) -> list[dict]:
+        """Get a copy of the users having access to a Delivery Group.
+
+        Parameters
+        ----------
+        group : str
+            The name of the Delivery Group.
+
+        Returns
+        -------
+        list(dict)
+        """
+        with self._lock:
+            users = self.access_users.setdefault(
+                group, copy.deepcopy(self._default_users)
+            )
+            return copy.deepcopy(users)
+
+    def set_access_users(self, group: str, users: str, remove: bool) -> list[dict]:
+        """Add or remove users having access to a Delivery Group.
+
+        Parameters
+        ----------
+        group : str
+            The name of the Delivery Group.
+        users : str
+            One or more (comma-separated) usernames.
+        remove : bool
+            Remove the users instead of adding them.
+
+        Returns
+        -------
+        list(dict)
+            The users having access after the modification.
+        """
+        names = [x.strip() for x in str(users).split(",") if x.strip()]
+        with self._lock:
+            current = self.access_users.setdefault(
+                group, copy.deepcopy(self._default_users)
+            )
+            known = {x["Name"].lower() for x in current}
+            if remove:
+                drop = {x.lower() for x in names}
+                current[:] = [x for x in current if x["Name"].lower() not in drop]
+            else:
+                for name in names:
+                    if name.lower() not in known:
+                        current.append({"Name": name, "FullName": name, "UPN": None})
+            return copy.deepcopy(current)
+
+    def _machine(self, dns_name: str) -> dict:
+        for name, machine in self.machines.items():
+            if name.lower() == str(dns_name).lower():
+                return machine
+        raise ValueError(f"Error fetching machine object for [{dns_name}]!")
+
+    def _session(self, dns_name: str) -> dict | None:
+        for session in self.sessions.values():
+            if str(session["DNSName"]).lower() == str(dns_name).lower():
+                return session
+        return None
+
+    def set_maintenance(self, dns_name: str, disable: bool) -> dict:
+        """Switch maintenance mode of a machine.
+
+        Parameters
+        ----------
+        dns_name : str
+            The FQDN of the machine.
+        disable : bool
+            Turn maintenance mode off instead of on.
+
+        Returns
+        -------
+        dict
+            The updated machine record.
+        """
+        with self._lock:
+            machine = self._machine(dns_name)
+            machine["InMaintenanceMode"] = not disable
+            return copy.deepcopy(machine)
+
+    def disconnect_session(self, dns_name: str) -> dict | None:
+        """Disconnect the session on a machine.
+
+        Parameters
+        ----------
+        dns_name : str
+            The FQDN of the machine.
+
+        Returns
+        -------
+        dict or None
+            The updated session record, `None` if there is no session.
+        """
+        with self._lock:
+            session = self._session(dns_name)
+            if session is None:
+                return None
+            if session["SessionState"] != _SESSION_DISCONNECTED:
+                session["SessionState"] = _SESSION_DISCONNECTED
+                session["SessionStateChangeTime"] = _ps_date()
+                session["MachineSummaryState"] = _SUMMARY_DISCONNECTED
+                machine = self.machines.get(session["DNSName"])
+                if machine is not None:
+                    machine["SummaryState"] = _SUMMARY_DISCONNECTED
+                    machine["SessionStateChangeTime"] = session[
+                        "SessionStateChangeTime"
+                    ]
+            return copy.deepcopy(session)
+
+    def power_action(self, dns_name: str, action: str) -> dict:
+        """Perform a power action on a machine (taking effect immediately).
+
+        Parameters
+        ----------
+        dns_name : str
+            The FQDN of the machine.
+        action : str
+            The power action, one of `psytricks.literals.Action`.
+
+        Returns
+        -------
+        dict
+            The power action record, see
+            `psytricks.wrapper.ResTricksWrapper.perform_poweraction()`.
+        """
+        actions = {name: value for value, name in power_action.items()}
+        if action not in actions:
+            raise ValueError(f"Invalid power action: [{action}]")
+
+        with self._lock:
+            machine = self._machine(dns_name)
+            if action in ("turnoff", "shutdown"):
+                machine["PowerState"] = _POWER_OFF
+                machine["SummaryState"] = _SUMMARY_OFF
+            elif action == "suspend":
+                machine["PowerState"] = _POWER_SUSPENDED
+            else:
+                machine["PowerState"] = _POWER_ON
+                if machine["SummaryState"] == _SUMMARY_OFF:
+                    machine["SummaryState"] = _SUMMARY_AVAILABLE
+
+            now = _ps_date()
+            record = {
+                "Action": actions[action],
+                "ActionCompletionTime": now,
+                "ActionStartTime": now,
+                "ActualPriority": 30,
+                "BasePriority": 30,
+                "DNSName": machine["DNSName"],
+                "FailureReason": None,
+                "HostedMachineId": None,
+                "HostedMachineName": machine.get("HostedMachineName"),
+                "HypHypervisorConnectionUid": None,
+                "HypervisorConnectionUid": None,
+                "MachineName": machine["DNSName"].split(".")[0],
+                "MetadataMap": {},
+                "Origin": 0,
+                "RequestTime": now,
+                "Sid": None,
+                "State": _ACTION_COMPLETED,
+                "Uid": len(self.power_actions) + 1,
+            }
+            self.power_actions.append(record)
+            return copy.deepcopy(record)
+
+    def send_message(self, payload: dict) -> None:
+        """Record a pop-up message sent to the session on a machine.
+
+        Parameters
+        ----------
+        payload : dict
+            The payload of the `SendSessionMessage` request.
+        """
+        with self._lock:
+            if self._session(payload.get("DNSName", "")) is None:
+                raise ValueError(
+                    f"Error fetching session object for [{payload.get('DNSName')}]!"
+                )
+            self.messages.append(dict(payload))
+
+
+def select_listing(records: list[dict], command: str, query: dict) -> tuple[list, str]:
+    """Apply projection, filters and paging (see `restricks-server.ps1`).
+
+    Parameters
+    ----------
+    records : list(dict)
+        The full listing.
+    command : str
+        Either `GetMachineStatus` or `GetSessions`.
+    query : dict(str, str)
+        The query parameters of the request.
+
+    Returns
+    -------
+    (list(dict), str)
+        The selected records and the cursor of the next page (empty if there
+        are no more records).
+
+    Raises
+    ------
+    RequestError
+        Raised for invalid field or filter names or an invalid `limit`.
+    """
+    machines = command == "GetMachineStatus"
+    valid_filters = MACHINE_FILTERS if machines else SESSION_FILTERS
+    valid_fields = get_args(MachineProperty if machines else SessionProperty)
+    key = PAGE_KEYS[command]
+
+    for name, pattern in query.items():
+        if name in ("fields", "limit", "after"):
+            continue
+        if name not in valid_filters:
+            raise RequestError(f"Invalid filter requested: {name}")
+        field = valid_filters[name]
+        mapping = by_keyword.get(field)
+        records = [x for x in records if _matches(x.get(field), pattern, mapping)]
+
+    limit = query.get("limit", "")
+    after = query.get("after", "")
+    paging = bool(limit or after)
+    if paging:
+
+        def sort_key(record):
+            value = record.get(key)
+            return value if key == "Uid" else str(value).lower()
+
+        records = sorted(records, key=sort_key)
+        if after:
+            cursor = int(after) if key == "Uid" else after.lower()
+            records = [x for x in records if sort_key(x) > cursor]
+
+    next_cursor = ""
+    if limit:
+        if not limit.isdigit() or int(limit) < 1:
+            raise RequestError(f"Invalid 'limit', expecting a positive number: {limit}")
+        if len(records) > int(limit):
+            records = records[: int(limit)]
+            next_cursor = str(records[-1][key])
+
+    if query.get("fields"):
+        fields = [x.strip() for x in query["fields"].split(",") if x.strip()]
+        invalid = [x for x in fields if x not in valid_fields]
+        if invalid:
+            raise RequestError(f"Invalid field(s) requested: {', '.join(invalid)}")
+        if paging and key not in fields:
+            fields.append(key)
+        records = [{x: record.get(x) for x in fields} for record in records]
+
+    return records, next_cursor
+
+
+def route_label(path: str) -> str:
+    """Get the route of a request path for the metrics (like `Get-RouteLabel`).
+
+    Parameters
+    ----------
+    path : str
+        The path of the request, e.g. `/GetAccessUsers/Group 1?x=y`.
+
+    Returns
+    -------
+    str
+        The first segment of the path, `index` for the root and `other` for
+        unknown routes (to keep the number of distinct labels bounded).
+    """
+    route = urlsplit(path).path.split("/")[1] if path.startswith("/") else ""
+    if route == "":
+        return "index"
+    if route not in GET_ROUTES + POST_ROUTES + ("end", "metrics", "version"):
+        return "other"
+    return route
+
+
+class ServerMetrics:
+    """Counters and histograms reported by the `/metrics` route.
+
+    Mirrors `$ServerMetrics` of `restricks-server.ps1`: requests are counted by
+    route, method and status, their durations are recorded per route in total
+    and per phase (`broker` for the state operations including the simulated
+    latency, `serialize` and `write`) and the bytes sent are summed up per
+    route. All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests: dict[tuple[str, str, str], int] = {}
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.bytes_sent: dict[str, int] = {}
+        self.in_flight = 0
+        self.broker_calls = 0
+        self._lock = threading.Lock()
+
+    def begin(self) -> None:
+        """Count a request as being processed."""
+        with self._lock:
+            self.in_flight += 1
+
+    @contextmanager
+    def broker_call(self) -> Iterator[None]:
+        """Count the enclosed block as a call to the (simulated) broker."""
+        with self._lock:
+            self.broker_calls += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.broker_calls -= 1
+
+    def record(  # pylint: disable-msg=too-many-positional-arguments
+        self,
+        route: str,
+        method: str,
+        status: int,
+        seconds: float,
+        phases: dict[str, float],
+        size: int,
+    ) -> None:
+        """Record a completed request.
+
+        Parameters
+        ----------
+        route : str
+            The route, see `route_label()`.
+        method : str
+            The HTTP method, e.g. `GET`.
+        status : int
+            The HTTP status code of the response.
+        seconds : float
+            The total time spent on the request.
+        phases : dict(str, float)
+            The time spent per phase.
+        size : int
+            The number of bytes sent.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent[route] = self.bytes_sent.get(route, 0) + size
+            for phase, value in [("total", seconds)] + list(phases.items()):
+                histogram = self.latency.get((route, phase))
+                if histogram is None:
+                    histogram = self.latency[(route, phase)] = Histogram(
+                        METRICS_BUCKETS
+                    )
+                histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        """Get the metrics in the structure of `Get-MetricsSnapshot`.
+
+        Returns
+        -------
+        dict
+            The `Data` of the JSON format of the `/metrics` route.
+        """
+        with self._lock:
+            latency = []
+            for (route, phase), histogram in sorted(self.latency.items()):
+                buckets = histogram.as_dict()["buckets"]
+                latency.append(
+                    {
+                        "Route": route,
+                        "Phase": phase,
+                        "Count": histogram.count,
+                        "Sum": histogram.total,
+                        "Buckets": [count for _, count in buckets],
+                    }
+                )
+            return {
+                "UptimeSeconds": int(time.time() - self.started),
+                "ListenerRestarts": 0,
+                # every request gets its own thread right away:
+                "QueueDepth": 0,
+                "RequestsInFlight": self.in_flight,
+                "BrokerCallsInFlight": self.broker_calls,
+                "BucketBounds": list(METRICS_BUCKETS),
+                "Requests": [
+                    {"Route": route, "Method": method, "Status": status, "Count": n}
+                    for (route, method, status), n in sorted(self.requests.items())
+                ],
+                "Latency": latency,
+                "BytesSent": dict(self.bytes_sent),
+            }
+
+
+def format_prometheus(snapshot: dict) -> str:
+    """Format metrics in the Prometheus text format (like the service does).
+
+    Parameters
+    ----------
+    snapshot : dict
+        The metrics, see `ServerMetrics.snapshot()`.
+
+    Returns
+    -------
+    str
+    """
+    lines = [
+        "# HELP restricks_requests_total Requests by route, method and status.",
+        "# TYPE restricks_requests_total counter",
+    ]
+    for item in snapshot["Requests"]:
+        labels = (
+            f'route="{item["Route"]}",method="{item["Method"]}",'
+            f'status="{item["Status"]}"'
+        )
+        lines.append(f"restricks_requests_total{{{labels}}} {item['Count']}")
+
+    families = (
+        ("restricks_request_duration_seconds", "Total time spent per request."),
+        (
+            "restricks_phase_duration_seconds",
+            "Time spent per phase of a request (broker cmdlets, serialization, "
+            "writing the response).",
+        ),
+    )
+    bounds = [str(x) for x in snapshot["BucketBounds"]] + ["+Inf"]
+    for name, helptext in families:
+        lines += [f"# HELP {name} {helptext}", f"# TYPE {name} histogram"]
+        for item in snapshot["Latency"]:
+            is_total = item["Phase"] == "total"
+            if is_total != (name == "restricks_request_duration_seconds"):
+                continue
+            labels = f'route="{item["Route"]}"'
+            if not is_total:
+                labels += f',phase="{item["Phase"]}"'
+            for bound, count in zip(bounds, item["Buckets"]):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {item['Sum']}")
+            lines.append(f"{name}_count{{{labels}}} {item['Count']}")
+
+    lines += [
+        "# HELP restricks_response_bytes_total Bytes sent by route.",
+        "# TYPE restricks_response_bytes_total counter",
+    ]
+    for route, size in snapshot["BytesSent"].items():
+        lines.append(f'restricks_response_bytes_total{{route="{route}"}} {size}')
+
+    scalars = {
+        "restricks_queue_depth": (
+            "Requests waiting for a free runspace.",
+            snapshot["QueueDepth"],
+        ),
+        "restricks_requests_in_flight": (
+            "Requests being processed.",
+            snapshot["RequestsInFlight"],
+        ),
+        "restricks_broker_calls_in_flight": (
+            "Calls to the Delivery Controller in progress.",
+            snapshot["BrokerCallsInFlight"],
+        ),
+        "restricks_uptime_seconds": (
+            "Time since the server was started.",
+            snapshot["UptimeSeconds"],
+        ),
+        "restricks_listener_restarts_total": (
+            "Restarts of the HTTP listener.",
+            snapshot["ListenerRestarts"],
+        ),
+    }
+    for name, (description, value) in scalars.items():
+        kind = "counter" if name.endswith("_total") else "gauge"
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _plain_etag(tag: str) -> str:
+    """Strip the weak prefix and the suffix of gzip-encoded bodies off a tag."""
+    tag = tag.removeprefix("W/")
+    return tag[:-4] + '"' if tag.endswith('-gz"') else tag
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Request handler of the `StandInServer`."""
+
+    protocol_version = "HTTP/1.1"
+    server: "StandInServer"
+
+    def log_message(self, format, *args):  # pylint: disable-msg=redefined-builtin
+        """Send the request log to `loguru` instead of `stderr`."""
+        log.trace(f"{self.address_string()} - {format % args}")
+
+    def send_response(self, code, message=None):
+        """Send the response status line, remembering the code for the metrics."""
+        self._code = code  # pylint: disable-msg=attribute-defined-outside-init
+        super().send_response(code, message)
+
+    def _handle(self, process) -> None:
+        """Process a request, recording it in the server's metrics."""
+        # pylint: disable-msg=attribute-defined-outside-init
+        self._code = 0
+        self._phases: dict[str, float] = {}
+        self._sent = 0
+        tstart = time.perf_counter()
+        self.server.metrics.begin()
+        try:
+            process()
+        finally:
+            self.server.metrics.record(
+                route_label(self.path),
+                self.command,
+                self._code,
+                time.perf_counter() - tstart,
+                self._phases,
+                self._sent,
+            )
+
+    @contextmanager
+    def _timed(self, phase: str) -> Iterator[None]:
+        """Add the duration of the enclosed block to a phase of the request."""
+        tstart = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - tstart
+            self._phases[phase] = self._phases.get(phase, 0.0) + elapsed
+
+    @contextmanager
+    def _broker(self) -> Iterator[None]:
+        """Time the enclosed block as a (simulated) broker call."""
+        with self._timed("broker"), self.server.metrics.broker_call():
+            yield
+
+    def _status(self, execution_status: int = 0, error: str = "", cursor: str = ""):
+        status = {
+            "ExecutionStatus": str(execution_status),
+            "ErrorMessage": error,
+            "ScriptName": "standin.py",
+            "ScriptPath": str(Path(__file__).parent),
+            "PSyTricksVersion": __version__,
+            "Timestamp": int(time.time()),
+        }
+        if cursor:
+            status["NextCursor"] = cursor
+        return status
+
+    def _accepts_gzip(self) -> bool:
+        accepted = self.headers.get("Accept-Encoding", "")
+        for candidate in accepted.split(","):
+            coding, _, params = candidate.strip().partition(";")
+            if coding.strip() in ("gzip", "*"):
+                return params.replace(" ", "") not in ("q=0", "q=0.0")
+        return False
+
+    def _gzips(self, size: int) -> bool:
+        """Check if a body of the given size will be sent gzip-encoded."""
+        min_size = self.server.compress_min_size
+        return 0 <= min_size <= size and self._accepts_gzip()
+
+    def _send(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str,
+        headers: dict | None = None,
+    ) -> None:
+        headers = headers or {}
+        gzipped = self._gzips(len(body))
+        if gzipped:
+            with self._timed("serialize"):
+                body = gzip.compress(body, compresslevel=1)
+
+        with self._timed("write"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+                if "Vary" not in headers:
+                    self.send_header("Vary", "Accept-Encoding")
+            for name, value in headers.items():
+                self.send_header(name, str(value))
+            self.end_headers()
+            self.wfile.write(body)
+        self._sent += len(body)
+
+    def _send_html(self, status: int, text: str) -> None:
+        self._send(status, text.encode("utf8"), "text/html")
+
+    def _send_envelope(
+        self, data: Any, status: int = 200, vary: str = "", **status_items
+    ) -> None:
+        with self._timed("serialize"):
+            data_json = json.dumps(data)
+            status_json = json.dumps(self._status(**status_items))
+            body = f'{{"Status":{status_json},"Data":{data_json}}}'.encode("utf8")
+            # e.g. listings, which are sent as NDJSON as well (see the service):
+            headers = {"Vary": vary} if vary else {}
+            if self.command == "GET" and status == 200:
+                etag = hashlib.sha1(data_json.encode("utf8")).hexdigest().upper()
+                # like the service, tag the gzip-encoded representation apart:
+                suffix = "-gz" if self._gzips(len(body)) else ""
+                headers["ETag"] = f'"{etag}{suffix}"'
+
+        if_none_match = self.headers.get("If-None-Match", "")
+        candidates = {_plain_etag(x.strip()) for x in if_none_match.split(",")}
+        etag = headers.get("ETag")
+        if etag and (_plain_etag(etag) in candidates or "*" in candidates):
+            with self._timed("write"):
+                self.send_response(304)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            return
+
+        self._send(status, body, "application/json", headers)
+
+    def _send_ndjson(self, records: list, cursor: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", NDJSON_TYPE)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Vary", "Accept, Accept-Encoding")
+        compressor = None
+        if self.server.compress_min_size >= 0 and self._accepts_gzip():
+            self.send_header("Content-Encoding", "gzip")
+            compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+        self.end_headers()
+
+        def write_chunk(data: bytes) -> None:
+            # like the service, count the bytes before a potential compression:
+            self._sent += len(data)
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        with self._timed("serialize"):
+            lines = [json.dumps(x) for x in records]
+            lines.append(json.dumps({"Status": self._status(cursor=cursor)}))
+        with self._timed("write"):
+            for pos in range(0, len(lines), 500):
+                write_chunk(("\n".join(lines[pos : pos + 500]) + "\n").encode("utf8"))
+            if compressor is not None:
+                tail = compressor.flush()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(tail), tail))
+            self.wfile.write(b"0\r\n\r\n")
+
+    def _simulate(self) -> None:
+        """Apply the configured latency and error rate."""
+        server = self.server
+        delay = server.latency + server.rng.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if server.error_rate and server.rng.random() < server.error_rate:
+            raise RuntimeError("Simulated error (stand-in 'error_rate')")
+
+    def _parse_path(self) -> tuple[str, list[str], dict]:
+        parts = urlsplit(self.path)
+        segments = [unquote(x) for x in parts.path.split("/")]
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        return segments[1] if len(segments) > 1 else "", segments, query
+
+    def do_GET(self):  # pylint: disable-msg=invalid-name
+        """Process a `GET` request."""
+        self._handle(self._process_get)
+
+    def _process_get(self) -> None:
+        command, segments, query = self._parse_path()
+        try:
+            if command == "end":
+                self._send_html(200, "Terminating.")
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            elif command == "":
+                self._send_html(200, f"<h1>standin.py ({__version__})</h1>")
+            elif command == "version":
+                self._send_envelope("")
+            elif command == "metrics":
+                snapshot = self.server.metrics.snapshot()
+                if query.get("format") == "json":
+                    self._send_envelope(snapshot)
+                else:
+                    body = format_prometheus(snapshot).encode("utf8")
+                    self._send(200, body, PROMETHEUS_TYPE)
+            elif command not in GET_ROUTES:
+                self._send_html(400, f"Invalid or unknown command: [{command}]")
+            else:
+                self._get_route(command, segments, query)
+        except RequestError as ex:
+            self._send_html(ex.status, str(ex))
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            self._send_envelope(
+                "ERROR processing request", 400, execution_status=1, error=str(ex)
+            )
+
+    def _get_route(self, command: str, segments: list, query: dict) -> None:
+        state = self.server.state
+        if command == "GetAccessUsers":
+            group = segments[2] if len(segments) > 2 else ""
+            with self._broker():
+                self._simulate()
+                users = state.get_access_users(group)
+            self._send_envelope(users)
+            return
+        if command not in PAGE_KEYS:
+            raise RequestError(f"Invalid: {command}")
+
+        with self._broker():
+            self._simulate()
+            records, cursor = select_listing(state.listing(command), command, query)
+        if NDJSON_TYPE in self.headers.get("Accept", ""):
+            self._send_ndjson(records, cursor)
+        else:
+            self._send_envelope(records, vary="Accept, Accept-Encoding", cursor=cursor)
+
+    def do_POST(self):  # pylint: disable-msg=invalid-name
+        """Process a `POST` request."""
+        self._handle(self._process_post)
+
+    def _process_post(self) -> None:
+        command, _, _ = self._parse_path()
+        length = int(self.headers.get("Content-Length", 0))
+        content = self.rfile.read(length) if length else b""
+        try:
+            if not content:
+                raise RequestError("No POST data.")
+            if command not in POST_ROUTES:
+                raise RequestError(f"Invalid or unknown command: [{command}]")
+            try:
+                payload = json.loads(content)
+            except json.JSONDecodeError as ex:
+                raise RequestError(f"Decoding error: {ex}", status=422) from ex
+
+            with self._broker():
+                self._simulate()
+                data = self._post_route(command, payload)
+            self._send_envelope(data)
+        except RequestError as ex:
+            self._send_html(ex.status, str(ex))
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            self._send_envelope(
+                "ERROR processing request", 400, execution_status=1, error=str(ex)
+            )
+
+    def _post_route(self, command: str, payload: dict) -> Any:
+        state = self.server.state
+        if command == "DisconnectSession":
+            return state.disconnect_session(payload.get("DNSName", ""))
+        if command == "MachinePowerAction":
+            return state.power_action(payload.get("DNSName", ""), payload.get("Action"))
+        if command == "SendSessionMessage":
+            state.send_message(payload)
+            return ""
+        if command == "SetAccessUsers":
+            return state.set_access_users(
+                payload.get("Group", ""),
+                payload.get("UserNames", ""),
+                bool(payload.get("RemoveAccess")),
+            )
+        return state.set_maintenance(
+            payload.get("DNSName", ""), bool(payload.get("Disable"))
+        )
+
+
+class StandInServer(ThreadingHTTPServer):
+    """A multi-threaded HTTP server mimicking `restricks-server.ps1`.
+
+    Parameters
+    ----------
+    host : str, optional
+        The address to listen on, by default `localhost`.
+    port : int, optional
+        The port to listen on, by default 8080. Use `0` to pick a free one.
+    state : StandInState, optional
+        The records to serve, by default `StandInState.from_sampledata()`.
+    latency : float, optional
+        The time in seconds every (command) request takes, by default 0.
+    jitter : float, optional
+        The maximum random deviation in seconds from `latency`, by default 0.
+    error_rate : float, optional
+        The fraction of (command) requests failing with an error response (like
+        the ones of the service in case a Citrix cmdlet failed), by default 0.
+    compress_min_size : int, optional
+        The minimum size in bytes for responses to be gzip compressed (if the
+        client accepts it), by default 1024. Use a negative value to disable.
+    seed : int, optional
+        A seed for the random numbers used for jitter and errors.
+
+    Attributes
+    ----------
+    state : StandInState
+        The records being served, can be inspected and modified at any time.
+    metrics : ServerMetrics
+        The request counters and latency histograms reported by `/metrics`.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8080,
+        state: StandInState | None = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        compress_min_size: int = 1024,
+        seed: int | None = None,
+    ):
+        super().__init__((host, port), StandInHandler)
+        self.state = state if state is not None else StandInState.from_sampledata()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.compress_min_size = compress_min_size
+        self.rng = random.Random(seed)
+        self.metrics = ServerMetrics()
+
+        self._thread = None
+        log.debug(f"Initialized {self.__class__.__name__}({self.base_url}) ✨")
+
+    @property
+    def base_url(self) -> str:
+        """The base URL to pass to the wrapper classes."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "StandInServer":
+        """Start serving requests in a background thread.
+
+        Returns
+        -------
+        StandInServer
+            The server itself, e.g. for using it as a context manager.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        log.debug(f"Stand-in server listening on {self.base_url} 🎭")
+        return self
+
+    def stop(self) -> None:
+        """Stop serving requests and close the listening socket."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        """Enter the context manager (see `start()` for running in a thread)."""
+        return self
+
+    def __exit__(self, *exc):
+        """Leave the context manager, stopping the server."""
+        self.stop()
+
+
+@click.command(help="Run a stand-in for the ResTricks service (for testing).")
+@click.option("--host", default="localhost", help="The address to listen on.")
+@click.option("--port", default=8080, help="The port to listen on.")
+@click.option(
+    "--data",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="A directory of dumped responses to serve (default: sample data).",
+)
+@click.option("--latency", default=0.0, help="Latency per request in seconds.")
+@click.option("--jitter", default=0.0, help="Random deviation from the latency.")
+@click.option("--error-rate", default=0.0, help="Fraction of failing requests.")
+@click.option("--seed", type=int, help="Seed for the random jitter and errors.")
+def main(host, port, data, latency, jitter, error_rate, seed):  # noqa: D417
+    """Run the stand-in server in the foreground until interrupted."""
+    state = StandInState.from_dumps(data) if data else StandInState.from_sampledata()
+    server = StandInServer(
+        host=host,
+        port=port,
+        state=state,
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        seed=seed,
+    )
+    click.echo(f"Serving stand-in ResTricks service on {server.base_url}")
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable-msg=no-value-for-parameter
@@ -0,0 +1,357 @@
+"""Incremental parsing of (large) JSON responses.
+
+The JSON documents produced by the ResTricks service and the PowerShell wrapper
+script are objects with a `Status` and a `Data` item, where `Data` is usually a
+(potentially very large) list of records. The `EnvelopeParser` in here allows
+to process such documents chunk by chunk, handing out every record of the `Data`
+list as soon as it has been received completely - without ever holding the
+full document or the full list of decoded records in memory.
+
+The ResTricks service can also send listings as newline-delimited JSON (one
+record per line, followed by a line holding only the `Status` object), which is
+handled by the `NdjsonParser` offering the very same interface.
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator
+
+from .decoder import convert_powershell_objects
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+_decoder = json.JSONDecoder()
+
+NDJSON_TYPE = "application/x-ndjson"
+"""The media type of newline-delimited JSON responses."""
+
+
+class EnvelopeParser:
+    """Push-style parser streaming the items of one list in a JSON object.
+
+    Feed the document text in arbitrarily sized chunks to `feed()`, which will
+    return the items of the streamed list (the `Data` item by default) that
+    have been completed by that chunk. All other items of the top-level object
+    (e.g. `Status`) are collected in `envelope`. The PowerShell / Citrix
+    conversions (see `psytricks.decoder.convert_powershell_objects`) are applied
+    to each item.
+
+    In case the streamed item is not a list (e.g. PowerShell produces a single
+    object instead of a list with one element), it will be handed out as the
+    only item. Empty values (`null` or `""`) don't produce any items.
+
+    Parameters
+    ----------
+    key : str, optional
+        The name of the top-level item to stream, by default `Data`.
+
+    Attributes
+    ----------
+    envelope : dict
+        All other top-level items of the document parsed so far.
+    count : int
+        The number of items handed out so far.
+    """
+
+    def __init__(self, key: str = "Data"):
+        self.key = key
+        self.envelope = {}
+        self.count = 0
+
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._current_key = ""
+
+    @property
+    def done(self) -> bool:
+        """`True` once the closing brace of the top-level object was parsed."""
+        return self._state == "done"
+
+    def _skip_ws(self) -> str:
+        """Skip whitespace, returning the next char (empty if none is left)."""
+        self._pos = pos = _WHITESPACE.match(self._buf, self._pos).end()
+        return self._buf[pos : pos + 1]
+
+    def _decode_value(self, final: bool) -> tuple[bool, Any]:
+        """Try to decode the next complete JSON value from the buffer.
+
+        A value is only considered complete if it is followed by at least one
+        more (non-whitespace) char, otherwise e.g. a number could be cut off
+        at a chunk boundary.
+        """
+        try:
+            value, end = _decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return False, None
+
+        if _WHITESPACE.match(self._buf, end).end() >= len(self._buf) and not final:
+            return False, None
+
+        self._pos = end
+        return True, value
+
+    def _expect(self, char: str) -> None:
+        if self._buf[self._pos] != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self._buf, self._pos)
+        self._pos += 1
+
+    def _advance(self, final: bool) -> list:
+        """Process the buffer as far as possible, returning completed items."""
+        items = []
+        while True:
+            char = self._skip_ws()
+            if not char:
+                break
+
+            if self._state == "start":
+                self._expect("{")
+                self._state = "key"
+
+            elif self._state == "key":
+                if char == "}":
+                    self._pos += 1
+                    self._state = "done"
+                    break
+                if char == ",":
+                    self._pos += 1
+                    continue
+                complete, value = self._decode_value(final)
+                if not complete:
+                    break
+                self._current_key = value
+                self._state = "colon"
+
+            elif self._state == "colon":
+                self._expect(":")
+                self._state = "value"
+
+            elif self._state == "value":
+                if self._current_key == self.key and char == "[":
+                    self._pos += 1
+                    self._state = "items"
+                    continue
+                complete, value = self._decode_value(final)
+                if not complete:
+                    break
+                if self._current_key == self.key:
+                    if isinstance(value, list):
+                        items.extend(value)
+                    elif value is not None and value != "":
+                        items.append(value)
+                else:
+                    self.envelope[self._current_key] = value
+                self._state = "key"
+
+            elif self._state == "items":
+                if char == "]":
+                    self._pos += 1
+                    self._state = "key"
+                    continue
+                if char == ",":
+                    self._pos += 1
+                    continue
+                complete, value = self._decode_value(final)
+                if not complete:
+                    break
+                items.append(value)
+
+            else:  # "done", ignore any trailing content
+                self._pos = len(self._buf)
+
+        # drop the consumed part of the buffer from time to time:
+        if self._pos > 65536:
+            self._buf = self._buf[self._pos :]
+            self._pos = 0
+
+        self.count += len(items)
+        return convert_powershell_objects(items)
+
+    def feed(self, text: str) -> list:
+        """Feed the next chunk of the document into the parser.
+
+        Parameters
+        ----------
+        text : str
+            The next part of the document.
+
+        Returns
+        -------
+        list
+            The (converted) items completed by this chunk, may be empty.
+        """
+        self._buf += text
+        return self._advance(final=False)
+
+    def close(self) -> list:
+        """Signal the end of the document and return any remaining items.
+
+        Returns
+        -------
+        list
+            The (converted) items that haven't been handed out yet.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            Raised in case the document is not complete or invalid.
+        """
+        items = self._advance(final=True)
+        if not self.done:
+            raise json.JSONDecodeError(
+                "Unexpected end of document", self._buf, len(self._buf)
+            )
+        return items
+
+
+class NdjsonParser:
+    """Push-style parser for newline-delimited JSON (NDJSON) listings.
+
+    Every line is expected to contain a single record, except for a trailing
+    line consisting of an object with a `Status` item only, which will be put
+    into `envelope`. Provides the same interface as `EnvelopeParser`, so the
+    records are handed out by `feed()` as soon as their line is complete.
+
+    Attributes
+    ----------
+    envelope : dict
+        The `Status` (once the trailing line has been parsed).
+    count : int
+        The number of items handed out so far.
+    """
+
+    def __init__(self):
+        self.envelope = {}
+        self.count = 0
+
+        self._buf = ""
+
+    @property
+    def done(self) -> bool:
+        """`True` once the trailing status line was parsed."""
+        return "Status" in self.envelope
+
+    def _parse_lines(self, lines: list[str]) -> list:
+        items = []
+        for line in lines:
+            if not line.strip():
+                continue
+            value = json.loads(line)
+            if isinstance(value, dict) and len(value) == 1 and "Status" in value:
+                self.envelope.update(value)
+                continue
+            items.append(value)
+
+        self.count += len(items)
+        return convert_powershell_objects(items)
+
+    def feed(self, text: str) -> list:
+        """Feed the next chunk of the document into the parser.
+
+        Parameters
+        ----------
+        text : str
+            The next part of the document.
+
+        Returns
+        -------
+        list
+            The (converted) items completed by this chunk, may be empty.
+        """
+        self._buf += text
+        if "\n" not in text:
+            return []
+        *lines, self._buf = self._buf.split("\n")
+        return self._parse_lines(lines)
+
+    def close(self) -> list:
+        """Signal the end of the document and return any remaining items.
+
+        Returns
+        -------
+        list
+            The (converted) items that haven't been handed out yet.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            Raised in case the last line is invalid or the trailing status line
+            is missing (e.g. as the response was cut off).
+        """
+        items = self._parse_lines([self._buf])
+        self._buf = ""
+        if not self.done:
+            raise json.JSONDecodeError("Missing trailing status line", "", 0)
+        return items
+
+
+def parser_for(content_type: str | None) -> EnvelopeParser | NdjsonParser:
+    """Get a parser matching the content type of a response.
+
+    Parameters
+    ----------
+    content_type : str or None
+        The value of the `Content-Type` header, e.g. `application/x-ndjson`.
+
+    Returns
+    -------
+    EnvelopeParser or NdjsonParser
+    """
+    if content_type and content_type.split(";")[0].strip() == NDJSON_TYPE:
+        return NdjsonParser()
+    return EnvelopeParser()
+
+
+def decode_chunks(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """Incrementally decode byte chunks into text.
+
+    Parameters
+    ----------
+    chunks : Iterable[bytes]
+        The raw chunks, e.g. from `requests.Response.iter_content()`.
+    encoding : str, optional
+        The encoding to use, by default `utf-8`.
+
+    Yields
+    ------
+    str
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_items(chunks: Iterable[str], key: str = "Data") -> Iterator[Any]:
+    """Stream the (converted) items of a JSON envelope from text chunks.
+
+    Parameters
+    ----------
+    chunks : Iterable[str]
+        The text of the JSON document, in chunks.
+    key : str, optional
+        The name of the top-level item to stream, by default `Data`.
+
+    Yields
+    ------
+    Any
+        The items of the streamed list, usually dicts.
+
+    Returns
+    -------
+    dict
+        The other top-level items of the document (e.g. `Status`), available as
+        the `value` of the final `StopIteration`.
+    """
+    parser = EnvelopeParser(key=key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+    return parser.envelope
@@ -0,0 +1,288 @@
+"""Indexed snapshot containers for machine and session listings.
+
+The wrapper methods `get_machine_status()` and `get_sessions()` return plain
+lists of dicts. Looking up records in those lists requires a linear scan, which
+adds up quickly on larger sites when many lookups are done on the same listing.
+The classes in here wrap such a listing (without copying the records) and
+provide hash indexes on the commonly used fields, e.g.
+
+```Python
+machines = MachineTable(wrapper.get_machine_status())
+machine = machines.get("vm42.vdi.example.xy")
+available = machines.lookup("SummaryState", "available")
+```
+
+Indexes are built lazily on first use of a field and are then kept for the
+lifetime of the table, so tables are meant to be treated as immutable snapshots.
+"""
+
+from typing import Any, Iterable, Iterator
+
+from .mappings import by_keyword
+
+
+class RecordTable:
+    """A list of records (dicts) with lazily built hash indexes.
+
+    Parameters
+    ----------
+    records : Iterable[dict]
+        The records, e.g. as returned by one of the wrapper methods.
+
+    Attributes
+    ----------
+    key_field : str
+        The name of the field uniquely identifying a record (class variable!).
+    index_fields : tuple(str)
+        The fields that can be used for `lookup()` (class variable!).
+    records : list(dict)
+        The records of the table.
+    """
+
+    key_field = ""
+    index_fields: tuple[str, ...] = ()
+
+    def __init__(self, records: Iterable[dict] | None):
+        self.records = list(records) if records else []
+        self._indexes: dict[str, dict[Any, list[dict]]] = {}
+        self._keys: dict[Any, dict] | None = None
+
+    def __len__(self) -> int:
+        """Get the number of records."""
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[dict]:
+        """Iterate over the records."""
+        return iter(self.records)
+
+    def __contains__(self, key: Any) -> bool:
+        """Check if a record with the given key exists."""
+        return self.get(key) is not None
+
+    def _index(self, field: str) -> dict[Any, list[dict]]:
+        index = self._indexes.get(field)
+        if index is None:
+            index = {}
+            for record in self.records:
+                value = record.get(field)
+                if isinstance(value, list):
+                    for item in value:
+                        index.setdefault(item, []).append(record)
+                else:
+                    index.setdefault(value, []).append(record)
+            self._indexes[field] = index
+        return index
+
+    def get(self, key: Any) -> dict | None:
+        """Get the record having the given value in its `key_field`.
+
+        Parameters
+        ----------
+        key : Any
+            The value to look up, e.g. a machine's FQDN.
+
+        Returns
+        -------
+        dict or None
+            The record or `None` if no such record exists.
+        """
+        if self._keys is None:
+            self._keys = {x.get(self.key_field): x for x in self.records}
+        return self._keys.get(key)
+
+    def lookup(self, field: str, value: Any) -> list[dict]:
+        """Get all records having the given value in a field.
+
+        For fields holding a list of values (e.g. `AssociatedUserUPNs`), records
+        containing the value in that list are returned.
+
+        Parameters
+        ----------
+        field : str
+            The field name, has to be one of `index_fields`.
+        value : Any
+            The value to look up, e.g. `available` for the `SummaryState` field.
+
+        Returns
+        -------
+        list(dict)
+            The matching records (may be empty), in their original order. The
+            list is a copy, so it may be modified by the caller.
+
+        Raises
+        ------
+        KeyError
+            Raised in case `field` is not one of `index_fields`.
+        """
+        if field not in self.index_fields:
+            raise KeyError(f"Field [{field}] is not indexed: {self.index_fields}")
+        return list(self._index(field).get(value, ()))
+
+    def values(self, field: str) -> list:
+        """Get the distinct values present in an indexed field.
+
+        Parameters
+        ----------
+        field : str
+            The field name, has to be one of `index_fields`.
+
+        Returns
+        -------
+        list
+        """
+        if field not in self.index_fields:
+            raise KeyError(f"Field [{field}] is not indexed: {self.index_fields}")
+        return list(self._index(field))
+
+    def count(self, field: str) -> dict[Any, int]:
+        """Count the records per value of an indexed field.
+
+        Parameters
+        ----------
+        field : str
+            The field name, has to be one of `index_fields`.
+
+        Returns
+        -------
+        dict
+            A dict mapping each value to the number of records having it.
+        """
+        if field not in self.index_fields:
+            raise KeyError(f"Field [{field}] is not indexed: {self.index_fields}")
+        return {value: len(records) for value, records in self._index(field).items()}
+
+
+class MachineTable(RecordTable):
+    """Machine records as returned by `get_machine_status()`, keyed by `DNSName`.
+
+    Indexed fields are `DNSName`, `DesktopGroupName`, `SessionUserName`,
+    `AssociatedUserUPNs` and all mapped state fields (see
+    `psytricks.mappings.by_keyword`).
+    """
+
+    key_field = "DNSName"
+    index_fields = (
+        "AssociatedUserUPNs",
+        "DesktopGroupName",
+        "DNSName",
+        "SessionUserName",
+    ) + tuple(by_keyword)
+
+    def in_group(self, group: str) -> list[dict]:
+        """Get all machines of a Delivery Group.
+
+        Parameters
+        ----------
+        group : str
+            The name of the Delivery Group.
+
+        Returns
+        -------
+        list(dict)
+        """
+        return self.lookup("DesktopGroupName", group)
+
+
+class SessionTable(RecordTable):
+    """Session records as returned by `get_sessions()`, keyed by `Uid`.
+
+    Indexed fields are `DNSName`, `DesktopGroupName`, `UserName`, `UserUPN` and
+    all mapped state fields (see `psytricks.mappings.by_keyword`).
+    """
+
+    key_field = "Uid"
+    index_fields = (
+        "DesktopGroupName",
+        "DNSName",
+        "UserName",
+        "UserUPN",
+    ) + tuple(by_keyword)
+
+    def on_machine(self, machine: str) -> dict | None:
+        """Get the session on a machine.
+
+        Parameters
+        ----------
+        machine : str
+            The FQDN of the machine.
+
+        Returns
+        -------
+        dict or None
+            The session record or `None` if the machine has no session.
+        """
+        sessions = self.lookup("DNSName", machine)
+        return sessions[0] if sessions else None
+
+    def of_user(self, username: str) -> list[dict]:
+        """Get the sessions of a user.
+
+        Parameters
+        ----------
+        username : str
+            The user, either as the `UserName` (including the domain) or as the
+            user's `UserUPN`.
+
+        Returns
+        -------
+        list(dict)
+        """
+        if "@" in username:
+            return self.lookup("UserUPN", username)
+        return self.lookup("UserName", username)
+
+
+class Snapshot:
+    """A combined snapshot of machines and sessions, joined on `DNSName`.
+
+    Parameters
+    ----------
+    machines : MachineTable or Iterable[dict]
+        The machines, e.g. as returned by `get_machine_status()`.
+    sessions : SessionTable or Iterable[dict]
+        The sessions, e.g. as returned by `get_sessions()`.
+    """
+
+    def __init__(
+        self,
+        machines: MachineTable | Iterable[dict],
+        sessions: SessionTable | Iterable[dict],
+    ):
+        if not isinstance(machines, MachineTable):
+            machines = MachineTable(machines)
+        if not isinstance(sessions, SessionTable):
+            sessions = SessionTable(sessions)
+        self.machines: MachineTable = machines
+        self.sessions: SessionTable = sessions
+
+    def session_of(self, machine: dict | str) -> dict | None:
+        """Get the session running on a machine.
+
+        Parameters
+        ----------
+        machine : dict or str
+            The machine record or its FQDN.
+
+        Returns
+        -------
+        dict or None
+        """
+        if isinstance(machine, dict):
+            machine = machine["DNSName"]
+        return self.sessions.on_machine(machine)
+
+    def machine_of(self, session: dict | str) -> dict | None:
+        """Get the machine a session is running on.
+
+        Parameters
+        ----------
+        session : dict or str
+            The session record or the FQDN of the machine.
+
+        Returns
+        -------
+        dict or None
+        """
+        if isinstance(session, dict):
+            session = session["DNSName"]
+        return self.machines.get(session)
@@ -0,0 +1,509 @@
+"""Long-running PowerShell worker processes.
+
+Starting a PowerShell process and loading the Citrix snap-in takes something
+like 1-2 seconds, which `psytricks.wrapper.PSyTricksWrapper` has to pay for every
+single command in its default mode. The `PowerShellWorker` in here instead keeps
+one process (running `psytricks-worker.ps1`) alive and sends the commands to it
+as JSON lines through `stdin`, reading the responses from `stdout`. Several of
+them can be combined into a `PowerShellWorkerPool` to process commands in
+parallel.
+"""
+
+import itertools
+import json
+import queue
+import subprocess
+import threading
+from collections import deque
+from os.path import dirname
+from pathlib import Path
+
+from loguru import logger as log
+
+from .decoder import decode_powershell_json
+
+FRAME_MARKER = "##PSYTRICKS##"
+"""The prefix of every response line written by the worker script."""
+
+
+class PowerShellWorker:
+    """A persistent PowerShell process processing wrapper commands.
+
+    The process is started on the first call (or explicitly through `start()`)
+    and will be restarted automatically in case it has died in the meantime.
+    Calls are serialized, i.e. a single worker processes one command at a time
+    (use a `PowerShellWorkerPool` for running commands concurrently).
+
+    Parameters
+    ----------
+    ps_exe : pathlib.Path
+        Path to the PowerShell executable itself (i.e. the *interpreter*).
+    deliverycontroller : str
+        The address of the Citrix Delivery Controller to connect to.
+    add_flags : list(str), optional
+        Additional flags to pass on to the worker script, e.g. `["-Dummy",
+        "-NoSnapIn"]` for testing.
+    timeout : float, optional
+        The default time in seconds to wait for the response to a command,
+        `None` (default) means to wait forever. A call running into the timeout
+        will **kill** the worker process (it will be restarted on the next call)
+        and raise a `TimeoutError`.
+    start_timeout : float, optional
+        The time in seconds to wait for a freshly started process to respond to
+        the initial health check (which includes loading the snap-in), by
+        default 60.
+
+    Attributes
+    ----------
+    psworker : pathlib.Path
+        The path to the PowerShell worker script (class variable!).
+    calls : int
+        The number of commands processed by the current process.
+    restarts : int
+        The number of times the process had to be restarted after a crash or a
+        timeout.
+    start_memory : int
+        The memory usage (working set, in bytes) of the current process right
+        after it has been started.
+    """
+
+    psworker = Path(dirname(__file__)) / "__ps1__" / "psytricks-worker.ps1"
+
+    def __init__(  # pylint: disable-msg=too-many-arguments
+        self,
+        ps_exe: Path,
+        deliverycontroller: str,
+        add_flags: list | None = None,
+        timeout: float | None = None,
+        start_timeout: float = 60.0,
+    ):
+        self.ps_exe = ps_exe
+        self.deliverycontroller = deliverycontroller
+        self.add_flags = add_flags if add_flags else []
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.calls = 0
+        self.restarts = 0
+        self.start_memory = 0
+
+        self._proc: subprocess.Popen | None = None
+        self._responses: queue.Queue = queue.Queue()
+        self._stderr: deque = deque(maxlen=20)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        """Enter the context manager, starting the worker process."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        """Leave the context manager, stopping the worker process."""
+        self.stop()
+
+    @property
+    def pid(self) -> int | None:
+        """The process ID of the worker or `None` if it's not running."""
+        return self._proc.pid if self._proc else None
+
+    @property
+    def is_alive(self) -> bool:
+        """`True` in case the worker process is running."""
+        return self._proc is not None and self._proc.poll() is None
+
+    def _build_command(self) -> list:
+        """Assemble the command line for starting the PowerShell worker script."""
+        command = [
+            self.ps_exe,
+            "-NonInteractive",
+            "-NoProfile",
+            "-File",
+            self.psworker,
+            "-AdminAddress",
+            self.deliverycontroller,
+        ]
+        return command + self.add_flags
+
+    def _read_stdout(self, proc: subprocess.Popen, responses: queue.Queue) -> None:
+        """Reader thread pushing the framed responses into the queue."""
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if line.startswith(FRAME_MARKER):
+                responses.put(line[len(FRAME_MARKER) :])
+            elif line:
+                log.trace(f"Ignoring unframed worker output: {line}")
+        # signal the end of the stream to a potentially waiting caller:
+        responses.put(None)
+
+    def _read_stderr(self, proc: subprocess.Popen) -> None:
+        """Reader thread logging the worker's `stderr` (and keeping its tail)."""
+        for raw in proc.stderr:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if line:
+                log.warning(f"PowerShell worker [{proc.pid}] STDERR: {line}")
+                self._stderr.append(line)
+
+    def start(self) -> None:
+        """Start the worker process (unless running) and wait until it's ready.
+
+        Raises
+        ------
+        RuntimeError
+            Raised in case the process died or didn't respond to the initial
+            health check within `start_timeout`.
+        """
+        with self._lock:
+            if self.is_alive:
+                return
+
+            if self._proc is not None:
+                log.warning(f"PowerShell worker [{self.pid}] is gone, restarting...")
+                self.restarts += 1
+            self.calls = 0
+            self._stderr.clear()
+            # use a fresh queue, so nothing of a previous process can leak in:
+            self._responses = queue.Queue()
+
+            command = self._build_command()
+            log.debug(f"Starting PowerShell worker: {command}")
+            self._proc = subprocess.Popen(  # pylint: disable-msg=consider-using-with
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            threading.Thread(
+                target=self._read_stdout,
+                args=(self._proc, self._responses),
+                daemon=True,
+            ).start()
+            threading.Thread(
+                target=self._read_stderr, args=(self._proc,), daemon=True
+            ).start()
+
+            try:
+                info = self._send("Ping", {}, self.start_timeout)["Data"]
+            except (TimeoutError, RuntimeError) as ex:
+                raise RuntimeError(
+                    f"Starting the PowerShell worker failed: {ex}"
+                ) from ex
+
+            self.start_memory = info["WorkingSet"]
+            log.debug(f"PowerShell worker [{self.pid}] is up 🚀")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the worker process, killing it if it doesn't exit in time.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time in seconds to wait for the process to exit after its input
+            stream has been closed, by default 5.
+        """
+        with self._lock:
+            proc = self._proc
+            if proc is None:
+                return
+
+            if proc.poll() is None:
+                log.debug(f"Stopping PowerShell worker [{proc.pid}]...")
+                try:
+                    proc.stdin.close()
+                    proc.wait(timeout=timeout)
+                except (OSError, subprocess.TimeoutExpired):
+                    log.warning(f"PowerShell worker [{proc.pid}] didn't exit, killing.")
+                    proc.kill()
+                    proc.wait()
+            self._proc = None
+
+    def kill(self) -> None:
+        """Kill the worker process immediately (it will restart on next use)."""
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                log.warning(f"Killing PowerShell worker [{self._proc.pid}]!")
+                self._proc.kill()
+                self._proc.wait()
+
+    def _send(self, command: str, parameters: dict, timeout: float | None) -> dict:
+        """Send a request to the running process and wait for its response."""
+        request_id = next(self._ids)
+        line = json.dumps(
+            {"Id": request_id, "CommandName": command, "Parameters": parameters}
+        )
+        try:
+            self._proc.stdin.write(line.encode("utf-8") + b"\n")
+            self._proc.stdin.flush()
+        except OSError as ex:
+            raise RuntimeError(
+                f"Sending [{command}] to the worker failed: {ex}"
+            ) from ex
+
+        while True:
+            try:
+                response = self._responses.get(timeout=timeout)
+            except queue.Empty as ex:
+                self.kill()
+                raise TimeoutError(
+                    f"No response from the PowerShell worker for [{command}] "
+                    f"within {timeout}s, the worker was terminated!"
+                ) from ex
+
+            if response is None:
+                self._proc.wait()
+                stderr = "\n".join(self._stderr)
+                raise RuntimeError(
+                    f"PowerShell worker died (exit code {self._proc.returncode}) "
+                    f"while processing [{command}]:\n============\n{stderr}"
+                    "\n============\n"
+                )
+
+            try:
+                parsed = decode_powershell_json(response)
+            except json.JSONDecodeError as ex:
+                raise ValueError(f"Error parsing worker response:\n{response}") from ex
+
+            if parsed.get("Id") == request_id:
+                return parsed
+            log.warning(f"Discarding unexpected worker response: {parsed.get('Id')}")
+
+    def call(
+        self, command: str, parameters: dict | None = None, timeout: float | None = None
+    ) -> dict:
+        """Have the worker process a command and return the parsed response.
+
+        Parameters
+        ----------
+        command : str
+            The command name, one of `psytricks.literals.RequestName`.
+        parameters : dict, optional
+            The parameters of the command, using the parameter names of the
+            wrapper script (without the leading dash), e.g. `{"DNSName": ...}`.
+            Switches (like `Disable`) are given as booleans.
+        timeout : float, optional
+            Override the worker's default `timeout` for this call.
+
+        Returns
+        -------
+        dict
+            The parsed JSON response with the `Status` and `Data` items.
+
+        Raises
+        ------
+        TimeoutError
+            Raised in case no response was received in time (the process will
+            be killed in that case).
+        RuntimeError
+            Raised in case the process died while processing the command.
+        ValueError
+            Raised in case the response couldn't be parsed.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        with self._lock:
+            self.start()
+            response = self._send(command, parameters if parameters else {}, timeout)
+            self.calls += 1
+
+        return response
+
+    def ping(self, timeout: float = 10.0) -> dict:
+        """Check the health of the worker process.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time in seconds to wait for the response, by default 10.
+
+        Returns
+        -------
+        dict
+            Details on the worker process with the keys `ProcessId`,
+            `WorkingSet` (memory usage in bytes), `Calls` (number of commands
+            processed) and `Uptime` (in seconds).
+        """
+        with self._lock:
+            self.start()
+            return self._send("Ping", {}, timeout)["Data"]
+
+
+class PowerShellWorkerPool:
+    """A pool of persistent PowerShell processes processing commands in parallel.
+
+    Each call is dispatched to an idle worker, blocking until one becomes
+    available if all of them are busy (i.e. at most `size` commands are being
+    processed at the same time). Workers are *recycled* (stopped and started
+    afresh on their next use) after processing `max_calls` commands or in case
+    their memory usage has grown by more than `max_memory_growth`, so leaks in
+    the PowerShell / Citrix stack can't accumulate in long-running processes.
+
+    Parameters
+    ----------
+    ps_exe : pathlib.Path
+        Path to the PowerShell executable itself (i.e. the *interpreter*).
+    deliverycontroller : str
+        The address of the Citrix Delivery Controller to connect to.
+    add_flags : list(str), optional
+        Additional flags to pass on to the worker scripts.
+    size : int, optional
+        The number of worker processes, by default 4.
+    timeout : float, optional
+        The default time in seconds to wait for the response to a command, see
+        `PowerShellWorker` for details.
+    max_calls : int, optional
+        The number of commands after which a worker is recycled, by default
+        500. Use `0` to disable recycling based on the number of calls.
+    max_memory_growth : int, optional
+        The growth of a worker's memory usage (in bytes, compared to the usage
+        right after its start) that will have it recycled, by default 512 MiB.
+        Use `0` to disable recycling based on memory usage.
+    check_every : int, optional
+        The number of commands after which a worker's memory usage is checked
+        (through `PowerShellWorker.ping()`), by default 25.
+
+    Attributes
+    ----------
+    workers : list(PowerShellWorker)
+        The worker objects of the pool.
+    recycled : int
+        The number of times a worker has been recycled.
+    """
+
+    def __init__(  # pylint: disable-msg=too-many-arguments
+        self,
+        ps_exe: Path,
+        deliverycontroller: str,
+        add_flags: list | None = None,
+        size: int = 4,
+        timeout: float | None = None,
+        max_calls: int = 500,
+        max_memory_growth: int = 512 * 1024 * 1024,
+        check_every: int = 25,
+    ):
+        self.max_calls = max_calls
+        self.max_memory_growth = max_memory_growth
+        self.check_every = check_every
+        self.recycled = 0
+        self.workers = [
+            PowerShellWorker(
+                ps_exe=ps_exe,
+                deliverycontroller=deliverycontroller,
+                add_flags=add_flags,
+                timeout=timeout,
+            )
+            for _ in range(size)
+        ]
+
+        self._idle: queue.Queue = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def __enter__(self):
+        """Enter the context manager, starting all worker processes."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        """Leave the context manager, stopping all worker processes."""
+        self.stop()
+
+    @property
+    def size(self) -> int:
+        """The number of worker processes in the pool."""
+        return len(self.workers)
+
+    def start(self) -> None:
+        """Start all worker processes (in parallel) and wait until they're ready.
+
+        Raises
+        ------
+        RuntimeError
+            Raised in case any of the workers failed to start.
+        """
+        errors = []
+
+        def start_worker(worker: PowerShellWorker):
+            try:
+                worker.start()
+            except RuntimeError as ex:
+                errors.append(ex)
+
+        threads = [
+            threading.Thread(target=start_worker, args=(worker,), daemon=True)
+            for worker in self.workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        log.debug(f"PowerShell worker pool ({self.size}) is up 🚀")
+
+    def stop(self) -> None:
+        """Stop all worker processes."""
+        for worker in self.workers:
+            worker.stop()
+
+    def _recycle(self, worker: PowerShellWorker) -> None:
+        """Stop a worker if it's due for recycling (it restarts on next use)."""
+        reason = ""
+        if self.max_calls and worker.calls >= self.max_calls:
+            reason = f"{worker.calls} calls"
+        elif (
+            self.max_memory_growth
+            and self.check_every
+            and worker.calls % self.check_every == 0
+            and worker.is_alive
+        ):
+            growth = worker.ping()["WorkingSet"] - worker.start_memory
+            if growth > self.max_memory_growth:
+                reason = f"memory usage grew by {growth // 1024 // 1024} MiB"
+
+        if reason:
+            log.debug(f"Recycling PowerShell worker [{worker.pid}]: {reason} ♻️")
+            worker.stop()
+            self.recycled += 1
+
+    def call(
+        self, command: str, parameters: dict | None = None, timeout: float | None = None
+    ) -> dict:
+        """Have the next idle worker process a command.
+
+        See `PowerShellWorker.call()` for details on parameters and exceptions.
+
+        Returns
+        -------
+        dict
+            The parsed JSON response with the `Status` and `Data` items.
+        """
+        worker = self._idle.get()
+        try:
+            return worker.call(command, parameters, timeout)
+        finally:
+            try:
+                self._recycle(worker)
+            except Exception as ex:  # pylint: disable-msg=broad-except
+                log.warning(f"Health check of worker [{worker.pid}] failed: {ex}")
+                worker.kill()
+            self._idle.put(worker)
+
+    def ping(self) -> list[dict]:
+        """Check the health of all worker processes.
+
+        Workers that are currently busy will be checked once they are idle
+        again, so this may block until all running commands are completed.
+
+        Returns
+        -------
+        list(dict)
+            The details on every worker, see `PowerShellWorker.ping()`.
+        """
+        taken = [self._idle.get() for _ in self.workers]
+        try:
+            return [worker.ping() for worker in taken]
+        finally:
+            for worker in taken:
+                self._idle.put(worker)
@@ -1,74 +1,164 @@
 """PowerShell Python Citrix Tricks."""
 
+import codecs
 import subprocess
 import json
 import os
+import threading
 import time
 
+from collections import OrderedDict
 from os.path import dirname
 from pathlib import Path
 from sys import platform
+from typing import Any, Iterable, Iterator, get_args
+from urllib.parse import urlencode
 
 import requests
 from loguru import logger as log
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 from . import __version__
-from .decoder import parse_powershell_json
-from .literals import Action, RequestName, MsgStyle
+from .bulk import BulkActionsMixin
+from .cache import ResponseCache, command_of
+from .capture import ResponseCapture, response_latency
+from .decoder import convert_powershell_objects
+from .diff import WatchMixin
+from .literals import (
+    Action,
+    MachineFilter,
+    MachineProperty,
+    MsgStyle,
+    RequestName,
+    SessionFilter,
+    SessionProperty,
+)
+from .metrics import ClientMetrics
+from .streaming import NDJSON_TYPE, EnvelopeParser, decode_chunks, parser_for
+from .tables import MachineTable, SessionTable, Snapshot
+from .worker import PowerShellWorker, PowerShellWorkerPool
+
+
+def validate_fields(fields: Iterable[str] | None, valid: Any) -> list[str]:
+    """Validate a field projection against the valid property names.
 
+    Parameters
+    ----------
+    fields : Iterable[str] or None
+        The requested property names, may be `None` or empty to request all.
+    valid : Literal
+        The `Literal` defining the valid names, e.g.
+        `psytricks.literals.MachineProperty`.
+
+    Returns
+    -------
+    list(str)
+        The requested names (without duplicates), empty if all properties have
+        been requested.
 
-class ResTricksWrapper:
-    """Perform requests to a ResTricks service and process the responses.
+    Raises
+    ------
+    ValueError
+        Raised in case any of the requested names is not a valid property.
+    """
+    if not fields:
+        return []
+    if isinstance(fields, str):
+        fields = fields.split(",")
+
+    fields = list(dict.fromkeys(x.strip() for x in fields if x.strip()))
+    invalid = [x for x in fields if x not in get_args(valid)]
+    if invalid:
+        raise ValueError(f"Invalid field(s) requested: {', '.join(invalid)}")
+
+    return fields
+
+
+def validate_filters(filters: dict | None, valid: Any) -> dict[str, str]:
+    """Validate filters against the valid filter names.
 
     Parameters
     ----------
-    base_url : str, optional
-        The base URL where to find the ResTricks service. Will default to
-        `http://localhost:8080/` if nothing is specified.
-    verify : bool, optional
-        Validate the server version as soon as a connection is established. Set
-        to `False` to disable the version check and ignore potential problems
-        during the connection check.
-    lazy : bool, optional
-        By default the constructor will try to establish a connection to the
-        ResTricks service. If this is set to `True`, the connection will only be
-        established once a request has to be sent to the server but not during
-        instantiation.
+    filters : dict or None
+        The requested filters, mapping filter names to values. Boolean values
+        will be converted to `true` / `false`, filters with a value of `None`
+        will be dropped.
+    valid : Literal
+        The `Literal` defining the valid names, e.g.
+        `psytricks.literals.MachineFilter`.
+
+    Returns
+    -------
+    dict(str, str)
+        The filters with their values converted to strings.
 
-    Attributes
+    Raises
+    ------
+    ValueError
+        Raised in case any of the filter names is invalid.
+    """
+    if not filters:
+        return {}
+
+    invalid = [x for x in filters if x not in get_args(valid)]
+    if invalid:
+        raise ValueError(f"Invalid filter(s) requested: {', '.join(invalid)}")
+
+    converted = {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        converted[name] = str(value)
+
+    return converted
+
+
+def with_query(command: str, params: dict) -> str:
+    """Append the (non-empty) params as a query string to a command name.
+
+    Parameters
     ----------
-    base_url : str
-        See the constructor for details.
-    timeout : int
-        The timeout in seconds to use for `requests.get` and `requests.post`
-        calls, defaulting to 5.
-    server_version : list
-        The server version as a list of version components, where the first
-        three components are of type `int` (representing `major.minor.patch`),
-        whereas the last component may be a `str` as well.
-    headers : dict
-        A dict of headers to be sent along the requests.
+    command : str
+        The command name, e.g. `GetMachineStatus`.
+    params : dict
+        The query parameters, list values will be joined by commas.
+
+    Returns
+    -------
+    str
+        The command name followed by the query string (if any), e.g.
+        `GetMachineStatus?fields=DNSName,PowerState`.
     """
+    query = {}
+    for name, value in params.items():
+        if isinstance(value, (list, tuple)):
+            value = ",".join(str(x) for x in value)
+        if value is None or value == "":
+            continue
+        query[name] = value
 
-    def __init__(self, base_url: str = "", verify: bool = True, lazy: bool = False):
-        self.base_url = "http://localhost:8080/" if not base_url else base_url
-        self.timeout = 5
-        self.server_version = [0, 0, 0, 0]
+    if not query:
+        return command
 
-        # FIXME: currently "localhost" is hardcoded here as this is what the
-        # service expects (see `Listener.Prefixes` in `restricks-server.ps1` for
-        # the details) - this should be made configurable!
-        self.headers = {"Host": "localhost"}
+    return f"{command}?{urlencode(query, safe=',*')}"
 
-        self._connected = False
-        self._verify = verify
-        self._read_only = False
-        self._dump_responses_to = None
 
-        if not lazy:
-            self.connect()
+class ResTricksBase:
+    """Common functionality of the (sync and async) ResTricks wrapper classes.
 
-        log.debug(f"Initialized {self.__class__.__name__}({base_url}) ✨")
+    Not meant to be instantiated directly, use `ResTricksWrapper` or
+    `psytricks.asyncwrapper.AsyncResTricksWrapper` instead.
+    """
+
+    base_url: str
+    server_version: list
+    metrics: ClientMetrics
+    capture: ResponseCapture | None
+    _read_only: bool
+    _dump_responses_to: Path | None
 
     @property
     def read_only(self) -> bool:
@@ -96,6 +186,9 @@ class ResTricksWrapper:
     def dump_responses_to(self) -> Path | None:
         """Path to dump responses to - **DO NOT USE IN PRODUCTION**.
 
+        See `psytricks.capture.ResponseCapture` (assigned to `capture`) for a
+        sampled capture suitable for production use.
+
         Default: `None`, meaning responses will **not** be written to disk.
 
         If `dump_responses_to` is set to a valid path, any response returned
@@ -110,8 +203,13 @@ class ResTricksWrapper:
         * `<status>`: the HTTP status of the response
         * `<timestamp>`: milliseconds since the epoch
 
+        Next to each dump, a `<command>-<method>-<status>-<timestamp>.meta.json`
+        file records the full request URL (including the query), the content
+        type and the latency of the response in seconds.
+
         This is intended for debugging and may also be used to craft data mocks
-        based on real data that can be used for testing.
+        based on real data that can be used for testing, or to replay recorded
+        traffic through `psytricks.replay.ReplayServer`.
 
         Notes
         -----
@@ -130,42 +228,6 @@ class ResTricksWrapper:
         log.debug(f"Setting 'dump-responses' path: {target}")
         self._dump_responses_to = value
 
-    def connect(self) -> None:
-        """Connect to the ResTricks service unless already connected.
-
-        Raises
-        ------
-        ValueError
-            Raised in case the server version doesn't match the local version.
-        ConnectionError
-            Raised in case the initial connection check failed.
-        """
-        if self._connected:
-            log.trace("Connection 🔌 established previously, not reconnecting.")
-            return
-
-        log.debug(f"Trying to connect 🔌 to the ResTricks server: {self.base_url}")
-
-        try:
-            status = self.send_get_request("version", auto_conn=False)["Status"]
-            log.trace(f"Server status: [{status}]")
-            server_version = status["PSyTricksVersion"]
-
-            log.debug("Successfully connected 🔌 to ResTricks server 🆗")
-            if self._verify:
-                version_matching = self.validate_version(server_version)
-                if not version_matching:
-                    raise ValueError(f"Unexpected server version: {server_version}")
-            else:
-                log.warning(f"Skipping version check (server: {server_version})")
-            self._connected = True
-
-        except Exception as ex:  # pylint: disable-msg=broad-except
-            if self._verify:
-                raise ConnectionError(
-                    f"Connecting to {self.base_url} failed: {ex}"
-                ) from ex
-
     def validate_version(self, server_ver) -> bool:
         """Validate the server version against the local module.
 
@@ -225,14 +287,24 @@ class ResTricksWrapper:
         log.error("Version mismatch! 🧨")
         return False
 
-    def _check_response(self, response: requests.Response) -> None:
-        """Check the HTTP response code and JSON status attributes."""
+    def _record_response(self, response: requests.Response) -> None:
+        """Dump and / or capture a (fully received) response, if enabled.
+
+        Called before the body is decoded, so responses that can't be decoded
+        (e.g. an HTML error page) are recorded as well.
+        """
         self._write_response_dump(response)
+        if self.capture is not None:
+            self.capture.record(response, str(response.url).removeprefix(self.base_url))
 
+    def _check_response(self, response: requests.Response) -> None:
+        """Check the HTTP response code and JSON status attributes."""
         if response.status_code == 200:
             return
 
         log.warning(f"Response code {response.status_code} indicates a problem!")
+        command = command_of(str(response.url).removeprefix(self.base_url))
+        self.metrics.count_error(command, "request", f"HTTP {response.status_code}")
 
         payload = response.json()
         try:
@@ -249,6 +321,33 @@ class ResTricksWrapper:
             log.warning(response.text)
             raise ValueError(f"Malformed response: {response.text}") from ex
 
+    def _decode_content(self, command: str, content: bytes) -> Any:
+        """Decode a response body, recording its size and the decoding phases.
+
+        Parameters
+        ----------
+        command : str
+            The command name (for the metrics), e.g. `GetMachineStatus`.
+        content : bytes
+            The body of the response.
+
+        Returns
+        -------
+        Any
+            The decoded and converted JSON, see
+            `psytricks.decoder.decode_powershell_json`.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            Raised in case `content` is not a valid JSON document.
+        """
+        self.metrics.observe_size(command, len(content))
+        with self.metrics.timed(command, "decode"):
+            data = json.loads(content)
+        with self.metrics.timed(command, "mapping"):
+            return convert_powershell_objects(data)
+
     def _write_response_dump(self, response: requests.Response) -> Path | None:
         """Dump the response to disk if `dump_responses_to` is set."""
         if not self.dump_responses_to:
@@ -259,7 +358,7 @@ class ResTricksWrapper:
             method = response.request.method
             url = str(response.request.url)
             log.trace(f"🌐 Request URL: {url}")
-            command = url.removeprefix(self.base_url).replace("/", "-")
+            command = url.removeprefix(self.base_url).split("?")[0].replace("/", "-")
             status = str(response.status_code)
             filename = f"{command}-{method}-{status}-{timestamp}.txt"
             full_path = self.dump_responses_to / filename
@@ -269,9 +368,253 @@ class ResTricksWrapper:
 
             with open(full_path, "w", encoding="utf8") as outfile:
                 outfile.write(response.text)
+
+            meta = {
+                "url": url.removeprefix(self.base_url),
+                "method": method,
+                "status": response.status_code,
+                "content_type": response.headers.get("Content-Type", ""),
+                "latency": response_latency(response),
+            }
+            meta_path = full_path.with_suffix(".meta.json")
+            with open(meta_path, "x", encoding="utf8") as outfile:
+                json.dump(meta, outfile)
         except Exception as ex:
             log.error(f"🔥 Error dumping response: {ex}")
 
+
+class ResTricksWrapper(ResTricksBase, BulkActionsMixin, WatchMixin):
+    """Perform requests to a ResTricks service and process the responses.
+
+    Parameters
+    ----------
+    base_url : str, optional
+        The base URL where to find the ResTricks service. Will default to
+        `http://localhost:8080/` if nothing is specified.
+    verify : bool, optional
+        Validate the server version as soon as a connection is established. Set
+        to `False` to disable the version check and ignore potential problems
+        during the connection check.
+    lazy : bool, optional
+        By default the constructor will try to establish a connection to the
+        ResTricks service. If this is set to `True`, the connection will only be
+        established once a request has to be sent to the server but not during
+        instantiation.
+    pool_size : int, optional
+        The maximum number of connections to keep in the pool (and therefore
+        the maximum number of parallel connections to the ResTricks host),
+        defaulting to 10.
+    pool_block : bool, optional
+        If set to `True`, requests will block until a pooled connection becomes
+        available instead of opening additional (non-pooled) connections once
+        `pool_size` is exhausted. Default is `False`.
+    keep_alive : bool, optional
+        Keep connections open after a request has been completed so they can be
+        re-used by subsequent requests (default). If set to `False`, each
+        request will ask the server to close the connection afterwards.
+    retries : int, optional
+        The number of times a failed `GET` request will be retried (on
+        connection errors or HTTP status codes 502, 503 and 504), default is 0.
+        Note that `POST` requests are **never** retried as they may already have
+        triggered a state change in the Citrix platform.
+    backoff_factor : float, optional
+        The backoff factor used to calculate the delay between retries (see the
+        docs of `urllib3.util.Retry` for details), default is 0.5.
+
+    Attributes
+    ----------
+    base_url : str
+        See the constructor for details.
+    timeout : int
+        The timeout in seconds to use for `GET` and `POST` requests, defaulting
+        to 5.
+    session : requests.Session
+        The session object used for all requests sent to the ResTricks service,
+        holding the connection pool that is shared among all request methods.
+    cache : psytricks.cache.ResponseCache or None
+        An optional cache for the results of `get_machine_status()`,
+        `get_sessions()` and `get_access_users()`. Disabled by default (`None`),
+        set it to a `ResponseCache` instance to enable caching. Cached entries
+        are invalidated automatically after a `POST` request affecting them.
+    conditional_get : bool
+        Send the `ETag` of the previous response along `GET` requests (as
+        `If-None-Match`), so the service can reply with `304 Not Modified` if
+        the data hasn't changed. The previously decoded response will then be
+        returned without transferring or parsing anything. Enabled by default.
+    etag_entries : int
+        The maximum number of (decoded) responses kept for `conditional_get`,
+        the least recently used ones are discarded first. Defaults to 16.
+    metrics : psytricks.metrics.ClientMetrics
+        The latency histograms, payload sizes and error counters of the
+        requests sent by this wrapper.
+    capture : psytricks.capture.ResponseCapture or None
+        Captures (a sample of) the responses received, disabled by default.
+    server_version : list
+        The server version as a list of version components, where the first
+        three components are of type `int` (representing `major.minor.patch`),
+        whereas the last component may be a `str` as well.
+    headers : dict
+        A dict of headers to be sent along the requests.
+    """
+
+    def __init__(  # pylint: disable-msg=too-many-arguments
+        self,
+        base_url: str = "",
+        verify: bool = True,
+        lazy: bool = False,
+        pool_size: int = 10,
+        pool_block: bool = False,
+        keep_alive: bool = True,
+        retries: int = 0,
+        backoff_factor: float = 0.5,
+    ):
+        self.base_url = "http://localhost:8080/" if not base_url else base_url
+        self.timeout = 5
+        self.server_version = [0, 0, 0, 0]
+
+        # FIXME: currently "localhost" is hardcoded here as this is what the
+        # service expects (see `Listener.Prefixes` in `restricks-server.ps1` for
+        # the details) - this should be made configurable!
+        self.headers = {"Host": "localhost"}
+        # the service only supports gzip (see `Send-Response`), so don't
+        # advertise anything else even if e.g. `brotli` is installed locally:
+        self.headers["Accept-Encoding"] = "gzip"
+        if not keep_alive:
+            self.headers["Connection"] = "close"
+
+        self.session = self._create_session(
+            pool_size=pool_size,
+            pool_block=pool_block,
+            retries=retries,
+            backoff_factor=backoff_factor,
+        )
+
+        self.cache: ResponseCache | None = None
+        self.conditional_get = True
+        self.etag_entries = 16
+        self.metrics = ClientMetrics()
+        self.capture = None
+
+        self._etags: OrderedDict[str, tuple[str, Any]] = OrderedDict()
+        self._etags_lock = threading.Lock()
+        self._connected = False
+        self._verify = verify
+        self._read_only = False
+        self._dump_responses_to = None
+
+        if not lazy:
+            self.connect()
+
+        log.debug(f"Initialized {self.__class__.__name__}({base_url}) ✨")
+
+    def __enter__(self):
+        """Enter the context manager, returning the wrapper itself."""
+        return self
+
+    def __exit__(self, *exc):
+        """Leave the context manager, closing the session."""
+        self.close()
+
+    def _create_session(
+        self, pool_size: int, pool_block: bool, retries: int, backoff_factor: float
+    ) -> requests.Session:
+        """Set up a `requests.Session` with a connection pool and retry policy.
+
+        Parameters
+        ----------
+        pool_size : int
+            The maximum number of connections to keep in the pool.
+        pool_block : bool
+            Whether to block when no free connection is available in the pool.
+        retries : int
+            The number of retries for `GET` requests.
+        backoff_factor : float
+            The backoff factor to use for calculating the delay between retries.
+
+        Returns
+        -------
+        requests.Session
+        """
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        # all requests go to a single host, so one pool is sufficient:
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        log.trace(f"Created session 🏊 (pool size: {pool_size}, retries: {retries})")
+        return session
+
+    def close(self) -> None:
+        """Close the session, releasing all pooled connections."""
+        log.trace("Closing session and pooled connections 🏊")
+        self.session.close()
+        self._connected = False
+
+    def connect(self) -> None:
+        """Connect to the ResTricks service unless already connected.
+
+        Raises
+        ------
+        ValueError
+            Raised in case the server version doesn't match the local version.
+        ConnectionError
+            Raised in case the initial connection check failed.
+        """
+        if self._connected:
+            log.trace("Connection 🔌 established previously, not reconnecting.")
+            return
+
+        log.debug(f"Trying to connect 🔌 to the ResTricks server: {self.base_url}")
+
+        with self.metrics.timed("version", "connect"):
+            try:
+                status = self.send_get_request("version", auto_conn=False)["Status"]
+                log.trace(f"Server status: [{status}]")
+                server_version = status["PSyTricksVersion"]
+
+                log.debug("Successfully connected 🔌 to ResTricks server 🆗")
+                if self._verify:
+                    version_matching = self.validate_version(server_version)
+                    if not version_matching:
+                        raise ValueError(f"Unexpected server version: {server_version}")
+                else:
+                    log.warning(f"Skipping version check (server: {server_version})")
+                self._connected = True
+
+            except Exception as ex:  # pylint: disable-msg=broad-except
+                if self._verify:
+                    raise ConnectionError(
+                        f"Connecting to {self.base_url} failed: {ex}"
+                    ) from ex
+
+    def _etag_of(self, raw_url: str) -> tuple[str, Any] | None:
+        """Get the `ETag` and data of the previous response for a URL (if any)."""
+        with self._etags_lock:
+            previous = self._etags.get(raw_url)
+            if previous is not None:
+                self._etags.move_to_end(raw_url)
+            return previous
+
+    def _store_etag(self, raw_url: str, etag: str, data: Any) -> None:
+        """Remember a response for `conditional_get`, evicting the oldest ones."""
+        with self._etags_lock:
+            self._etags[raw_url] = (etag, data)
+            self._etags.move_to_end(raw_url)
+            while len(self._etags) > self.etag_entries:
+                evicted, _ = self._etags.popitem(last=False)
+                log.trace(f"Discarded ETag of [{evicted}] 🗑️")
+
     def send_get_request(
         self, raw_url: str, auto_conn: bool = True
     ) -> list[dict] | dict | None:
@@ -291,21 +634,42 @@ class ResTricksWrapper:
         list or dict or None
             The parsed `JSON` of the response, often a dict or a list of dict.
             Will be an empty list in case something went wrong performing the
-            GET request or processing the response.
+            GET request or processing the response. If `conditional_get` is
+            enabled and the service reports the data as not modified, this will
+            be the **very same object** returned by the previous request for
+            `raw_url` - make sure to not modify it in place!
         """
         if auto_conn:
             self.connect()
 
+        command = command_of(raw_url)
+        headers = self.headers
+        previous = self._etag_of(raw_url) if self.conditional_get else None
+        if previous:
+            headers = {**self.headers, "If-None-Match": previous[0]}
+
         try:
-            response = requests.get(
-                self.base_url + raw_url, timeout=self.timeout, headers=self.headers
-            )
+            with self.metrics.timed(command, "request"):
+                response = self.session.get(
+                    self.base_url + raw_url,
+                    timeout=self.timeout,
+                    headers=headers,
+                    stream=True,
+                )
+            with self.metrics.timed(command, "transfer"):
+                content = response.content
         except Exception as ex:  # pylint: disable-msg=broad-except
             log.error(f"GET request [{raw_url}] failed: {ex}")
             raise ex
 
+        self._record_response(response)
+
+        if response.status_code == 304 and previous:
+            log.trace(f"[{raw_url}] not modified ({previous[0]}), re-using data ♻️")
+            return previous[1]
+
         try:
-            data = response.json(object_hook=parse_powershell_json)
+            data = self._decode_content(command, content)
         except json.JSONDecodeError as ex:
             msg = (
                 f"Decoding JSON failed at pos {ex.pos}\n"
@@ -323,6 +687,10 @@ class ResTricksWrapper:
 
         self._check_response(response)
 
+        etag = response.headers.get("ETag")
+        if self.conditional_get and etag and response.status_code == 200:
+            self._store_etag(raw_url, etag, data)
+
         return data
 
     def send_post_request(
@@ -358,10 +726,12 @@ class ResTricksWrapper:
         In case the object's instance attribute `read_only` is set to `True`,
         this method will **NOT perform an actual `POST` request** (as this would
         potentially lead to a state-change in the Citrix platform) but rather
-        issue a `WARNING` level log message and return an empty list.
+        issue a `WARNING` level log message and return a dict with an empty
+        list as its `Data` item (or an empty list if `no_json` is set).
         """
         self.connect()
 
+        command = command_of(raw_url)
         if self.read_only:
             log.warning(
                 f"{self.__class__.__name__} is running in READ-ONLY mode, the "
@@ -369,30 +739,179 @@ class ResTricksWrapper:
                 f"> raw_url: [{raw_url}]\n"
                 f"> payload:\n------\n{payload}\n------\n"
             )
-            return []
+            self.metrics.count_read_only(command)
+            return [] if no_json else {"Data": []}
 
         try:
-            response = requests.post(
-                self.base_url + raw_url,
-                json=payload,
-                timeout=self.timeout,
-                headers=self.headers,
-            )
+            with self.metrics.timed(command, "request"):
+                response = self.session.post(
+                    self.base_url + raw_url,
+                    json=payload,
+                    timeout=self.timeout,
+                    headers=self.headers,
+                    stream=True,
+                )
+            with self.metrics.timed(command, "transfer"):
+                content = response.content
         except Exception as ex:  # pylint: disable-msg=broad-except
             log.error(f"POST request [{raw_url}] failed: {ex}")
             raise ex
 
+        self._record_response(response)
         self._check_response(response)
 
+        if self.cache is not None and response.status_code == 200:
+            self.cache.invalidate_after(raw_url, payload)
+
         if no_json:
             log.debug(f"No-payload response status code: {response.status_code}")
             return []
 
-        return response.json(object_hook=parse_powershell_json)
+        return self._decode_content(command, content)
+
+    def _get_data(self, raw_url: str) -> list[dict] | dict | None:
+        """Get the `Data` part of a `GET` request, using the cache if enabled.
+
+        Parameters
+        ----------
+        raw_url : str
+            The part of the URL that will be appended to `self.base_url`.
+
+        Returns
+        -------
+        list or dict or None
+        """
+        if self.cache is None:
+            return self.send_get_request(raw_url)["Data"]
+
+        return self.cache.get(raw_url, lambda: self.send_get_request(raw_url)["Data"])
+
+    def _iter_data(self, raw_url: str) -> Iterator[dict]:
+        """Perform a `GET` request and stream the items of its `Data` part.
+
+        The response body is parsed incrementally while it is being received,
+        each item is handed out as soon as it is complete. The service is asked
+        to send the listing as NDJSON, but a JSON document is accepted as well
+        (e.g. from an older service version). Bypasses the cache (if enabled).
+        Note that if `dump_responses_to` is set, the full body will be received
+        first in order to dump it. If `capture` is set, the body is collected
+        while streaming and recorded once it is complete.
+
+        Parameters
+        ----------
+        raw_url : str
+            The part of the URL that will be appended to `self.base_url`.
+
+        Yields
+        ------
+        dict
 
-    def get_machine_status(self) -> list:
+        Returns
+        -------
+        dict
+            The other top-level items of the response (i.e. `Status`), available
+            as the value of a `yield from` expression.
+        """
+        self.connect()
+
+        command = command_of(raw_url)
+        headers = {**self.headers, "Accept": f"{NDJSON_TYPE}, application/json;q=0.9"}
+        try:
+            with self.metrics.timed(command, "request"):
+                response = self.session.get(
+                    self.base_url + raw_url,
+                    timeout=self.timeout,
+                    headers=headers,
+                    stream=True,
+                )
+        except Exception as ex:  # pylint: disable-msg=broad-except
+            log.error(f"GET request [{raw_url}] failed: {ex}")
+            raise ex
+
+        parser = parser_for(response.headers.get("Content-Type"))
+        size = 0
+        # a streamed body has to be collected for capturing it:
+        captured = None
+        with response:
+            if response.status_code != 200 or self.dump_responses_to:
+                chunks = [response.content]
+                self._record_response(response)
+                self._check_response(response)
+            else:
+                chunks = response.iter_content(chunk_size=65536)
+                if self.capture is not None and self.capture.wants(raw_url):
+                    captured = []
+
+            # the transfer is interleaved with the processing by the caller, so
+            # only the payload size is recorded (but no transfer / decode time):
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            for chunk in chunks:
+                size += len(chunk)
+                if captured is not None:
+                    captured.append(chunk)
+                yield from parser.feed(decoder.decode(chunk))
+            yield from parser.feed(decoder.decode(b"", final=True))
+            yield from parser.close()
+
+        if captured is not None:
+            self.capture.record(response, raw_url, body=b"".join(captured))
+        self.metrics.observe_size(command, size)
+        log.debug(f"Streamed {parser.count} items from [{raw_url}].")
+        return parser.envelope
+
+    def _iter_listing(
+        self, command: RequestName, params: dict, page_size: int | None
+    ) -> Iterator[dict]:
+        """Stream the items of a listing, optionally requesting it page by page.
+
+        Parameters
+        ----------
+        command : str
+            The listing command, e.g. `GetMachineStatus`.
+        params : dict
+            The query parameters, see `with_query()`.
+        page_size : int or None
+            Request the listing in pages of (at most) this many records, each
+            page starting after the `NextCursor` of the previous one. If empty,
+            the entire listing will be requested at once.
+
+        Yields
+        ------
+        dict
+        """
+        if not page_size:
+            yield from self._iter_data(with_query(command, params))
+            return
+
+        cursor = None
+        while True:
+            query = {**params, "limit": page_size, "after": cursor}
+            envelope = yield from self._iter_data(with_query(command, query))
+            cursor = envelope.get("Status", {}).get("NextCursor")
+            if not cursor:
+                return
+            log.trace(f"Requesting the next page of [{command}] after [{cursor}]")
+
+    def get_machine_status(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> list:
         """Send a `GET` request with `GetMachineStatus`.
 
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties (see
+            `psytricks.literals.MachineProperty`), reducing the amount of data
+            that has to be collected, serialized and transferred. By default
+            all properties are requested. Note that `get_machine_table()` and
+            `watch()` rely on `DNSName` being present.
+        filters : dict, optional
+            Only request machines matching all of these filters, which are
+            evaluated by `Get-BrokerMachine` on the Delivery Controller. Valid
+            names are defined in `psytricks.literals.MachineFilter` (`UserName`
+            matching `SessionUserName`), values may contain wildcards (`*`),
+            e.g. `{"DesktopGroupName": "Group 1", "DNSName": "vm0*"}`.
+
         Returns
         -------
         list(dict)
@@ -415,11 +934,30 @@ class ResTricksWrapper:
                 - `SummaryState`
         """
         log.debug("Requesting current status of machines...")
-        return self.send_get_request("GetMachineStatus")["Data"]
-
-    def get_sessions(self) -> list:
+        fields = validate_fields(fields, MachineProperty)
+        filters = validate_filters(filters, MachineFilter)
+        raw_url = with_query("GetMachineStatus", {"fields": fields, **filters})
+        return self._get_data(raw_url)
+
+    def get_sessions(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> list:
         """Send a `GET` request with `GetSessions`.
 
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties (see
+            `psytricks.literals.SessionProperty`), by default all properties
+            are requested. Note that `get_session_table()` and `watch()` rely
+            on `Uid` and `DNSName` being present.
+        filters : dict, optional
+            Only request sessions matching all of these filters, which are
+            evaluated by `Get-BrokerSession` on the Delivery Controller. Valid
+            names are defined in `psytricks.literals.SessionFilter`
+            (`SummaryState` matching `MachineSummaryState`), values may contain
+            wildcards (`*`), e.g. `{"UserName": "*jdoe"}`.
+
         Returns
         -------
         list(dict)
@@ -444,7 +982,107 @@ class ResTricksWrapper:
                 - `UserUPN`
         """
         log.debug("Requesting current sessions...")
-        return self.send_get_request("GetSessions")["Data"]
+        fields = validate_fields(fields, SessionProperty)
+        filters = validate_filters(filters, SessionFilter)
+        return self._get_data(with_query("GetSessions", {"fields": fields, **filters}))
+
+    def iter_machines(
+        self,
+        fields: Iterable[str] | None = None,
+        filters: dict | None = None,
+        page_size: int | None = None,
+    ) -> Iterator[dict]:
+        """Stream the machine status records of a `GetMachineStatus` request.
+
+        Other than `get_machine_status()`, the response is decoded while it is
+        being received (as NDJSON, unless the service doesn't support it) and
+        each record is handed out as soon as it is complete. Consumers that
+        only aggregate or filter the records therefore never need to hold the
+        full listing (or the full response body) in memory.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, see `get_machine_status()`.
+            When using `page_size`, `DNSName` will always be included.
+        filters : dict, optional
+            Only request matching machines, see `get_machine_status()`.
+        page_size : int, optional
+            Request the listing in pages of (at most) this many machines (sorted
+            by `DNSName`), bounding the work and the response size per request.
+            By default the entire listing is requested at once.
+
+        Yields
+        ------
+        dict
+            The machine records, see `get_machine_status()` for details.
+        """
+        log.debug("Streaming current status of machines...")
+        fields = validate_fields(fields, MachineProperty)
+        filters = validate_filters(filters, MachineFilter)
+        params = {"fields": fields, **filters}
+        yield from self._iter_listing("GetMachineStatus", params, page_size)
+
+    def iter_sessions(
+        self,
+        fields: Iterable[str] | None = None,
+        filters: dict | None = None,
+        page_size: int | None = None,
+    ) -> Iterator[dict]:
+        """Stream the session records of a `GetSessions` request.
+
+        See `iter_machines()` for details.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, see `get_sessions()`.
+            When using `page_size`, `Uid` will always be included.
+        filters : dict, optional
+            Only request matching sessions, see `get_sessions()`.
+        page_size : int, optional
+            Request the listing in pages of (at most) this many sessions (sorted
+            by `Uid`), by default the entire listing is requested at once.
+
+        Yields
+        ------
+        dict
+            The session records, see `get_sessions()` for details.
+        """
+        log.debug("Streaming current sessions...")
+        fields = validate_fields(fields, SessionProperty)
+        filters = validate_filters(filters, SessionFilter)
+        params = {"fields": fields, **filters}
+        yield from self._iter_listing("GetSessions", params, page_size)
+
+    def get_machine_table(self) -> MachineTable:
+        """Get the current machine status as an indexed `MachineTable`.
+
+        Returns
+        -------
+        psytricks.tables.MachineTable
+            The records returned by `get_machine_status()`.
+        """
+        return MachineTable(self.get_machine_status())
+
+    def get_session_table(self) -> SessionTable:
+        """Get the current sessions as an indexed `SessionTable`.
+
+        Returns
+        -------
+        psytricks.tables.SessionTable
+            The records returned by `get_sessions()`.
+        """
+        return SessionTable(self.get_sessions())
+
+    def get_snapshot(self) -> Snapshot:
+        """Get the current machines and sessions as a joined `Snapshot`.
+
+        Returns
+        -------
+        psytricks.tables.Snapshot
+        """
+        return Snapshot(self.get_machine_table(), self.get_session_table())
 
     def disconnect_session(self, machine: str) -> dict:
         """Send a `POST` request with `DisconnectSession`.
@@ -516,7 +1154,7 @@ class ResTricksWrapper:
                 - `UPN`
         """
         log.debug(f"Requesting users having access to group [{group}]...")
-        return self.send_get_request(f"GetAccessUsers/{group}")["Data"]
+        return self._get_data(f"GetAccessUsers/{group}")
 
     def set_access_users(self, group: str, users: str, disable: bool) -> list:
         """Send a `POST` request with `SetAccessUsers`.
@@ -668,7 +1306,7 @@ class ResTricksWrapper:
         return self.send_post_request("MachinePowerAction", payload)["Data"]
 
 
-class PSyTricksWrapper:
+class PSyTricksWrapper(BulkActionsMixin, WatchMixin):
     """Wrapper handling PowerShell calls and processing of returned data.
 
     Parameters
@@ -676,23 +1314,51 @@ class PSyTricksWrapper:
     deliverycontroller : str
         The address (IP or FQDN) of the Citrix Delivery Controller to
         connect to.
+    persistent : bool, optional
+        If set to `True`, commands will be processed by a long-running
+        PowerShell process (see `psytricks.worker.PowerShellWorker`) instead of
+        starting a new one for each call, saving the startup time and loading
+        the snap-in only once. The process is started right away, use `close()`
+        (or the wrapper as a context manager) to shut it down again.
+    timeout : float, optional
+        The time in seconds to wait for a command to complete, by default
+        `None` (meaning no timeout). In case it is exceeded, the PowerShell
+        process will be terminated and a `TimeoutError` is raised.
+    workers : int, optional
+        The number of persistent PowerShell processes to use, by default 1. A
+        value larger than 1 implies `persistent` and sets up a
+        `psytricks.worker.PowerShellWorkerPool`, allowing that many commands to
+        run concurrently (e.g. through the bulk methods, which will use the same
+        number of threads by default).
 
     Attributes
     ----------
     pswrapper : pathlib.Path
         The path to the PowerShell wrapper script (class variable!).
+    switches : tuple(str)
+        The parameters of the wrapper script that are switches (class
+        variable!).
     ps_exe : pathlib.Path
         Path to the PowerShell executable itself (i.e. the *interpreter*).
     add_flags : list(str)
         A list of additional flags to add to the call of the wrapper script.
     deliverycontroller : str
         The address of the Delivery Controller.
+    worker : psytricks.worker.PowerShellWorker or PowerShellWorkerPool or None
+        The persistent PowerShell process(es), only if `persistent` is set or
+        `workers` is larger than 1.
+    metrics : psytricks.metrics.ClientMetrics
+        The latency histograms, payload sizes and error counters of the
+        commands run by this wrapper (the startup of persistent processes is
+        recorded as the `connect` phase of the `worker` command).
 
     Raises
     ------
     RuntimeError
         Raised in case the PowerShell call was producing output on `stderr`
         (indicating something went wrong) or returned with a non-zero exit code.
+    TimeoutError
+        Raised in case a call didn't complete within `timeout`.
     ValueError
         Raised in case decoding the string produced by the PowerShell call on
         `stdout` could not be decoded using "cp850" (indicating it contains
@@ -701,8 +1367,15 @@ class PSyTricksWrapper:
     """
 
     pswrapper = Path(dirname(__file__)) / "__ps1__" / "psytricks-wrapper.ps1"
-
-    def __init__(self, deliverycontroller: str):
+    switches = ("Disable",)
+
+    def __init__(
+        self,
+        deliverycontroller: str,
+        persistent: bool = False,
+        timeout: float | None = None,
+        workers: int = 1,
+    ):
         # FIXME: this platform-specific conditional below is a hack while
         # implementing the package, remove for production!
         self.add_flags = []
@@ -719,9 +1392,143 @@ class PSyTricksWrapper:
             )
 
         self.deliverycontroller = deliverycontroller
+        self.timeout = timeout
+        self.worker: PowerShellWorker | PowerShellWorkerPool | None = None
+        self.metrics = ClientMetrics()
         log.debug(f"Using PowerShell script [{self.pswrapper}].")
         log.debug(f"Using Delivery Controller [{self.deliverycontroller}].")
 
+        if workers > 1:
+            self.worker = PowerShellWorkerPool(
+                ps_exe=self.ps_exe,
+                deliverycontroller=self.deliverycontroller,
+                add_flags=self.add_flags,
+                size=workers,
+                timeout=self.timeout,
+            )
+            self.bulk_workers = workers
+        elif persistent:
+            self.worker = PowerShellWorker(
+                ps_exe=self.ps_exe,
+                deliverycontroller=self.deliverycontroller,
+                add_flags=self.add_flags,
+                timeout=self.timeout,
+            )
+
+        if self.worker is not None:
+            with self.metrics.timed("worker", "connect"):
+                self.worker.start()
+
+    def __enter__(self):
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, *exc):
+        """Leave the context manager, shutting down the persistent process."""
+        self.close()
+
+    def close(self) -> None:
+        """Shut down the persistent PowerShell process(es), if any."""
+        if self.worker is not None:
+            self.worker.stop()
+
+    @classmethod
+    def _params_to_dict(cls, extra_params: list | None) -> dict:
+        """Convert command line style parameters into a dict.
+
+        E.g. `["-DNSName", "vm1", "-Disable"]` will be converted into
+        `{"DNSName": "vm1", "Disable": True}`.
+        """
+        params = {}
+        tokens = iter(extra_params if extra_params else [])
+        for token in tokens:
+            name = token.lstrip("-")
+            params[name] = True if name in cls.switches else next(tokens)
+        return params
+
+    @staticmethod
+    def _selection_params(fields: list[str], filters: dict[str, str]) -> list:
+        """Assemble the `-Fields` and `-Filters` parameters (already validated).
+
+        The filters are passed as a single string, e.g. `DNSName=vm0*;PowerState=On`.
+        """
+        params = ["-Fields", ",".join(fields)] if fields else []
+        if filters:
+            for value in filters.values():
+                if ";" in value:
+                    raise ValueError(f"Filter values must not contain ';': {value}")
+            params += ["-Filters", ";".join(f"{k}={v}" for k, v in filters.items())]
+        return params
+
+    def _build_command(self, request: RequestName, extra_params: list | None) -> list:
+        """Assemble the command line for calling the PowerShell wrapper script."""
+        command = [
+            self.ps_exe,
+            "-NonInteractive",
+            "-NoProfile",
+            "-File",
+            self.pswrapper,
+            "-AdminAddress",
+            self.deliverycontroller,
+            "-CommandName",
+            request,
+        ]
+        return command + self.add_flags + (extra_params if extra_params else [])
+
+    def _check_status(self, status: dict, request: RequestName) -> None:
+        """Raise a `RuntimeError` if the execution status indicates a problem."""
+        exec_status = int(status["ExecutionStatus"])
+        if exec_status > 0:
+            self.metrics.count_error(request, "request", "ExecutionStatus")
+            msg = (
+                f"JSON returned by the PS1 wrapper contains execution status "
+                f"{exec_status} for command [{request}]:\n--------\n"
+                f"{status['ErrorMessage']}\n--------\n"
+                "This indicates something went wrong talking to the Citrix toolstack."
+            )
+            log.error(msg)
+            raise RuntimeError(msg)
+
+    def _run_subprocess(self, request: RequestName, extra_params: list | None) -> dict:
+        """Run the wrapper script in a new PowerShell process, parse its output."""
+        try:
+            command = self._build_command(request, extra_params)
+            log.debug(f"Command for subprocess call: {command}")
+            with self.metrics.timed(request, "request"):
+                completed = subprocess.run(
+                    command,
+                    capture_output=True,
+                    check=True,
+                    timeout=self.timeout,
+                )
+            if completed.stderr:
+                raise RuntimeError(
+                    "Wrapper returned data on STDERR, this is not expected:"
+                    f"\n============\n{completed.stderr}\n============\n"
+                )
+        except subprocess.CalledProcessError as ex:
+            raise RuntimeError(
+                f"Call returned a non-zero state: {ex.returncode} {ex.stderr}"
+            ) from ex
+        except subprocess.TimeoutExpired as ex:
+            raise TimeoutError(
+                f"Call [{request}] didn't complete within {self.timeout}s!"
+            ) from ex
+
+        stdout = "PRE-DECODING-DUMMY-VALUE"
+        self.metrics.observe_size(request, len(completed.stdout))
+        try:
+            with self.metrics.timed(request, "transfer"):
+                stdout = completed.stdout.decode(encoding="cp850")
+            with self.metrics.timed(request, "decode"):
+                parsed = json.loads(stdout)
+            with self.metrics.timed(request, "mapping"):
+                parsed = convert_powershell_objects(parsed)
+        except Exception as ex:
+            raise ValueError(f"Error decoding / parsing output:\n{stdout}") from ex
+
+        return parsed
+
     def run_ps1_script(
         self, request: RequestName, extra_params: (list | None) = None
     ) -> list[dict] | dict | None:
@@ -754,79 +1561,153 @@ class PSyTricksWrapper:
             Raised in case parsing the JSON returned by the PS1 wrapper failed
             or it doesn't conform to the expected format (e.g. missing the
             `Data` or `Status` items).
+        TimeoutError
+            Raised in case the call didn't complete within `timeout`.
         """
-        if extra_params is None:
-            extra_params = []
-
-        try:
-            tstart = time.time()
-            command = [
-                self.ps_exe,
-                "-NonInteractive",
-                "-NoProfile",
-                "-File",
-                self.pswrapper,
-                "-AdminAddress",
-                self.deliverycontroller,
-                "-CommandName",
-                request,
-            ]
-            command = command + self.add_flags + extra_params
-            log.debug(f"Command for subprocess call: {command}")
-            completed = subprocess.run(
-                command,
-                capture_output=True,
-                check=True,
-            )
-            elapsed = time.time() - tstart
-            log.debug(f"[PROFILING] PowerShell call: {elapsed:.3}s.")
-            if completed.stderr:
-                raise RuntimeError(
-                    "Wrapper returned data on STDERR, this is not expected:"
-                    f"\n============\n{completed.stderr}\n============\n"
-                )
-        except subprocess.CalledProcessError as ex:
-            raise RuntimeError(
-                f"Call returned a non-zero state: {ex.returncode} {ex.stderr}"
-            ) from ex
-
-        stdout = "PRE-DECODING-DUMMY-VALUE"
-        try:
-            tstart = time.time()
-            stdout = completed.stdout.decode(encoding="cp850")
-            elapsed = time.time() - tstart
-            log.debug(f"[PROFILING] Decoding stdout: {elapsed:.5}s.")
-
-            tstart = time.time()
-            parsed = json.loads(stdout, object_hook=parse_powershell_json)
-            elapsed = time.time() - tstart
-            log.debug(f"[PROFILING] Parsing JSON: {elapsed:.5}s.")
-        except Exception as ex:
-            raise ValueError(f"Error decoding / parsing output:\n{stdout}") from ex
+        if self.worker is not None:
+            with self.metrics.timed(request, "request"):
+                parsed = self.worker.call(request, self._params_to_dict(extra_params))
+        else:
+            parsed = self._run_subprocess(request, extra_params)
 
         if "Status" not in parsed or "Data" not in parsed:
             raise ValueError(f"Received malformed JSON from PS1 script: {parsed}")
 
         data = parsed["Data"]
-        status = parsed["Status"]
-
-        exec_status = int(status["ExecutionStatus"])
-        if exec_status > 0:
-            msg = (
-                f"JSON returned by the PS1 wrapper contains execution status "
-                f"{exec_status} for command [{request}]:\n--------\n"
-                f"{status['ErrorMessage']}\n--------\n"
-                "This indicates something went wrong talking to the Citrix toolstack."
-            )
-            log.error(msg)
-            raise RuntimeError(msg)
+        self._check_status(parsed["Status"], request)
 
         log.debug(f"Parsed 'Data' section contains {len(data)} items.")
         return data
 
-    def get_machine_status(self) -> list:
+    def iter_ps1_script(
+        self, request: RequestName, extra_params: (list | None) = None
+    ) -> Iterator[dict]:
+        """Call the PowerShell wrapper and stream the records of its output.
+
+        The output of the PowerShell process is decoded while it is being read,
+        each item of its "Data" section is handed out as soon as it is complete.
+        In `persistent` mode the worker process only hands out complete
+        responses, so the items are yielded from the fully parsed response.
+
+        The PowerShell process is killed if it didn't complete within `timeout`
+        (including the time spent by the caller processing the items) or if
+        the caller stops iterating early.
+
+        Parameters
+        ----------
+        request : str
+            The request name, one of `psytricks.literals.RequestName`.
+        extra_params : list(str)
+            A list of strings that should be added as extra parameters to the
+            PowerShell command that is run as a subprocess.
+
+        Yields
+        ------
+        dict
+            The items of the "Data" section of the JSON returned by the PS1
+            wrapper script.
+
+        Raises
+        ------
+        RuntimeError
+            Raised in case the PS1 wrapper script pushed anything to STDERR,
+            returned a non-zero exit code or a non-zero execution status.
+        ValueError
+            Raised in case parsing the JSON returned by the PS1 wrapper failed.
+        TimeoutError
+            Raised in case the call didn't complete within `timeout`.
+        """
+        if self.worker is not None:
+            data = self.run_ps1_script(request, extra_params)
+            if isinstance(data, list):
+                yield from data
+            elif data is not None and data != "":
+                yield data
+            return
+
+        command = self._build_command(request, extra_params)
+        log.debug(f"Command for streaming subprocess call: {command}")
+        parser = EnvelopeParser()
+        expired = threading.Event()
+
+        def kill_expired() -> None:
+            if proc.poll() is None:
+                expired.set()
+                proc.kill()
+
+        with subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        ) as proc:
+            # drain STDERR in a thread, otherwise the process may block writing
+            # to it while we're waiting for its STDOUT to be closed:
+            errors: list[bytes] = []
+            reader = threading.Thread(
+                target=lambda: errors.append(proc.stderr.read()), daemon=True
+            )
+            reader.start()
+            timer = None
+            if self.timeout is not None:
+                timer = threading.Timer(self.timeout, kill_expired)
+                timer.daemon = True
+                timer.start()
+            try:
+                chunks = iter(lambda: proc.stdout.read(65536), b"")
+                try:
+                    for text in decode_chunks(chunks, encoding="cp850"):
+                        yield from parser.feed(text)
+                    yield from parser.close()
+                except json.JSONDecodeError as ex:
+                    if not expired.is_set():
+                        raise ValueError(
+                            f"Error parsing output of [{request}]: {ex}"
+                        ) from ex
+                proc.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                # no-op if it has completed, otherwise e.g. the caller has
+                # stopped iterating (GeneratorExit) or parsing failed:
+                proc.kill()
+                reader.join()
+            stderr = b"".join(errors).decode("cp850", errors="replace")
+
+        if expired.is_set():
+            raise TimeoutError(
+                f"Call [{request}] didn't complete within {self.timeout}s!"
+            )
+        if proc.returncode != 0:
+            raise RuntimeError(
+                f"Call returned a non-zero state: {proc.returncode} {stderr}"
+            )
+        if stderr:
+            raise RuntimeError(
+                "Wrapper returned data on STDERR, this is not expected:"
+                f"\n============\n{stderr}\n============\n"
+            )
+        if "Status" not in parser.envelope:
+            raise ValueError(f"Received malformed JSON from PS1 script: {request}")
+        self._check_status(parser.envelope["Status"], request)
+        log.debug(f"Streamed {parser.count} items from [{request}].")
+
+    def get_machine_status(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> list:
         """Call the wrapper with command `GetMachineStatus`.
 
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties (see
+            `psytricks.literals.MachineProperty`), by default all properties
+            are requested. Note that `get_machine_table()` and `watch()` rely
+            on `DNSName` being present.
+        filters : dict, optional
+            Only request machines matching all of these filters, which are
+            evaluated by `Get-BrokerMachine` on the Delivery Controller. Valid
+            names are defined in `psytricks.literals.MachineFilter` (`UserName`
+            matching `SessionUserName`), values may contain wildcards (`*`),
+            e.g. `{"DesktopGroupName": "Group 1", "DNSName": "vm0*"}`.
+
         Returns
         -------
         list(dict)
@@ -847,11 +1728,32 @@ class PSyTricksWrapper:
                 - `SessionUserName`
                 - `SummaryState`
         """
-        return self.run_ps1_script(request="GetMachineStatus")
+        fields = validate_fields(fields, MachineProperty)
+        filters = validate_filters(filters, MachineFilter)
+        return self.run_ps1_script(
+            request="GetMachineStatus",
+            extra_params=self._selection_params(fields, filters),
+        )
 
-    def get_sessions(self) -> list:
+    def get_sessions(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> list:
         """Call the wrapper with command `GetSessions`.
 
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties (see
+            `psytricks.literals.SessionProperty`), by default all properties
+            are requested. Note that `get_session_table()` and `watch()` rely
+            on `Uid` and `DNSName` being present.
+        filters : dict, optional
+            Only request sessions matching all of these filters, which are
+            evaluated by `Get-BrokerSession` on the Delivery Controller. Valid
+            names are defined in `psytricks.literals.SessionFilter`
+            (`SummaryState` matching `MachineSummaryState`), values may contain
+            wildcards (`*`), e.g. `{"UserName": "*jdoe"}`.
+
         Returns
         -------
         list(dict)
@@ -874,7 +1776,93 @@ class PSyTricksWrapper:
                 - `UserName`
                 - `UserUPN`
         """
-        return self.run_ps1_script(request="GetSessions")
+        fields = validate_fields(fields, SessionProperty)
+        filters = validate_filters(filters, SessionFilter)
+        return self.run_ps1_script(
+            request="GetSessions", extra_params=self._selection_params(fields, filters)
+        )
+
+    def iter_machines(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> Iterator[dict]:
+        """Stream the records of the wrapper command `GetMachineStatus`.
+
+        Other than `get_machine_status()`, the output of the PowerShell process
+        is decoded while it is being read and each record is handed out as soon
+        as it is complete.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, see `get_machine_status()`.
+        filters : dict, optional
+            Only request matching machines, see `get_machine_status()`.
+
+        Yields
+        ------
+        dict
+            The machine records, see `get_machine_status()` for details.
+        """
+        fields = validate_fields(fields, MachineProperty)
+        filters = validate_filters(filters, MachineFilter)
+        yield from self.iter_ps1_script(
+            request="GetMachineStatus",
+            extra_params=self._selection_params(fields, filters),
+        )
+
+    def iter_sessions(
+        self, fields: Iterable[str] | None = None, filters: dict | None = None
+    ) -> Iterator[dict]:
+        """Stream the records of the wrapper command `GetSessions`.
+
+        See `iter_machines()` for details.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            Restrict the records to these properties, see `get_sessions()`.
+        filters : dict, optional
+            Only request matching sessions, see `get_sessions()`.
+
+        Yields
+        ------
+        dict
+            The session records, see `get_sessions()` for details.
+        """
+        fields = validate_fields(fields, SessionProperty)
+        filters = validate_filters(filters, SessionFilter)
+        yield from self.iter_ps1_script(
+            request="GetSessions", extra_params=self._selection_params(fields, filters)
+        )
+
+    def get_machine_table(self) -> MachineTable:
+        """Get the current machine status as an indexed `MachineTable`.
+
+        Returns
+        -------
+        psytricks.tables.MachineTable
+            The records returned by `get_machine_status()`.
+        """
+        return MachineTable(self.get_machine_status())
+
+    def get_session_table(self) -> SessionTable:
+        """Get the current sessions as an indexed `SessionTable`.
+
+        Returns
+        -------
+        psytricks.tables.SessionTable
+            The records returned by `get_sessions()`.
+        """
+        return SessionTable(self.get_sessions())
+
+    def get_snapshot(self) -> Snapshot:
+        """Get the current machines and sessions as a joined `Snapshot`.
+
+        Returns
+        -------
+        psytricks.tables.Snapshot
+        """
+        return Snapshot(self.get_machine_table(), self.get_session_table())
 
     def disconnect_session(self, machine: str) -> dict:
         """Call the wrapper with command `DisconnectSession`.